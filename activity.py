@@ -0,0 +1,74 @@
+"""Buffered tracking of users.last_activity.
+
+Requests only record the latest timestamp per user in memory; a scheduler
+job writes the buffer out with one executemany every ACTIVITY_FLUSH_SECONDS,
+or sooner once ACTIVITY_FLUSH_USERS distinct users are pending. A crash
+loses at most one flush interval of timestamps; a clean shutdown flushes.
+"""
+import threading
+from datetime import datetime
+
+
+class ActivityBuffer:
+    """Latest activity timestamp per user, pending a batched write"""
+
+    def __init__(self, max_users=500):
+        self.max_users = max_users
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.touches = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    def touch(self, user_id, when=None):
+        """Record activity; returns True once the buffer should be flushed"""
+        when = when or datetime.now().isoformat()
+        with self._lock:
+            self.touches += 1
+            if when > self._pending.get(user_id, ''):
+                self._pending[user_id] = when
+            return len(self._pending) >= self.max_users
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending):
+        """Put back entries from a failed flush, keeping the newer timestamp"""
+        with self._lock:
+            for user_id, when in pending.items():
+                if when > self._pending.get(user_id, ''):
+                    self._pending[user_id] = when
+
+    def flush(self, conn):
+        """Write all pending timestamps in one transaction; returns rows written"""
+        pending = self.drain()
+        if not pending:
+            return 0
+        try:
+            conn.executemany("UPDATE users SET last_activity=? WHERE id=?",
+                             [(when, user_id) for user_id, when in pending.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self.restore(pending)
+            with self._lock:
+                self.failures += 1
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(pending)
+        return len(pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'max_users': self.max_users,
+                'touches': self.touches,
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'failures': self.failures,
+            }
@@ -1,1567 +1,2546 @@
-from flask import Flask, render_template, request, redirect, session, jsonify, send_file
-import sqlite3
-from datetime import datetime, timedelta
-from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_mail import Mail, Message
-from apscheduler.schedulers.background import BackgroundScheduler
-import secrets
-import string
-import re
-import json
-import os
-import shutil
-from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
-from PIL import Image
-import hashlib
-
-load_dotenv()
-
-app = Flask(__name__)
-app.secret_key = "secretkey123"
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
-
-# File Upload Configuration
-UPLOAD_FOLDER = 'static/receipts'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-
-# Email Configuration (Set environment variables or use defaults)
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'localhost')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', True)
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', 'your-password')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@expensetracker.com')
-
-mail = Mail(app)
-
-# Initialize scheduler for background tasks
-scheduler = BackgroundScheduler()
-
-# Category detection keywords
-CATEGORY_KEYWORDS = {
-    'Food': ['grocery', 'restaurant', 'food', 'pizza', 'burger', 'cafe', 'lunch', 'dinner', 'breakfast', 'snack', 'bakery'],
-    'Transport': ['uber', 'taxi', 'bus', 'gas', 'petrol', 'fuel', 'train', 'metro', 'ticket', 'parking'],
-    'Bills': ['electricity', 'water', 'internet', 'phone', 'bill', 'rent', 'mortgage', 'insurance'],
-    'Shopping': ['mall', 'store', 'amazon', 'flipkart', 'clothes', 'shoe', 'shopping', 'buy', 'purchase'],
-    'Entertainment': ['movie', 'cinema', 'concert', 'music', 'game', 'netflix', 'play', 'show', 'ticket'],
-    'Health': ['doctor', 'hospital', 'pharmacy', 'medicine', 'health', 'clinic', 'dental', 'fitness', 'gym'],
-    'Education': ['school', 'college', 'university', 'course', 'tuition', 'book', 'education', 'class', 'coaching']
-}
-
-def detect_category(title):
-    """Auto-detect category based on title keywords"""
-    title_lower = title.lower()
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        if any(kw in title_lower for kw in keywords):
-            return category
-    return 'Other'
-
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def save_receipt(file, user_id, expense_id):
-    """Save receipt file and return filename"""
-    if not file or file.filename == '':
-        return None
-    
-    if not allowed_file(file.filename):
-        return None
-    
-    # Create user folder
-    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(user_id))
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
-    
-    # Generate unique filename
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"expense_{expense_id}_{datetime.now().timestamp()}.{ext}"
-    filepath = os.path.join(user_folder, filename)
-    
-    # Compress image if it's an image file
-    if ext in {'jpg', 'jpeg', 'png', 'gif'}:
-        img = Image.open(file)
-        img.thumbnail((1024, 1024))
-        img.save(filepath, quality=85)
-    else:
-        file.save(filepath)
-    
-    return os.path.join(str(user_id), filename)
-
-# ==================== FRAUD & DUPLICATE DETECTION ====================
-
-def detect_duplicate_expense(user_id, title, amount, category, date):
-    """Detect potential duplicate or fraud expense"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Check for exact duplicates (same title, amount, category within 1 hour)
-    one_hour_ago = (datetime.fromisoformat(datetime.now().isoformat()) - timedelta(hours=1)).isoformat()
-    c.execute("""
-        SELECT id, created_at FROM expenses 
-        WHERE user_id=? AND title=? AND amount=? AND category=? AND date=? AND created_at > ?
-        ORDER BY created_at DESC LIMIT 1
-    """, (user_id, title, amount, category, date, one_hour_ago))
-    
-    duplicate = c.fetchone()
-    conn.close()
-    
-    if duplicate:
-        return True, f"Duplicate detected: {title} for ₹{amount} was added {duplicate[1]}"
-    
-    return False, None
-
-def detect_fraud_anomaly(user_id, amount, category):
-    """Detect unusual spending patterns"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Get average spending in this category for this user
-    c.execute("""
-        SELECT AVG(amount), MAX(amount) FROM expenses 
-        WHERE user_id=? AND category=?
-    """, (user_id, category))
-    
-    result = c.fetchone()
-    conn.close()
-    
-    if result[0] is None:
-        return False, None
-    
-    avg_amount, max_amount = result
-    
-    # If amount is more than 300% of average, flag as potential fraud
-    if amount > (avg_amount * 3):
-        return True, f"Unusual spending: ₹{amount} is 3x higher than your average {category} expense (₹{avg_amount:.2f})"
-    
-    return False, None
-
-# ==================== DATABASE SETUP ====================
-
-def init_db():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            password TEXT,
-            email TEXT,
-            monthly_budget REAL,
-            last_activity TEXT,
-            send_daily_summary INTEGER DEFAULT 0,
-            send_weekly_summary INTEGER DEFAULT 1,
-            send_limit_alert INTEGER DEFAULT 1,
-            send_reminder INTEGER DEFAULT 1,
-            last_expense_date TEXT,
-            device_token TEXT,
-            is_admin INTEGER DEFAULT 0,
-            total_savings_goal REAL DEFAULT 0,
-            current_savings REAL DEFAULT 0
-        )
-    ''')
-    
-    # Expenses table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS expenses(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT,
-            amount REAL,
-            category TEXT,
-            date TEXT,
-            created_at TEXT,
-            receipt_file TEXT,
-            is_duplicate_flagged INTEGER DEFAULT 0,
-            duplicate_reason TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Password resets table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS password_resets(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            token TEXT UNIQUE,
-            expires_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Email logs table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS email_logs(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            email_type TEXT,
-            sent_at TEXT,
-            subject TEXT,
-            status TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Backup logs table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS backup_logs(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            backup_date TEXT,
-            backup_file TEXT,
-            backup_size TEXT,
-            status TEXT
-        )
-    ''')
-    
-    # Savings goals table (NEW)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS savings_goals(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            goal_name TEXT,
-            target_amount REAL,
-            current_amount REAL,
-            category TEXT,
-            deadline TEXT,
-            created_at TEXT,
-            status TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-    # Ensure columns exist (simple migration)
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    columns_to_add = [
-        ("email", "TEXT", "users"),
-        ("daily_limit", "REAL", "users"),
-        ("monthly_budget", "REAL", "users"),
-        ("last_activity", "TEXT", "users"),
-        ("send_daily_summary", "INTEGER DEFAULT 0", "users"),
-        ("send_weekly_summary", "INTEGER DEFAULT 1", "users"),
-        ("send_limit_alert", "INTEGER DEFAULT 1", "users"),
-        ("send_reminder", "INTEGER DEFAULT 1", "users"),
-        ("last_expense_date", "TEXT", "users"),
-        ("device_token", "TEXT", "users"),
-        ("is_admin", "INTEGER DEFAULT 0", "users"),
-        ("total_savings_goal", "REAL DEFAULT 0", "users"),
-        ("current_savings", "REAL DEFAULT 0", "users"),
-        ("created_at", "TEXT", "expenses"),
-        ("receipt_file", "TEXT", "expenses"),
-        ("is_duplicate_flagged", "INTEGER DEFAULT 0", "expenses"),
-        ("duplicate_reason", "TEXT", "expenses"),
-    ]
-    
-    for col_name, col_type, table_name in columns_to_add:
-        try:
-            c.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}")
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass
-    
-    conn.close()
-
-# ==================== EMAIL FUNCTIONS ====================
-
-def send_email(to_email, subject, html_body):
-    """Send email with error handling"""
-    try:
-        msg = Message(subject=subject, recipients=[to_email], html=html_body)
-        mail.send(msg)
-        return True, "Email sent successfully"
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False, str(e)
-
-def send_daily_summary(user_id, user_email, username):
-    """Send daily spending summary"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    today = datetime.now().strftime('%Y-%m-%d')
-    c.execute("""
-        SELECT SUM(amount), COUNT(*), GROUP_CONCAT(DISTINCT category)
-        FROM expenses WHERE user_id=? AND date=?
-    """, (user_id, today))
-    
-    result = c.fetchone()
-    total_today = result[0] or 0
-    count = result[1] or 0
-    categories = result[2] or "None"
-    conn.close()
-    
-    subject = f"📊 Your Daily Spending Summary - {today}"
-    
-    html_body = f"""
-    <h2>Daily Spending Summary</h2>
-    <p>Hi {username},</p>
-    <p><strong>Date:</strong> {today}</p>
-    <p><strong>Total Spent:</strong> ₹{total_today:.2f}</p>
-    <p><strong>Number of Expenses:</strong> {count}</p>
-    <p><strong>Categories:</strong> {categories}</p>
-    <p><a href="http://127.0.0.1:5000/dashboard">View Detailed Dashboard</a></p>
-    """
-    
-    success, msg = send_email(user_email, subject, html_body)
-    if success:
-        log_email(user_id, "daily_summary", subject, "sent")
-    return success
-
-def send_weekly_summary(user_id, user_email, username):
-    """Send weekly spending summary"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    c.execute("""
-        SELECT SUM(amount), COUNT(*), GROUP_CONCAT(DISTINCT category)
-        FROM expenses WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, week_ago, today))
-    
-    result = c.fetchone()
-    total_week = result[0] or 0
-    count = result[1] or 0
-    categories = result[2] or "None"
-    
-    c.execute("""
-        SELECT category, SUM(amount) as total
-        FROM expenses WHERE user_id=? AND date BETWEEN ? AND ?
-        GROUP BY category ORDER BY total DESC LIMIT 1
-    """, (user_id, week_ago, today))
-    
-    top_cat = c.fetchone()
-    top_category = f"{top_cat[0]} (₹{top_cat[1]:.2f})" if top_cat else "N/A"
-    
-    conn.close()
-    
-    subject = f"📈 Your Weekly Spending Summary ({week_ago} to {today})"
-    
-    html_body = f"""
-    <h2>Weekly Spending Summary</h2>
-    <p>Hi {username},</p>
-    <p><strong>Period:</strong> {week_ago} to {today}</p>
-    <p><strong>Total Spent:</strong> ₹{total_week:.2f}</p>
-    <p><strong>Number of Expenses:</strong> {count}</p>
-    <p><strong>Top Category:</strong> {top_category}</p>
-    <p><strong>Categories Used:</strong> {categories}</p>
-    <p><a href="http://127.0.0.1:5000/dashboard">View Detailed Dashboard</a></p>
-    """
-    
-    success, msg = send_email(user_email, subject, html_body)
-    if success:
-        log_email(user_id, "weekly_summary", subject, "sent")
-    return success
-
-def send_spend_limit_alert(user_id, email, current_total, budget):
-    """Send budget limit alert"""
-    pct = (current_total / budget * 100) if budget > 0 else 0
-    subject = f"⚠️ Budget Alert: You've spent {pct:.1f}% of your monthly budget!"
-    
-    html_body = f"""
-    <h2>Budget Alert</h2>
-    <p>Hi,</p>
-    <p>You've spent <strong>₹{current_total:.2f}</strong> out of your <strong>₹{budget:.2f}</strong> monthly budget.</p>
-    <p>That's <strong>{pct:.1f}%</strong> of your budget!</p>
-    <p><a href="http://127.0.0.1:5000/dashboard">Review your spending</a></p>
-    """
-    
-    send_email(email, subject, html_body)
-    log_email(user_id, "budget_alert", subject, "sent")
-
-
-def send_daily_limit_alert(user_id, email, today_total, daily_limit):
-    """Send email alert when daily limit is reached"""
-    subject = f"⚠️ Daily Limit Reached: You've spent ₹{today_total:.2f} today"
-    pct = (today_total / daily_limit * 100) if daily_limit and daily_limit > 0 else 0
-    html_body = f"""
-    <h2>Daily Limit Alert</h2>
-    <p>Hi,</p>
-    <p>You've spent <strong>₹{today_total:.2f}</strong> today.</p>
-    <p>Your daily limit is <strong>₹{daily_limit:.2f}</strong>. That's <strong>{pct:.1f}%</strong> of your limit.</p>
-    <p><a href=\"http://127.0.0.1:5000/dashboard\">View Dashboard</a></p>
-    """
-    send_email(email, subject, html_body)
-    log_email(user_id, "daily_limit_alert", subject, "sent")
-
-
-def send_push_notification(user_id, message):
-    """Placeholder push notification sender. Uses device_token if available.
-    This is a lightweight implementation: if a device token exists it logs a push event
-    and stores it in email_logs table as a record with type 'push_notification'.
-    """
-    try:
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute("SELECT device_token FROM users WHERE id=?", (user_id,))
-        row = c.fetchone()
-        device_token = row[0] if row else None
-        # In a real system you'd call a push provider here (FCM/APNs) using device_token
-        if device_token:
-            print(f"Push to {device_token}: {message}")
-            # Log as a notification (reusing email_logs for simplicity)
-            c.execute("INSERT INTO email_logs (user_id, email_type, sent_at, subject, status) VALUES (?, ?, ?, ?, ?)",
-                      (user_id, 'push_notification', datetime.now().isoformat(), message, 'sent'))
-            conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Push error: {e}")
-
-def send_expense_reminder(user_id, user_email, username, days_since):
-    """Send reminder to add expense"""
-    subject = f"💰 Reminder: No expenses recorded for {days_since} days"
-    
-    html_body = f"""
-    <h2>Expense Entry Reminder</h2>
-    <p>Hi {username},</p>
-    <p>We haven't seen any expense entries from you in the last <strong>{days_since} days</strong>.</p>
-    <p>Track your daily spending to better manage your finances!</p>
-    <p><a href="http://127.0.0.1:5000/add">Add an Expense</a> | <a href="http://127.0.0.1:5000/dashboard">View Dashboard</a></p>
-    """
-    
-    success, msg = send_email(user_email, subject, html_body)
-    if success:
-        log_email(user_id, "expense_reminder", subject, "sent")
-    return success
-
-def log_email(user_id, email_type, subject, status):
-    """Log email sending"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO email_logs (user_id, email_type, sent_at, subject, status)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, email_type, datetime.now().isoformat(), subject, status))
-    conn.commit()
-    conn.close()
-
-# ==================== BACKUP FUNCTIONS ====================
-
-def create_backup():
-    """Create database backup"""
-    try:
-        backup_dir = 'backups'
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(backup_dir, f'database_backup_{timestamp}.db')
-        
-        shutil.copy('database.db', backup_file)
-        
-        size = os.path.getsize(backup_file) / 1024  # KB
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO backup_logs (backup_date, backup_file, backup_size, status)
-            VALUES (?, ?, ?, ?)
-        """, (datetime.now().isoformat(), backup_file, f"{size:.2f} KB", "success"))
-        conn.commit()
-        conn.close()
-        
-        return True
-    except Exception as e:
-        print(f"Backup error: {str(e)}")
-        return False
-
-def cleanup_old_backups(days=30):
-    """Remove backups older than specified days"""
-    try:
-        backup_dir = 'backups'
-        if not os.path.exists(backup_dir):
-            return
-        
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        for file in os.listdir(backup_dir):
-            file_path = os.path.join(backup_dir, file)
-            if os.path.isfile(file_path):
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                if file_time < cutoff_date:
-                    os.remove(file_path)
-    except Exception as e:
-        print(f"Cleanup error: {str(e)}")
-
-# ==================== SCHEDULER FUNCTIONS ====================
-
-def check_and_send_summaries():
-    """Check and send daily/weekly summaries"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT id, username, email, send_daily_summary, send_weekly_summary FROM users WHERE email IS NOT NULL")
-    users = c.fetchall()
-    conn.close()
-    
-    for user in users:
-        user_id, username, email, send_daily, send_weekly = user
-        
-        if send_daily:
-            send_daily_summary(user_id, email, username)
-        
-        if send_weekly and datetime.now().weekday() == 6:  # Sunday
-            send_weekly_summary(user_id, email, username)
-
-def check_and_send_reminders():
-    """Check and send expense reminders"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT id, username, email, send_reminder, last_expense_date FROM users WHERE email IS NOT NULL AND send_reminder=1")
-    users = c.fetchall()
-    conn.close()
-    
-    for user in users:
-        user_id, username, email, send_reminder, last_expense_date = user
-        
-        if not last_expense_date:
-            continue
-        
-        last_date = datetime.fromisoformat(last_expense_date)
-        days_since = (datetime.now() - last_date).days
-        
-        if days_since >= 2:
-            send_expense_reminder(user_id, email, username, days_since)
-
-def check_budget_limits():
-    """Check and send budget alerts"""
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT id, email, monthly_budget FROM users WHERE email IS NOT NULL AND send_limit_alert=1 AND monthly_budget > 0")
-    users = c.fetchall()
-    conn.close()
-    
-    for user in users:
-        user_id, email, budget = user
-        
-        if not email:
-            continue
-        
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        
-        current_month = datetime.now().strftime('%Y-%m')
-        c.execute("""
-            SELECT SUM(amount) FROM expenses 
-            WHERE user_id=? AND date LIKE ?
-        """, (user_id, f"{current_month}%"))
-        
-        result = c.fetchone()
-        current_total = result[0] or 0
-        conn.close()
-        
-        pct = (current_total / budget * 100) if budget > 0 else 0
-        if pct >= 80:
-            send_spend_limit_alert(user_id, email, current_total, budget)
-
-def start_scheduler():
-    """Start background scheduler"""
-    if not scheduler.running:
-        scheduler.add_job(check_and_send_summaries, 'cron', hour=8, minute=0)
-        scheduler.add_job(check_and_send_reminders, 'interval', hours=6)
-        scheduler.add_job(check_budget_limits, 'interval', hours=1)
-        scheduler.add_job(create_backup, 'cron', hour=2, minute=0)
-        scheduler.add_job(cleanup_old_backups, 'cron', day_of_week=0, hour=3, minute=0)
-        scheduler.start()
-        print("Scheduler started!")
-
-# ==================== SESSION & MIDDLEWARE ====================
-
-@app.before_request
-def before_request():
-    """Track last activity and check session timeout"""
-    if 'user_id' in session:
-        session.permanent = True
-        last_activity = session.get('last_activity')
-        if last_activity:
-            last_time = datetime.fromisoformat(last_activity)
-            if datetime.now() - last_time > timedelta(minutes=30):
-                session.clear()
-                return redirect('/login')
-        session['last_activity'] = datetime.now().isoformat()
-    
-    if 'user_id' in session:
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute('UPDATE users SET last_activity=? WHERE id=?', (datetime.now().isoformat(), session['user_id']))
-        conn.commit()
-        conn.close()
-
-# ==================== ROUTES ====================
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        email = request.form.get('email', '')
-        hashed_password = generate_password_hash(password)
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        try:
-            c.execute("""
-                INSERT INTO users (username, password, email, send_weekly_summary, send_limit_alert, send_reminder, is_admin) 
-                VALUES (?, ?, ?, 1, 1, 1, 0)
-            """, (username, hashed_password, email))
-            conn.commit()
-            return redirect('/login')
-        except:
-            return "Username already exists!"
-        finally:
-            conn.close()
-    return render_template('register.html')
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute("SELECT id, password, username FROM users WHERE username=?", (username,))
-        user = c.fetchone()
-        conn.close()
-        
-        if user and check_password_hash(user[1], password):
-            session['user_id'] = user[0]
-            session['username'] = user[2]
-            session.permanent = True
-            session['last_activity'] = datetime.now().isoformat()
-            
-            # Check if admin
-            conn = sqlite3.connect('database.db')
-            c = conn.cursor()
-            c.execute("SELECT is_admin FROM users WHERE id=?", (user[0],))
-            is_admin = c.fetchone()[0]
-            conn.close()
-            
-            if is_admin:
-                return redirect('/admin/dashboard')
-            return redirect('/dashboard')
-        return "Invalid credentials!"
-    return render_template('login.html')
-
-@app.route('/logout')
-def logout():
-    session.clear()
-    return redirect('/')
-
-@app.route('/dashboard')
-def dashboard():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Current month expenses
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute("""
-        SELECT SUM(amount), COUNT(*), GROUP_CONCAT(category) FROM expenses 
-        WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0
-    """, (user_id, f"{current_month}%"))
-    result = c.fetchone()
-    total = result[0] or 0
-    count = result[1] or 0
-    categories = result[2] or ""
-    
-    # Get user budget
-    c.execute("SELECT monthly_budget FROM users WHERE id=?", (user_id,))
-    budget = c.fetchone()[0] or 0
-    
-    # Get all expenses this month
-    c.execute("""
-        SELECT id, title, amount, category, date, receipt_file, is_duplicate_flagged, duplicate_reason 
-        FROM expenses 
-        WHERE user_id=? AND date LIKE ? 
-        ORDER BY date DESC
-    """, (user_id, f"{current_month}%"))
-    expenses = c.fetchall()
-    
-    # Get flagged duplicates
-    c.execute("""
-        SELECT id, title, amount, duplicate_reason, date 
-        FROM expenses 
-        WHERE user_id=? AND is_duplicate_flagged=1 AND date LIKE ?
-        ORDER BY date DESC
-    """, (user_id, f"{current_month}%"))
-    flagged_expenses = c.fetchall()
-    
-    # Get savings goals
-    c.execute("""
-        SELECT id, goal_name, target_amount, current_amount, deadline, status 
-        FROM savings_goals 
-        WHERE user_id=? 
-        ORDER BY deadline ASC
-    """, (user_id,))
-    savings_goals = c.fetchall()
-    
-    # Pass filter/query params back to template so inputs stay in sync
-    req_range = request.args.get('range')
-    start_date_q = request.args.get('start_date')
-    end_date_q = request.args.get('end_date')
-    q = request.args.get('q')
-    category_q = request.args.get('category')
-
-    # Get today's total and daily limit for progress bar
-    try:
-        c.execute("SELECT daily_limit FROM users WHERE id=?", (user_id,))
-        row = c.fetchone()
-        daily_limit = row[0] if row else None
-    except Exception:
-        daily_limit = None
-
-    try:
-        today = datetime.now().date().isoformat()
-        c.execute("SELECT SUM(amount) FROM expenses WHERE user_id=? AND date=? AND is_duplicate_flagged=0", (user_id, today))
-        trow = c.fetchone()
-        today_total = trow[0] or 0
-    except Exception:
-        today_total = 0
-
-    conn.close()
-    # Pass any immediate warning (from add expense) to template
-    warning = request.args.get('warning', '')
-
-    return render_template('dashboard.html', 
-        expenses=expenses,
-        total=total,
-        count=count,
-        budget=budget,
-        monthly_budget=budget,
-        current_month_total=total,
-        remaining=budget - total,
-        flagged_expenses=flagged_expenses,
-        savings_goals=savings_goals,
-        warning=warning,
-        daily_limit=daily_limit,
-        today_total=today_total,
-        username=session.get('username', ''),
-        range=req_range,
-        start_date=start_date_q,
-        end_date=end_date_q,
-        q=q,
-        category=category_q
-    )
-
-@app.route('/add', methods=['GET', 'POST'])
-def add_expense():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    
-    if request.method == 'POST':
-        title = request.form['title']
-        amount = float(request.form['amount'])
-        category = request.form.get('category', detect_category(title))
-        date = request.form['date']
-        
-        # Check for duplicates
-        is_dup, dup_msg = detect_duplicate_expense(user_id, title, amount, category, date)
-        is_fraud, fraud_msg = detect_fraud_anomaly(user_id, amount, category)
-        
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        
-        # Check daily total BEFORE inserting so we can detect crossing
-        daily_limit = None
-        try:
-            c.execute("SELECT daily_limit, email FROM users WHERE id=?", (user_id,))
-            row = c.fetchone()
-            if row:
-                daily_limit = row[0]
-                user_email = row[1]
-            else:
-                user_email = None
-        except Exception:
-            daily_limit = None
-            user_email = None
-
-        today = datetime.now().date().isoformat()
-        try:
-            c.execute("SELECT SUM(amount) FROM expenses WHERE user_id=? AND date=? AND is_duplicate_flagged=0", (user_id, today))
-            pre = c.fetchone()
-            today_total_before = pre[0] or 0
-        except Exception:
-            today_total_before = 0
-
-        # Insert expense
-        c.execute("""
-            INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged, duplicate_reason)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, title, amount, category, date, datetime.now().isoformat(), 1 if (is_dup or is_fraud) else 0, 
-              dup_msg or fraud_msg or ""))
-        
-        conn.commit()
-        expense_id = c.lastrowid
-        
-        # Handle receipt upload
-        if 'receipt' in request.files:
-            file = request.files['receipt']
-            if file and file.filename != '' and allowed_file(file.filename):
-                receipt_file = save_receipt(file, user_id, expense_id)
-                if receipt_file:
-                    c.execute("UPDATE expenses SET receipt_file=? WHERE id=?", (receipt_file, expense_id))
-                    conn.commit()
-        
-        # Update last_expense_date
-        c.execute("UPDATE users SET last_expense_date=? WHERE id=?", (datetime.now().isoformat(), user_id))
-        conn.commit()
-        # Recalculate today's total after insert
-        try:
-            c.execute("SELECT SUM(amount) FROM expenses WHERE user_id=? AND date=? AND is_duplicate_flagged=0", (user_id, today))
-            post = c.fetchone()
-            today_total_after = post[0] or 0
-        except Exception:
-            today_total_after = today_total_before
-
-        conn.close()
-        
-        warning_msg = ""
-        if is_dup:
-            warning_msg = f"⚠️ Duplicate Alert: {dup_msg}"
-        elif is_fraud:
-            warning_msg = f"⚠️ Fraud Alert: {fraud_msg}"
-        else:
-            # Check daily limit (if user has set one) and send notifications only when crossing threshold
-            try:
-                if daily_limit and daily_limit > 0:
-                    # If before was below limit and after is >= limit, send notifications
-                    if today_total_before < daily_limit and today_total_after >= daily_limit:
-                        warning_msg = f"⚠️ Daily limit reached: You've spent ₹{today_total_after:.2f} today (limit: ₹{daily_limit:.2f})."
-                        # send email if user opted for alerts
-                        try:
-                            send_daily_limit_alert(user_id, user_email, today_total_after, daily_limit)
-                        except Exception as e:
-                            print(f"Error sending daily email alert: {e}")
-                        # send push notification if device token exists
-                        try:
-                            send_push_notification(user_id, f"Daily limit reached: ₹{today_total_after:.2f} spent today")
-                        except Exception as e:
-                            print(f"Error sending push notification: {e}")
-            except Exception:
-                pass
-        
-        return redirect(f'/dashboard?warning={warning_msg}' if warning_msg else '/dashboard')
-    
-    return render_template('add_expense.html')
-
-@app.route('/savings', methods=['GET', 'POST'])
-def savings_goals():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    if request.method == 'POST':
-        action = request.form.get('action')
-        
-        if action == 'create':
-            goal_name = request.form['goal_name']
-            target_amount = float(request.form['target_amount'])
-            category = request.form.get('category', 'All')
-            deadline = request.form['deadline']
-            
-            c.execute("""
-                INSERT INTO savings_goals (user_id, goal_name, target_amount, current_amount, category, deadline, created_at, status)
-                VALUES (?, ?, ?, 0, ?, ?, ?, 'active')
-            """, (user_id, goal_name, target_amount, category, deadline, datetime.now().isoformat()))
-            conn.commit()
-        
-        elif action == 'update':
-            goal_id = int(request.form['goal_id'])
-            amount_to_add = float(request.form['amount'])
-            
-            c.execute("SELECT current_amount, target_amount FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id))
-            goal = c.fetchone()
-            
-            if goal:
-                new_amount = goal[0] + amount_to_add
-                status = 'completed' if new_amount >= goal[1] else 'active'
-                c.execute("UPDATE savings_goals SET current_amount=?, status=? WHERE id=?", (new_amount, status, goal_id))
-                conn.commit()
-        
-        elif action == 'delete':
-            goal_id = int(request.form['goal_id'])
-            c.execute("DELETE FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id))
-            conn.commit()
-    
-    c.execute("""
-        SELECT id, goal_name, target_amount, current_amount, deadline, status, category
-        FROM savings_goals 
-        WHERE user_id=? 
-        ORDER BY deadline ASC
-    """, (user_id,))
-    goals = c.fetchall()
-    conn.close()
-    
-    return render_template('savings_goals.html', goals=goals)
-
-@app.route('/calendar')
-def calendar():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Get all expenses
-    c.execute("""
-        SELECT date, SUM(amount) as total, COUNT(*) as count
-        FROM expenses 
-        WHERE user_id=? AND is_duplicate_flagged=0
-        GROUP BY date
-        ORDER BY date DESC
-    """, (user_id,))
-    
-    expenses_by_date = {}
-    for row in c.fetchall():
-        expenses_by_date[row[0]] = {'amount': row[1], 'count': row[2]}
-    
-    conn.close()
-    
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-    
-    return render_template('calendar.html', 
-        expenses_by_date=json.dumps(expenses_by_date),
-        current_year=current_year,
-        current_month=current_month
-    )
-
-# ==================== ADMIN ROUTES ====================
-
-@app.route('/admin/dashboard')
-def admin_dashboard():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # Check if user is admin
-    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
-    is_admin = c.fetchone()
-    
-    if not is_admin or is_admin[0] != 1:
-        conn.close()
-        return redirect('/dashboard')
-    
-    # Get total users
-    c.execute("SELECT COUNT(*) FROM users WHERE is_admin=0")
-    total_users = c.fetchone()[0]
-    
-    # Get total expenses
-    c.execute("SELECT COUNT(*) FROM expenses")
-    total_expenses = c.fetchone()[0]
-    
-    # Get total amount spent
-    c.execute("SELECT SUM(amount) FROM expenses WHERE is_duplicate_flagged=0")
-    total_amount = c.fetchone()[0] or 0
-    
-    # Top 5 highest spending users
-    c.execute("""
-        SELECT u.id, u.username, u.email, SUM(e.amount) as total_spent
-        FROM users u
-        LEFT JOIN expenses e ON u.id = e.user_id AND e.is_duplicate_flagged=0
-        WHERE u.is_admin=0
-        GROUP BY u.id
-        ORDER BY total_spent DESC
-        LIMIT 5
-    """)
-    top_users = c.fetchall()
-    
-    # Category breakdown
-    c.execute("""
-        SELECT category, SUM(amount) as total, COUNT(*) as count
-        FROM expenses
-        WHERE is_duplicate_flagged=0
-        GROUP BY category
-        ORDER BY total DESC
-    """)
-    category_breakdown = c.fetchall()
-    
-    # Flagged expenses (duplicates/fraud)
-    c.execute("""
-        SELECT e.id, u.username, e.title, e.amount, e.duplicate_reason, e.date
-        FROM expenses e
-        JOIN users u ON e.user_id = u.id
-        WHERE e.is_duplicate_flagged=1
-        ORDER BY e.date DESC
-        LIMIT 20
-    """)
-    flagged_expenses = c.fetchall()
-    
-    # User spending trends (last 30 days)
-    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    c.execute("""
-        SELECT u.username, SUM(e.amount) as total_30days
-        FROM users u
-        LEFT JOIN expenses e ON u.id = e.user_id AND e.date >= ? AND e.is_duplicate_flagged=0
-        WHERE u.is_admin=0
-        GROUP BY u.id
-        ORDER BY total_30days DESC
-        LIMIT 10
-    """, (thirty_days_ago,))
-    user_trends = c.fetchall()
-    
-    conn.close()
-    
-    return render_template('admin_dashboard.html',
-        total_users=total_users,
-        total_expenses=total_expenses,
-        total_amount=total_amount,
-        top_users=top_users,
-        category_breakdown=category_breakdown,
-        flagged_expenses=flagged_expenses,
-        user_trends=user_trends
-    )
-
-@app.route('/admin/users')
-def admin_users():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
-    is_admin = c.fetchone()
-    
-    if not is_admin or is_admin[0] != 1:
-        conn.close()
-        return redirect('/dashboard')
-    
-    # Get all users with spending info
-    c.execute("""
-        SELECT u.id, u.username, u.email, u.monthly_budget, COUNT(e.id) as expense_count, SUM(e.amount) as total_spent
-        FROM users u
-        LEFT JOIN expenses e ON u.id = e.user_id AND e.is_duplicate_flagged=0
-        WHERE u.is_admin=0
-        GROUP BY u.id
-        ORDER BY total_spent DESC
-    """)
-    users = c.fetchall()
-    conn.close()
-    
-    return render_template('admin_users.html', users=users)
-
-@app.route('/settings', methods=['GET', 'POST'])
-def settings():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    
-    if request.method == 'POST':
-        send_daily = 1 if request.form.get('send_daily_summary') else 0
-        send_weekly = 1 if request.form.get('send_weekly_summary') else 0
-        send_alert = 1 if request.form.get('send_limit_alert') else 0
-        send_reminder = 1 if request.form.get('send_reminder') else 0
-        # accept daily limit (optional)
-        daily_limit_val = request.form.get('daily_limit')
-        try:
-            daily_limit = float(daily_limit_val) if daily_limit_val else None
-        except ValueError:
-            daily_limit = None
-        
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute("""
-            UPDATE users 
-            SET send_daily_summary=?, send_weekly_summary=?, send_limit_alert=?, send_reminder=?, daily_limit=?
-            WHERE id=?
-        """, (send_daily, send_weekly, send_alert, send_reminder, daily_limit, user_id))
-        conn.commit()
-        conn.close()
-        
-        return redirect('/dashboard')
-    
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("""
-        SELECT send_daily_summary, send_weekly_summary, send_limit_alert, send_reminder, email, daily_limit
-        FROM users WHERE id=?
-    """, (user_id,))
-    
-    user_prefs = c.fetchone()
-    conn.close()
-    
-    return render_template('settings.html', 
-        send_daily=user_prefs[0] if user_prefs else 0,
-        send_weekly=user_prefs[1] if user_prefs else 1,
-        send_alert=user_prefs[2] if user_prefs else 1,
-        send_reminder=user_prefs[3] if user_prefs else 1,
-        email=user_prefs[4] if user_prefs else '',
-        daily_limit=user_prefs[5] if user_prefs and user_prefs[5] is not None else ''
-    )
-
-@app.route('/export-pdf')
-def export_pdf():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute("""
-        SELECT title, amount, category, date FROM expenses 
-        WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0
-        ORDER BY date DESC
-    """, (user_id, f"{current_month}%"))
-    
-    expenses = c.fetchall()
-    c.execute("SELECT SUM(amount), COUNT(*) FROM expenses WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0", (user_id, f"{current_month}%"))
-    total, count = c.fetchone()
-    total = total or 0
-    
-    c.execute("SELECT monthly_budget FROM users WHERE id=?", (user_id,))
-    budget = c.fetchone()[0] or 0
-    
-    conn.close()
-    
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#7c3aed'),
-        spaceAfter=30,
-        alignment=1
-    )
-    elements.append(Paragraph("Monthly Expense Report", title_style))
-    elements.append(Paragraph(f"<b>Month:</b> {current_month}", styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    elements.append(Paragraph("<b>Summary</b>", styles['Heading2']))
-    summary_data = [
-        ['Metric', 'Value'],
-        ['Total Expenses', f'₹{total:.2f}'],
-        ['Number of Entries', str(count)],
-        ['Monthly Budget', f'₹{budget:.2f}'],
-        ['Remaining', f'₹{budget - total:.2f}']
-    ]
-    summary_table = Table(summary_data, colWidths=[3*inch, 3*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 20))
-    
-    elements.append(Paragraph("<b>Detailed Expenses</b>", styles['Heading2']))
-    expense_data = [['Title', 'Category', 'Amount', 'Date']]
-    for exp in expenses:
-        expense_data.append([exp[0], exp[2], f'₹{exp[1]:.2f}', exp[3]])
-    
-    expense_table = Table(expense_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-    expense_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(expense_table)
-    
-    doc.build(elements)
-    pdf_buffer.seek(0)
-    
-    return send_file(pdf_buffer, mimetype='application/pdf', as_attachment=True, download_name='expense_report.pdf')
-
-@app.route('/api/latest-expense')
-def latest_expense():
-    if 'user_id' not in session:
-        return jsonify({"error": "Not logged in"}), 401
-    
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    c.execute("""
-        SELECT id, title, amount, created_at FROM expenses 
-        WHERE user_id=? 
-        ORDER BY created_at DESC 
-        LIMIT 1
-    """, (user_id,))
-    
-    expense = c.fetchone()
-    conn.close()
-    
-    if expense:
-        return jsonify({
-            "id": expense[0],
-            "title": expense[1],
-            "amount": expense[2],
-            "created_at": expense[3]
-        })
-    
-    return jsonify({"error": "No expenses found"}), 404
-
-
-@app.route('/api/insights')
-def api_insights():
-    if 'user_id' not in session:
-        return jsonify({}), 401
-
-    user_id = session['user_id']
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-
-    # Current month totals
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute("SELECT SUM(amount) FROM expenses WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0", (user_id, f"{current_month}%"))
-    total = c.fetchone()[0] or 0
-
-    # Top category this month
-    c.execute("SELECT category, SUM(amount) as total FROM expenses WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0 GROUP BY category ORDER BY total DESC LIMIT 1", (user_id, f"{current_month}%"))
-    top = c.fetchone()
-    top_category = top[0] if top else None
-    top_amount = top[1] if top else 0
-
-    # Average daily (for days so far in month)
-    day_of_month = datetime.now().day
-    avg_daily = (total / day_of_month) if day_of_month > 0 else 0
-
-    conn.close()
-
-    insight = None
-    if top_category:
-        insight = f"This month you spent the most on {top_category} (₹{top_amount:.2f}). Total: ₹{total:.2f}. Avg/day: ₹{avg_daily:.2f}."
-
-    return jsonify({
-        'insight': insight,
-        'top_category': top_category,
-        'top_amount': round(top_amount, 2),
-        'monthly_total': round(total, 2),
-        'avg_daily': round(avg_daily, 2)
-    })
-
-
-@app.route('/api/chart-data')
-def api_chart_data():
-    if 'user_id' not in session:
-        return jsonify({}), 401
-
-    user_id = session['user_id']
-    rng = request.args.get('range', 'week')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    q = request.args.get('q')
-    category = request.args.get('category')
-
-    # Determine date window
-    today = datetime.now().date()
-    if start_date and end_date:
-        try:
-            sd = datetime.fromisoformat(start_date).date()
-            ed = datetime.fromisoformat(end_date).date()
-        except Exception:
-            sd = today - timedelta(days=7)
-            ed = today
-    else:
-        if rng == 'today':
-            sd = ed = today
-        elif rng == 'week':
-            sd = today - timedelta(days=6)
-            ed = today
-        elif rng == 'month':
-            sd = today - timedelta(days=29)
-            ed = today
-        else:
-            sd = today - timedelta(days=29)
-            ed = today
-
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-
-    # Categories breakdown
-    params = [user_id, sd.isoformat(), ed.isoformat()]
-    query = "SELECT category, SUM(amount) FROM expenses WHERE user_id=? AND date BETWEEN ? AND ? AND is_duplicate_flagged=0"
-    if category:
-        query += " AND category=?"
-        params.append(category)
-    query += " GROUP BY category ORDER BY SUM(amount) DESC"
-    c.execute(query, tuple(params))
-    cats = c.fetchall()
-    categories = [r[0] for r in cats]
-    category_amounts = [round(r[1] or 0, 2) for r in cats]
-
-    # Daily amounts (grouped)
-    c.execute("SELECT date, SUM(amount) FROM expenses WHERE user_id=? AND date BETWEEN ? AND ? AND is_duplicate_flagged=0 GROUP BY date ORDER BY date", (user_id, sd.isoformat(), ed.isoformat()))
-    rows = c.fetchall()
-    date_map = {r[0]: r[1] for r in rows}
-
-    dates = []
-    daily_amounts = []
-    cur = sd
-    while cur <= ed:
-        key = cur.isoformat()
-        dates.append(key)
-        daily_amounts.append(round(date_map.get(key, 0) or 0, 2))
-        cur = cur + timedelta(days=1)
-
-    # Monthly summary for last 6 months
-    months = []
-    month_amounts = []
-    for i in range(5, -1, -1):
-        m = (today.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-        label = m.strftime('%Y-%m')
-        c.execute("SELECT SUM(amount) FROM expenses WHERE user_id=? AND date LIKE ? AND is_duplicate_flagged=0", (user_id, f"{label}%"))
-        ma = c.fetchone()[0] or 0
-        months.append(label)
-        month_amounts.append(round(ma, 2))
-
-    conn.close()
-
-    return jsonify({
-        'categories': categories,
-        'category_amounts': category_amounts,
-        'dates': dates,
-        'daily_amounts': daily_amounts,
-        'months': months,
-        'month_amounts': month_amounts
-    })
-
-
-@app.route('/set-budget', methods=['POST'])
-def set_budget():
-    if 'user_id' not in session:
-        return jsonify({'success': False, 'error': 'not_logged_in'}), 401
-
-    user_id = session['user_id']
-    monthly_budget = request.form.get('monthly_budget') or request.json.get('monthly_budget') if request.is_json else request.form.get('monthly_budget')
-    daily_limit = request.form.get('daily_limit') or (request.json.get('daily_limit') if request.is_json else None)
-
-    try:
-        mb = float(monthly_budget) if monthly_budget not in (None, '') else None
-    except Exception:
-        mb = None
-
-    try:
-        dl = float(daily_limit) if daily_limit not in (None, '') else None
-    except Exception:
-        dl = None
-
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("UPDATE users SET monthly_budget=?, daily_limit=? WHERE id=?", (mb, dl, user_id))
-    conn.commit()
-    conn.close()
-
-    return jsonify({'success': True, 'monthly_budget': mb, 'daily_limit': dl})
-
-@app.route('/api/backup-now', methods=['POST'])
-def backup_now():
-    if 'user_id' not in session:
-        return jsonify({"error": "Not logged in"}), 401
-    
-    success = create_backup()
-    return jsonify({"success": success, "message": "Backup created!" if success else "Backup failed!"})
-
-@app.route('/profile', methods=['GET', 'POST'])
-def profile():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    
-    if request.method == 'POST':
-        action = request.form.get('action')
-        
-        if action == 'update_info':
-            username = request.form.get('username')
-            email = request.form.get('email')
-            
-            conn = sqlite3.connect('database.db')
-            c = conn.cursor()
-            c.execute("UPDATE users SET username=?, email=? WHERE id=?", (username, email, user_id))
-            conn.commit()
-            conn.close()
-            
-            session['username'] = username
-            return redirect('/profile')
-        
-        elif action == 'change_password':
-            old_password = request.form.get('old_password')
-            new_password = request.form.get('new_password')
-            confirm_password = request.form.get('confirm_password')
-            
-            if new_password != confirm_password:
-                return render_template('profile.html', msg="Passwords don't match!")
-            
-            if len(new_password) < 6:
-                return render_template('profile.html', msg="Password must be at least 6 characters!")
-            
-            conn = sqlite3.connect('database.db')
-            c = conn.cursor()
-            c.execute("SELECT password FROM users WHERE id=?", (user_id,))
-            user = c.fetchone()
-            
-            if not user or not check_password_hash(user[0], old_password):
-                conn.close()
-                return render_template('profile.html', msg="Old password is incorrect!")
-            
-            hashed_password = generate_password_hash(new_password)
-            c.execute("UPDATE users SET password=? WHERE id=?", (hashed_password, user_id))
-            conn.commit()
-            conn.close()
-            
-            return render_template('profile.html', msg="Password changed successfully!")
-    
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT username, email FROM users WHERE id=?", (user_id,))
-    user = c.fetchone()
-    conn.close()
-    
-    return render_template('profile.html', username=user[0] if user else '', email=user[1] if user else '')
-
-@app.route('/forgot-password', methods=['GET', 'POST'])
-def forgot_password():
-    if request.method == 'POST':
-        email = request.form.get('email')
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        c.execute("SELECT id FROM users WHERE email=?", (email,))
-        user = c.fetchone()
-        
-        if user:
-            token = secrets.token_urlsafe(32)
-            expires_at = (datetime.now() + timedelta(hours=1)).isoformat()
-            c.execute("INSERT INTO password_resets (user_id, token, expires_at) VALUES (?, ?, ?)", 
-                     (user[0], token, expires_at))
-            conn.commit()
-            conn.close()
-            
-            return render_template('forgot_password.html', msg=f"Reset link: /reset-password/{token}", token=token)
-        
-        conn.close()
-        return render_template('forgot_password.html', msg="Email not found!")
-    
-    return render_template('forgot_password.html')
-
-@app.route('/reset-password/<token>', methods=['GET', 'POST'])
-def reset_password(token):
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT user_id, expires_at FROM password_resets WHERE token=?", (token,))
-    reset = c.fetchone()
-    
-    if not reset:
-        conn.close()
-        return render_template('reset_password.html', msg="Invalid or expired token!")
-    
-    user_id, expires_at = reset
-    if datetime.fromisoformat(expires_at) < datetime.now():
-        conn.close()
-        return render_template('reset_password.html', msg="Token expired! Request a new one.")
-    
-    if request.method == 'POST':
-        new_password = request.form.get('new_password')
-        confirm_password = request.form.get('confirm_password')
-        
-        if new_password != confirm_password:
-            return render_template('reset_password.html', msg="Passwords don't match!")
-        
-        if len(new_password) < 6:
-            return render_template('reset_password.html', msg="Password must be at least 6 characters!")
-        
-        hashed_password = generate_password_hash(new_password)
-        c.execute("UPDATE users SET password=? WHERE id=?", (hashed_password, user_id))
-        c.execute("DELETE FROM password_resets WHERE token=?", (token,))
-        conn.commit()
-        conn.close()
-        
-        return render_template('reset_password.html', msg="Password reset successfully! <a href='/login'>Login here</a>")
-    
-    conn.close()
-    return render_template('reset_password.html')
-
-@app.route('/delete/<int:expense_id>')
-def delete_expense(expense_id):
-    """Delete an expense by ID"""
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    user_id = session['user_id']
-    
-    try:
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        
-        # Verify expense belongs to user
-        c.execute("SELECT user_id FROM expenses WHERE id=?", (expense_id,))
-        expense = c.fetchone()
-        
-        if not expense or expense[0] != user_id:
-            conn.close()
-            return redirect('/dashboard')
-        
-        # Delete the expense
-        c.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
-        conn.commit()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error deleting expense: {e}")
-    
-    return redirect('/dashboard')
-
-# ==================== ERROR HANDLERS ====================
-
-@app.errorhandler(413)
-def request_entity_too_large(error):
-    return "File too large! Maximum size is 5MB.", 413
-
-if __name__ == '__main__':
-    init_db()
-    start_scheduler()
-    app.run(debug=True)
+from flask import Flask, Request, Response, render_template, request, redirect, session, jsonify, send_file, g
+import sqlite3
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash, check_password_hash
+from flask_mail import Mail
+from apscheduler.schedulers.background import BackgroundScheduler
+import secrets
+import string
+import re
+import json
+import csv
+import os
+from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
+import base64
+import functools
+import click
+from dataclasses import dataclass, asdict, field
+from typing import Optional
+from db import get_db
+import db
+import cache
+import activity
+import mailqueue
+import emails
+import backup
+import receipts
+import reports
+import importer
+import dataexport
+import atexit
+import threading
+import time
+
+load_dotenv()
+
+app = Flask(__name__)
+app.secret_key = "secretkey123"
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
+
+# Request threads update the module-level *_STATS counters; updates and
+# /admin/metrics snapshots hold this lock
+STATS_LOCK = threading.Lock()
+
+# Database Configuration
+app.config['DATABASE_PATH'] = os.getenv('DATABASE_PATH', 'database.db')
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_PRAGMA_PROFILE'] = os.getenv('DB_PRAGMA_PROFILE', 'performance')
+app.config['DB_CHECKPOINT_MINUTES'] = int(os.getenv('DB_CHECKPOINT_MINUTES', 15))
+db.init_app(app)
+
+# Response Cache Configuration (CACHE_URL points at a Redis-compatible server to share across workers)
+app.config['CACHE_URL'] = os.getenv('CACHE_URL')
+app.config['CACHE_TTL'] = int(os.getenv('CACHE_TTL', 60))
+app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+response_cache = cache.init_app(app)
+
+# Activity Tracking Configuration (last_activity is buffered in memory and written in batches)
+app.config['ACTIVITY_FLUSH_SECONDS'] = int(os.getenv('ACTIVITY_FLUSH_SECONDS', 30))
+app.config['ACTIVITY_FLUSH_USERS'] = int(os.getenv('ACTIVITY_FLUSH_USERS', 500))
+activity_buffer = activity.ActivityBuffer(max_users=app.config['ACTIVITY_FLUSH_USERS'])
+
+# File Upload Configuration
+UPLOAD_FOLDER = 'static/receipts'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
+MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+
+if not os.path.exists(UPLOAD_FOLDER):
+    os.makedirs(UPLOAD_FOLDER)
+
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+
+# Receipt Processing (raw uploads are staged outside static/ until a worker has stripped and resized them)
+app.config['RECEIPT_STAGING_FOLDER'] = os.getenv('RECEIPT_STAGING_FOLDER', 'uploads/receipts')
+app.config['RECEIPT_WORKERS'] = int(os.getenv('RECEIPT_WORKERS', 2))
+app.config['RECEIPT_MAX_PX'] = int(os.getenv('RECEIPT_MAX_PX', 1024))
+app.config['RECEIPT_QUALITY'] = int(os.getenv('RECEIPT_QUALITY', 85))
+app.config['RECEIPT_MAX_BYTES'] = int(os.getenv('RECEIPT_MAX_BYTES', MAX_FILE_SIZE))  # users.receipt_limit_mb overrides
+app.config['RECEIPT_UPLOAD_BUFFER_KB'] = int(os.getenv('RECEIPT_UPLOAD_BUFFER_KB', 64))
+
+# Room for the non-file fields of an upload form on top of the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Views whose file fields are receipts (sniffed, size-capped and staged)
+RECEIPT_UPLOAD_ENDPOINTS = {'add_expense'}
+
+class ReceiptRequest(Request):
+    """Streams file uploads straight into the receipt staging folder"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        user_id = session.get('user_id')
+        if user_id is None or self.endpoint not in RECEIPT_UPLOAD_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        
+        staging_folder = os.path.join(app.config['RECEIPT_STAGING_FOLDER'], str(user_id))
+        os.makedirs(staging_folder, exist_ok=True)
+        path = os.path.join(staging_folder, f"upload_{secrets.token_hex(8)}.part")
+        return receipts.StreamingUpload(path,
+                                        max_bytes=g.get('upload_limit', app.config['RECEIPT_MAX_BYTES']),
+                                        buffer_size=app.config['RECEIPT_UPLOAD_BUFFER_KB'] * 1024)
+
+app.request_class = ReceiptRequest
+
+# Receipt Serving (thumbnails are derived on demand into an LRU capped at RECEIPT_CACHE_MB)
+app.config['RECEIPT_CACHE_FOLDER'] = os.getenv('RECEIPT_CACHE_FOLDER', 'uploads/receipt_cache')
+app.config['RECEIPT_CACHE_MB'] = int(os.getenv('RECEIPT_CACHE_MB', 256))
+app.config['RECEIPT_MAX_AGE'] = int(os.getenv('RECEIPT_MAX_AGE', 86400))
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+receipt_variants = receipts.VariantCache(app.config['RECEIPT_CACHE_FOLDER'],
+                                         max_bytes=app.config['RECEIPT_CACHE_MB'] * 1024 * 1024)
+
+# Email Configuration (Set environment variables or use defaults)
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'localhost')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', True)
+app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
+app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', 'your-password')
+app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@expensetracker.com')
+
+mail = Mail(app)
+
+# Outbound Mail Queue (send_email queues to the outbox; workers deliver in batches)
+app.config['MAIL_WORKERS'] = int(os.getenv('MAIL_WORKERS', 4))
+app.config['MAIL_BATCH_SIZE'] = int(os.getenv('MAIL_BATCH_SIZE', 50))
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+app.config['MAIL_RETRY_SECONDS'] = int(os.getenv('MAIL_RETRY_SECONDS', 60))
+app.config['MAIL_POLL_SECONDS'] = int(os.getenv('MAIL_POLL_SECONDS', 30))
+mail_queue = mailqueue.init_app(app, mail)
+
+# Email Templates (templates/emails/*.jinja; links point at EMAIL_BASE_URL)
+app.config['EMAIL_BASE_URL'] = os.getenv('EMAIL_BASE_URL', 'http://127.0.0.1:5000')
+email_renderer = emails.init_app(app)
+
+# Backup Configuration (online copies in BACKUP_STEP_PAGES pages, pausing BACKUP_STEP_SLEEP_MS between steps)
+app.config['BACKUP_DIR'] = os.getenv('BACKUP_DIR', 'backups')
+app.config['BACKUP_STEP_PAGES'] = int(os.getenv('BACKUP_STEP_PAGES', 256))
+app.config['BACKUP_STEP_SLEEP_MS'] = float(os.getenv('BACKUP_STEP_SLEEP_MS', 5))
+app.config['BACKUP_COMPRESSION'] = os.getenv('BACKUP_COMPRESSION') or None  # gzip or zstd
+app.config['BACKUP_CHUNK_KB'] = int(os.getenv('BACKUP_CHUNK_KB', 64))
+app.config['BACKUP_KEEP_DAILY'] = int(os.getenv('BACKUP_KEEP_DAILY', 7))
+app.config['BACKUP_KEEP_WEEKLY'] = int(os.getenv('BACKUP_KEEP_WEEKLY', 4))
+app.config['BACKUP_KEEP_MONTHLY'] = int(os.getenv('BACKUP_KEEP_MONTHLY', 12))
+backup_store = backup.BackupStore(os.path.join(app.config['BACKUP_DIR'], 'store'),
+                                  chunk_size=app.config['BACKUP_CHUNK_KB'] * 1024,
+                                  compression=app.config['BACKUP_COMPRESSION'])
+
+# Report Export (PDFs are rendered on EXPORT_WORKERS processes and cached in EXPORT_FOLDER per data_version)
+app.config['EXPORT_FOLDER'] = os.getenv('EXPORT_FOLDER', 'exports')
+app.config['REPORT_CHUNK_ROWS'] = int(os.getenv('REPORT_CHUNK_ROWS', 1000))
+app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS', 2))
+app.config['EXPORT_WAIT_SECONDS'] = float(os.getenv('EXPORT_WAIT_SECONDS', 0.25))  # holds a request thread; keep it short
+app.config['EXPORT_CACHE_HOURS'] = int(os.getenv('EXPORT_CACHE_HOURS', 24))
+os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+
+# Bulk Import (files are inserted IMPORT_CHUNK_ROWS rows per transaction)
+app.config['IMPORT_CHUNK_ROWS'] = int(os.getenv('IMPORT_CHUNK_ROWS', 1000))
+app.config['IMPORT_MAX_BYTES'] = int(os.getenv('IMPORT_MAX_MB', 50)) * 1024 * 1024
+app.config['IMPORT_MAX_ERRORS'] = int(os.getenv('IMPORT_MAX_ERRORS', 100))  # per-row errors listed in the report
+
+# Data Export (CSV/NDJSON/Parquet streamed DATA_EXPORT_CHUNK_ROWS rows at a time; gzip level for CSV/NDJSON)
+app.config['DATA_EXPORT_CHUNK_ROWS'] = int(os.getenv('DATA_EXPORT_CHUNK_ROWS', 5000))
+app.config['DATA_EXPORT_GZIP_LEVEL'] = int(os.getenv('DATA_EXPORT_GZIP_LEVEL', 6))
+
+# Initialize scheduler for background tasks
+scheduler = BackgroundScheduler()
+
+# Category detection keywords
+CATEGORY_KEYWORDS = {
+    'Food': ['grocery', 'restaurant', 'food', 'pizza', 'burger', 'cafe', 'lunch', 'dinner', 'breakfast', 'snack', 'bakery'],
+    'Transport': ['uber', 'taxi', 'bus', 'gas', 'petrol', 'fuel', 'train', 'metro', 'ticket', 'parking'],
+    'Bills': ['electricity', 'water', 'internet', 'phone', 'bill', 'rent', 'mortgage', 'insurance'],
+    'Shopping': ['mall', 'store', 'amazon', 'flipkart', 'clothes', 'shoe', 'shopping', 'buy', 'purchase'],
+    'Entertainment': ['movie', 'cinema', 'concert', 'music', 'game', 'netflix', 'play', 'show', 'ticket'],
+    'Health': ['doctor', 'hospital', 'pharmacy', 'medicine', 'health', 'clinic', 'dental', 'fitness', 'gym'],
+    'Education': ['school', 'college', 'university', 'course', 'tuition', 'book', 'education', 'class', 'coaching']
+}
+
+def detect_category(title):
+    """Auto-detect category based on title keywords"""
+    title_lower = title.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(kw in title_lower for kw in keywords):
+            return category
+    return 'Other'
+
+def allowed_file(filename):
+    """Check if file extension is allowed"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def save_receipt(file, user_id, expense_id):
+    """Name a streamed receipt upload after its expense and return its staged path"""
+    if not file or file.filename == '':
+        return None
+    
+    if not allowed_file(file.filename):
+        return None
+    
+    upload = file.stream
+    if not isinstance(upload, receipts.StreamingUpload) or not upload.size:
+        return None
+    
+    # The sniffed type decides the extension, not the client's filename
+    filename = f"expense_{expense_id}_{datetime.now().timestamp()}.{upload.kind}"
+    filepath = os.path.join(os.path.dirname(upload.path), filename)
+    upload.claim(filepath)
+    
+    return filepath
+
+def upload_limit(user_id):
+    """Largest receipt this user may upload, in bytes"""
+    c = get_db().cursor()
+    c.execute("SELECT receipt_limit_mb FROM users WHERE id=?", (user_id,))
+    row = c.fetchone()
+    if row and row[0]:
+        return int(row[0] * 1024 * 1024)
+    return app.config['RECEIPT_MAX_BYTES']
+
+def queue_receipt(expense_id, user_id, upload):
+    """Hand a staged upload to the receipt workers"""
+    stem = os.path.basename(upload).rsplit('.', 1)[0]
+    receipt_processor.submit(expense_id, user_id, upload,
+                             os.path.join(app.config['UPLOAD_FOLDER'], str(user_id)), stem)
+
+def finish_receipt(expense_id, user_id, result, error):
+    """Record a finished receipt job and take a reference on its blob (runs on the processor's recorder thread)"""
+    with app.app_context():
+        conn = get_db()
+        if error is None:
+            receipt_file = os.path.join(str(user_id), result.get('jpeg') or result['original'])
+            cur = conn.execute("""
+                UPDATE expenses SET receipt_file=?, receipt_sha256=?, receipt_status='ready', receipt_upload=NULL
+                WHERE id=?
+            """, (receipt_file, result['sha256'], expense_id))
+            # If the expense was deleted meanwhile the files stay unreferenced for gc_receipts
+            if cur.rowcount:
+                conn.execute("""
+                    INSERT INTO receipt_blobs (user_id, sha256, source_sha256, receipt_file, bytes, refcount, created_at)
+                    VALUES (?, ?, ?, ?, ?, 1, ?)
+                    ON CONFLICT(user_id, sha256) DO UPDATE SET refcount=refcount + 1, released_at=NULL
+                """, (user_id, result['sha256'], result['source_sha256'], receipt_file, result['bytes'],
+                      datetime.now().isoformat()))
+        else:
+            print(f"Receipt processing error for expense {expense_id}: {error}")
+            conn.execute("UPDATE expenses SET receipt_status='failed' WHERE id=?", (expense_id,))
+        conn.commit()
+        response_cache.invalidate(user_id, 'dashboard')
+
+def reuse_receipt_blob(c, user_id, expense_id, source_sha256):
+    """Point the expense at an already stored copy of the same upload; True if there was one"""
+    c.execute("""
+        SELECT sha256, receipt_file FROM receipt_blobs WHERE user_id=? AND source_sha256=? LIMIT 1
+    """, (user_id, source_sha256))
+    blob = c.fetchone()
+    if not blob or not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], blob[1])):
+        return False
+    c.execute("UPDATE receipt_blobs SET refcount=refcount + 1, released_at=NULL WHERE user_id=? AND sha256=?",
+              (user_id, blob[0]))
+    c.execute("UPDATE expenses SET receipt_file=?, receipt_sha256=?, receipt_status='ready' WHERE id=?",
+              (blob[1], blob[0], expense_id))
+    return True
+
+def release_receipt_blob(c, user_id, sha256):
+    """Drop one reference; blobs at zero are removed by gc_receipts after a grace period"""
+    if sha256:
+        c.execute("""
+            UPDATE receipt_blobs SET refcount=refcount - 1,
+                released_at=CASE WHEN refcount <= 1 THEN ? ELSE released_at END
+            WHERE user_id=? AND sha256=?
+        """, (datetime.now().isoformat(), user_id, sha256))
+
+def gc_receipts(grace_seconds=3600):
+    """Delete unreferenced blobs and receipt/staging files no expense points at"""
+    conn = get_db()
+    c = conn.cursor()
+    cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+    c.execute("DELETE FROM receipt_blobs WHERE refcount <= 0 AND released_at < ?", (cutoff.isoformat(),))
+    blobs = c.rowcount
+    conn.commit()
+    
+    upload_folder = app.config['UPLOAD_FOLDER']
+    staging_folder = app.config['RECEIPT_STAGING_FOLDER']
+    c.execute("""
+        SELECT receipt_file FROM expenses WHERE receipt_file IS NOT NULL
+        UNION SELECT receipt_file FROM receipt_blobs
+    """)
+    keep = {os.path.splitext(os.path.join(upload_folder, row[0]))[0] for row in c.fetchall()}
+    c.execute("SELECT receipt_upload FROM expenses WHERE receipt_upload IS NOT NULL AND receipt_status IN ('pending', 'failed')")
+    keep.update(os.path.splitext(row[0])[0] for row in c.fetchall())
+    
+    removed = freed = 0
+    for root in (upload_folder, staging_folder):
+        for path in list(receipts.stale_files(root, keep, cutoff.timestamp())):
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+    print(f"Receipts GC: {blobs} blobs released, {removed} files removed, {freed / 1024:.2f} KB freed")
+    return blobs, removed, freed
+
+@app.cli.command('receipts')
+@click.argument('action', type=click.Choice(['gc']))
+def receipts_command(action):
+    """Remove unreferenced receipt blobs and orphaned receipt files"""
+    gc_receipts()
+
+def resume_receipts():
+    """Requeue receipts whose processing was cut short by a restart"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT id, user_id, receipt_upload FROM expenses WHERE receipt_status='pending'")
+    for expense_id, user_id, upload in c.fetchall():
+        if upload and os.path.exists(upload):
+            queue_receipt(expense_id, user_id, upload)
+        else:
+            c.execute("UPDATE expenses SET receipt_status='failed' WHERE id=?", (expense_id,))
+    conn.commit()
+
+receipt_processor = receipts.ReceiptProcessor(workers=app.config['RECEIPT_WORKERS'],
+                                              max_size=app.config['RECEIPT_MAX_PX'],
+                                              quality=app.config['RECEIPT_QUALITY'],
+                                              on_done=finish_receipt)
+
+# ==================== FRAUD & DUPLICATE DETECTION ====================
+
+def detect_duplicate_expense(user_id, title, amount, category, date, c=None):
+    """Detect potential duplicate or fraud expense (on cursor c, if given)"""
+    c = c or get_db().cursor()
+    
+    # Check for exact duplicates (same title, amount, category within 1 hour)
+    one_hour_ago = (datetime.fromisoformat(datetime.now().isoformat()) - timedelta(hours=1)).isoformat()
+    c.execute("""
+        SELECT id, created_at FROM expenses 
+        WHERE user_id=? AND title=? AND amount=? AND category=? AND date=? AND created_at > ?
+        ORDER BY created_at DESC LIMIT 1
+    """, (user_id, title, amount, category, date, one_hour_ago))
+    
+    duplicate = c.fetchone()
+    
+    if duplicate:
+        return True, f"Duplicate detected: {title} for ₹{amount} was added {duplicate[1]}"
+    
+    return False, None
+
+def detect_fraud_anomaly(user_id, amount, category, c=None):
+    """Detect unusual spending patterns (on cursor c, if given)"""
+    c = c or get_db().cursor()
+    
+    # Get average spending in this category for this user
+    c.execute("""
+        SELECT AVG(amount), MAX(amount) FROM expenses 
+        WHERE user_id=? AND category=?
+    """, (user_id, category))
+    
+    result = c.fetchone()
+    
+    if result[0] is None:
+        return False, None
+    
+    avg_amount, max_amount = result
+    
+    # If amount is more than 300% of average, flag as potential fraud
+    if amount > (avg_amount * 3):
+        return True, f"Unusual spending: ₹{amount} is 3x higher than your average {category} expense (₹{avg_amount:.2f})"
+    
+    return False, None
+
+# ==================== BULK IMPORT ====================
+# Files are parsed row by row and written IMPORT_CHUNK_ROWS at a time: one
+# executemany, the chunk's rollup deltas and a single commit per chunk.
+# Duplicate/anomaly checks run against importer.ImportChecks instead of a
+# query per row. Imported history doesn't trigger budget or daily-limit mail.
+
+IMPORT_STATS = {'imports': 0, 'rows': 0, 'imported': 0, 'errors': 0, 'last_rows_per_sec': 0.0}
+
+def import_expenses(user_id, stream, fmt, spend_sign=None):
+    """Import a CSV/OFX/JSONL expense file for user_id; returns the import report.
+
+    spend_sign ('positive' or 'negative') is how the file signs spending;
+    it defaults per format (see importer.DEFAULT_SPEND_SIGN).
+    """
+    chunk_size = app.config['IMPORT_CHUNK_ROWS']
+    max_errors = app.config['IMPORT_MAX_ERRORS']
+    started = time.perf_counter()
+    conn = get_db()
+    c = conn.cursor()
+    checks = importer.ImportChecks(conn, user_id)
+    spend_sign = spend_sign or importer.DEFAULT_SPEND_SIGN[fmt]
+    report = {'format': fmt, 'spend_sign': spend_sign, 'rows': 0, 'imported': 0, 'duplicates': 0, 'anomalies': 0,
+              'skipped': 0, 'error_count': 0, 'errors': []}
+    
+    def add_error(line, message):
+        report['error_count'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line, 'error': message})
+    
+    def write_chunk(chunk):
+        checks.load_window(min(row[3] for row in chunk), max(row[3] for row in chunk))
+        created_at = datetime.now().isoformat()
+        rows, totals = [], {}
+        for title, amount, category, day in chunk:
+            is_dup, is_fraud, reason = checks.check(title, amount, category, day)
+            rows.append((user_id, title, amount, category, day, created_at, 1 if (is_dup or is_fraud) else 0, reason or ""))
+            report['duplicates'] += is_dup
+            report['anomalies'] += is_fraud and not is_dup
+            if not (is_dup or is_fraud):
+                total = totals.setdefault((day, category), [0.0, 0])
+                total[0] += amount
+                total[1] += 1
+        try:
+            c.executemany("""
+                INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged, duplicate_reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            for (day, category), (total, count) in totals.items():
+                update_rollups(c, user_id, day, category, total, count)
+            bump_data_version(c, user_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        report['imported'] += len(rows)
+        response_cache.invalidate(user_id, 'dashboard', 'insights', 'chart')
+    
+    chunk = []
+    line = 0
+    try:
+        for line, record in importer.PARSERS[fmt](stream):
+            report['rows'] += 1
+            try:
+                chunk.append(importer.normalize(record, fmt, detect_category, spend_sign))
+            except importer.SkipRow:
+                report['skipped'] += 1
+            except importer.ImportRowError as e:
+                add_error(line, str(e))
+            if len(chunk) >= chunk_size:
+                write_chunk(chunk)
+                chunk = []
+    except csv.Error as e:
+        # A malformed file stops the import; rows before it are kept
+        add_error(line + 1, f"Unreadable CSV: {e}")
+    if chunk:
+        write_chunk(chunk)
+    
+    if report['imported']:
+        c.execute("UPDATE users SET last_expense_date=? WHERE id=?", (datetime.now().isoformat(), user_id))
+        conn.commit()
+    
+    elapsed = time.perf_counter() - started
+    report['elapsed_ms'] = round(elapsed * 1000, 1)
+    report['rows_per_sec'] = round(report['rows'] / elapsed, 1) if elapsed else 0.0
+    with STATS_LOCK:
+        IMPORT_STATS['imports'] += 1
+        IMPORT_STATS['rows'] += report['rows']
+        IMPORT_STATS['imported'] += report['imported']
+        IMPORT_STATS['errors'] += report['error_count']
+        IMPORT_STATS['last_rows_per_sec'] = report['rows_per_sec']
+    return report
+
+@app.cli.command('import')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(importer.FORMATS), help="Defaults to the file extension")
+@click.option('--spend-sign', type=click.Choice(importer.SPEND_SIGNS),
+              help="Sign of spending in the file; defaults to positive for CSV/JSONL, negative for OFX")
+def import_command(username, path, fmt, spend_sign):
+    """Import expenses for USERNAME from a CSV, OFX or JSON Lines file"""
+    c = get_db().cursor()
+    c.execute("SELECT id FROM users WHERE username=?", (username,))
+    user = c.fetchone()
+    if not user:
+        raise click.UsageError(f"No user named {username}")
+    try:
+        fmt = importer.detect_format(path, fmt)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    
+    with open(path, 'rb') as f:
+        report = import_expenses(user[0], f, fmt, spend_sign)
+    print(f"✅ {report['imported']} of {report['rows']} rows imported in {report['elapsed_ms'] / 1000:.1f}s "
+          f"({report['rows_per_sec']:.0f} rows/s): {report['duplicates']} flagged duplicate, "
+          f"{report['anomalies']} flagged unusual, {report['skipped']} skipped, {report['error_count']} errors")
+    for error in report['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+
+# ==================== DATABASE SETUP ====================
+
+def init_db():
+    conn = get_db()
+    c = conn.cursor()
+    
+    # Performance profile (WAL, synchronous, cache, busy timeout...) with a self-check
+    report = db.apply_profile(conn, app.config['DB_PRAGMAS'])
+    for name, (requested, actual, ok) in report.items():
+        mark = '✓' if ok else '✗'
+        print(f"{mark} PRAGMA {name}: requested {requested}, active {actual}")
+    
+    # Users table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            email TEXT,
+            monthly_budget REAL,
+            last_activity TEXT,
+            send_daily_summary INTEGER DEFAULT 0,
+            send_weekly_summary INTEGER DEFAULT 1,
+            send_limit_alert INTEGER DEFAULT 1,
+            send_reminder INTEGER DEFAULT 1,
+            last_expense_date TEXT,
+            device_token TEXT,
+            is_admin INTEGER DEFAULT 0,
+            total_savings_goal REAL DEFAULT 0,
+            current_savings REAL DEFAULT 0
+        )
+    ''')
+    
+    # Expenses table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expenses(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT,
+            amount REAL,
+            category TEXT,
+            date TEXT,
+            created_at TEXT,
+            receipt_file TEXT,
+            is_duplicate_flagged INTEGER DEFAULT 0,
+            duplicate_reason TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    # Password resets table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS password_resets(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            token TEXT UNIQUE,
+            expires_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    # Email logs table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS email_logs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            email_type TEXT,
+            sent_at TEXT,
+            subject TEXT,
+            status TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    # Backup logs table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS backup_logs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            backup_date TEXT,
+            backup_file TEXT,
+            backup_size TEXT,
+            status TEXT
+        )
+    ''')
+    
+    # Savings goals table (NEW)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS savings_goals(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            goal_name TEXT,
+            target_amount REAL,
+            current_amount REAL,
+            category TEXT,
+            deadline TEXT,
+            created_at TEXT,
+            status TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    conn.commit()
+
+    # Ensure columns exist (simple migration)
+    columns_to_add = [
+        ("email", "TEXT", "users"),
+        ("daily_limit", "REAL", "users"),
+        ("monthly_budget", "REAL", "users"),
+        ("last_activity", "TEXT", "users"),
+        ("send_daily_summary", "INTEGER DEFAULT 0", "users"),
+        ("send_weekly_summary", "INTEGER DEFAULT 1", "users"),
+        ("send_limit_alert", "INTEGER DEFAULT 1", "users"),
+        ("send_reminder", "INTEGER DEFAULT 1", "users"),
+        ("last_expense_date", "TEXT", "users"),
+        ("device_token", "TEXT", "users"),
+        ("is_admin", "INTEGER DEFAULT 0", "users"),
+        ("total_savings_goal", "REAL DEFAULT 0", "users"),
+        ("current_savings", "REAL DEFAULT 0", "users"),
+        ("created_at", "TEXT", "expenses"),
+        ("receipt_file", "TEXT", "expenses"),
+        ("is_duplicate_flagged", "INTEGER DEFAULT 0", "expenses"),
+        ("duplicate_reason", "TEXT", "expenses"),
+    ]
+    
+    for col_name, col_type, table_name in columns_to_add:
+        try:
+            c.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}")
+            conn.commit()
+        except sqlite3.OperationalError:
+            pass
+    
+    # Versioned migrations (indexes etc.)
+    version = db.migrate(conn)
+    print(f"✓ Schema at version {version}")
+    
+
+# ==================== ROLLUPS ====================
+# user_daily_totals and user_monthly_category_totals hold SUM/COUNT of
+# non-flagged expenses. add_expense and delete_expense keep them in step;
+# `flask --app app rollups verify|rebuild` reconciles them with the raw table.
+
+ROLLUP_SOURCES = {
+    'user_daily_totals': (
+        ('user_id', 'date', 'category'),
+        """
+        SELECT user_id, date, COALESCE(category, 'Other'), SUM(amount), COUNT(*)
+        FROM expenses WHERE is_duplicate_flagged=0 AND date IS NOT NULL
+        GROUP BY user_id, date, COALESCE(category, 'Other')
+        """,
+    ),
+    'user_monthly_category_totals': (
+        ('user_id', 'month', 'category'),
+        """
+        SELECT user_id, substr(date, 1, 7), COALESCE(category, 'Other'), SUM(amount), COUNT(*)
+        FROM expenses WHERE is_duplicate_flagged=0 AND date IS NOT NULL
+        GROUP BY user_id, substr(date, 1, 7), COALESCE(category, 'Other')
+        """,
+    ),
+}
+
+def update_rollups(c, user_id, date, category, amount, count=1):
+    """Add an expense to the rollups (pass negative amount/count to remove it)"""
+    category = category or 'Other'
+    month = date[:7]
+    c.execute("""
+        INSERT INTO user_daily_totals (user_id, date, category, total, count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, date, category)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+    """, (user_id, date, category, amount, count))
+    c.execute("""
+        INSERT INTO user_monthly_category_totals (user_id, month, category, total, count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, month, category)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+    """, (user_id, month, category, amount, count))
+    if count < 0:
+        c.execute("DELETE FROM user_daily_totals WHERE user_id=? AND date=? AND category=? AND count<=0",
+                  (user_id, date, category))
+        c.execute("DELETE FROM user_monthly_category_totals WHERE user_id=? AND month=? AND category=? AND count<=0",
+                  (user_id, month, category))
+
+def rebuild_rollups():
+    """Recompute every rollup row from the expenses table"""
+    conn = get_db()
+    c = conn.cursor()
+    for table, (keys, source) in ROLLUP_SOURCES.items():
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"INSERT INTO {table} ({', '.join(keys)}, total, count) {source}")
+    conn.commit()
+
+def verify_rollups():
+    """Return (table, key, stored, expected) for every rollup row that is off"""
+    c = get_db().cursor()
+    mismatches = []
+    for table, (keys, source) in ROLLUP_SOURCES.items():
+        c.execute(source)
+        expected = {tuple(row[:3]): (row[3], row[4]) for row in c.fetchall()}
+        c.execute(f"SELECT {', '.join(keys)}, total, count FROM {table}")
+        stored = {tuple(row[:3]): (row[3], row[4]) for row in c.fetchall()}
+        for key in expected.keys() | stored.keys():
+            want = expected.get(key, (0, 0))
+            have = stored.get(key, (0, 0))
+            if have[1] != want[1] or abs(have[0] - want[0]) > 0.005:
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+@app.cli.command('rollups')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+def rollups_command(action):
+    """Verify or rebuild the expense rollup tables"""
+    if action == 'rebuild':
+        rebuild_rollups()
+    mismatches = verify_rollups()
+    for table, key, have, want in mismatches[:50]:
+        print(f"✗ {table} {key}: stored {have}, expected {want}")
+    if mismatches:
+        print(f"❌ {len(mismatches)} rollup rows out of sync (run 'rollups rebuild')")
+        raise SystemExit(1)
+    print("✅ Rollups match expenses")
+
+# ==================== EMAIL FUNCTIONS ====================
+
+def send_email(to_email, subject, html_body, text_body=None, user_id=None, email_type=None):
+    """Queue an email for delivery; the mail workers send and log it"""
+    try:
+        mail_queue.enqueue(get_db(), [(to_email, subject, html_body, text_body, user_id, email_type)])
+        request_mail_dispatch()
+        return True, "Email queued"
+    except Exception as e:
+        print(f"Error queueing email: {str(e)}")
+        return False, str(e)
+
+def send_templated_email(to_email, email_type, user_id=None, **context):
+    """Render templates/emails/<email_type>.jinja and queue it"""
+    subject, html_body, text_body = email_renderer.render(email_type, **context)
+    return send_email(to_email, subject, html_body, text_body, user_id, email_type)
+
+def dispatch_mail():
+    """Deliver due outbox messages on the mail worker pool"""
+    try:
+        mail_queue.dispatch(get_db())
+    except Exception as e:
+        print(f"Error dispatching mail: {e}")
+
+def request_mail_dispatch():
+    """Start delivery now instead of waiting for the next poll; never waits for SMTP"""
+    mail_queue.dispatch_soon()
+
+# Users per summary-build chunk; each chunk is two queries and one email_logs write
+SUMMARY_CHUNK_SIZE = 500
+
+@dataclass
+class UserSummary:
+    """One user's totals over a summary window"""
+    user_id: int
+    username: str
+    email: str
+    total: float = 0.0
+    count: int = 0
+    categories: list = field(default_factory=list)
+    top_category: Optional[str] = None
+    top_total: float = 0.0
+
+def build_summaries(flag_column, window, chunk_size=SUMMARY_CHUNK_SIZE):
+    """Yield UserSummary lists for users opted in via `flag_column`, a chunk of users at a time"""
+    conn = get_db()
+    c = conn.cursor()
+    window_sql, window_params = db.date_clause(window)
+    last_id = 0
+    while True:
+        c.execute(f"""
+            SELECT id, username, email FROM users
+            WHERE id > ? AND {flag_column}=1 AND email IS NOT NULL AND email != ''
+            ORDER BY id LIMIT ?
+        """, (last_id, chunk_size))
+        users = c.fetchall()
+        if not users:
+            return
+        
+        summaries = {user_id: UserSummary(user_id, username, email) for user_id, username, email in users}
+        placeholders = ','.join('?' * len(summaries))
+        c.execute(f"""
+            SELECT user_id, category, SUM(total) AS total, SUM(count)
+            FROM user_daily_totals
+            WHERE user_id IN ({placeholders}) AND {window_sql}
+            GROUP BY user_id, category
+            ORDER BY user_id, total DESC
+        """, (*summaries, *window_params))
+        
+        for user_id, category, total, count in c.fetchall():
+            summary = summaries[user_id]
+            if summary.top_category is None:
+                summary.top_category, summary.top_total = category, total
+            summary.total += total
+            summary.count += count
+            summary.categories.append(category)
+        
+        yield list(summaries.values())
+        last_id = users[-1][0]
+
+def send_summaries(email_type, chunks, **shared):
+    """Render and queue each chunk of summaries with one outbox write per chunk"""
+    queued = 0
+    for chunk in chunks:
+        rendered = email_renderer.render_many(email_type, ({'summary': summary} for summary in chunk), **shared)
+        messages = [(summary.email, subject, html_body, text_body, summary.user_id, email_type)
+                    for summary, (subject, html_body, text_body) in zip(chunk, rendered)]
+        mail_queue.enqueue(get_db(), messages)
+        queued += len(messages)
+    if queued:
+        request_mail_dispatch()
+    return queued
+
+def send_spend_limit_alert(user_id, email, current_total, budget):
+    """Send budget limit alert"""
+    pct = (current_total / budget * 100) if budget > 0 else 0
+    success, msg = send_templated_email(email, "budget_alert", user_id,
+                                        current_total=current_total, budget=budget, pct=pct)
+    return success
+
+
+def send_daily_limit_alert(user_id, email, today_total, daily_limit):
+    """Send email alert when daily limit is reached"""
+    pct = (today_total / daily_limit * 100) if daily_limit and daily_limit > 0 else 0
+    send_templated_email(email, "daily_limit_alert", user_id,
+                         today_total=today_total, daily_limit=daily_limit, pct=pct)
+
+
+def send_push_notification(user_id, message):
+    """Placeholder push notification sender. Uses device_token if available.
+    This is a lightweight implementation: if a device token exists it logs a push event
+    and stores it in email_logs table as a record with type 'push_notification'.
+    """
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT device_token FROM users WHERE id=?", (user_id,))
+        row = c.fetchone()
+        device_token = row[0] if row else None
+        # In a real system you'd call a push provider here (FCM/APNs) using device_token
+        if device_token:
+            print(f"Push to {device_token}: {message}")
+            # Log as a notification (reusing email_logs for simplicity)
+            c.execute("INSERT INTO email_logs (user_id, email_type, sent_at, subject, status) VALUES (?, ?, ?, ?, ?)",
+                      (user_id, 'push_notification', datetime.now().isoformat(), message, 'sent'))
+            conn.commit()
+    except Exception as e:
+        print(f"Push error: {e}")
+
+def send_expense_reminder(user_id, user_email, username, days_since):
+    """Send reminder to add expense"""
+    success, msg = send_templated_email(user_email, "expense_reminder", user_id,
+                                        username=username, days_since=days_since)
+    return success
+
+# ==================== BACKUP FUNCTIONS ====================
+
+def create_backup():
+    """Snapshot the database into the backup store and log what it cost"""
+    try:
+        conn = get_db()
+        result = backup.backup_database(conn, backup_store,
+                                        pages=app.config['BACKUP_STEP_PAGES'],
+                                        sleep=app.config['BACKUP_STEP_SLEEP_MS'] / 1000)
+        
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO backup_logs (backup_date, backup_file, backup_size, status,
+                                     compression, bytes, stored_bytes, duration_ms, throughput_mbps)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (datetime.now().isoformat(), result['id'], f"{result['stored_bytes'] / 1024:.2f} KB", "success",
+              result['compression'], result['bytes'], result['stored_bytes'], result['duration_ms'], result['throughput_mbps']))
+        conn.commit()
+        
+        return True
+    except Exception as e:
+        print(f"Backup error: {str(e)}")
+        return False
+
+def prune_backups():
+    """Apply the daily/weekly/monthly retention policy and drop unreferenced chunks"""
+    try:
+        removed = backup_store.prune(daily=app.config['BACKUP_KEEP_DAILY'],
+                                     weekly=app.config['BACKUP_KEEP_WEEKLY'],
+                                     monthly=app.config['BACKUP_KEEP_MONTHLY'])
+        chunks, freed = backup_store.gc()
+        print(f"Backups pruned: {len(removed)} snapshots, {chunks} chunks, {freed / 1024:.2f} KB freed")
+    except Exception as e:
+        print(f"Cleanup error: {str(e)}")
+
+@app.cli.command('backup')
+@click.argument('action', type=click.Choice(['create', 'list', 'restore', 'prune']))
+@click.argument('snapshot_id', required=False)
+@click.argument('dest', required=False)
+def backup_command(action, snapshot_id, dest):
+    """Create, list, restore (SNAPSHOT_ID DEST) or prune database backups"""
+    if action == 'create':
+        if not create_backup():
+            raise SystemExit(1)
+        print(f"✅ Snapshot {backup_store.snapshots()[0]['id']} created")
+    elif action == 'list':
+        for manifest in backup_store.snapshots():
+            print(f"{manifest['id']}  {manifest['created_at']}  {manifest['size'] / 1024:.2f} KB  {len(manifest['chunks'])} chunks")
+    elif action == 'restore':
+        if not snapshot_id or not dest:
+            raise click.UsageError("restore needs SNAPSHOT_ID and DEST")
+        try:
+            backup_store.restore(snapshot_id, dest)
+        except backup.BackupCorrupt as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"✅ Snapshot {snapshot_id} verified and restored to {dest}")
+    else:
+        prune_backups()
+
+# ==================== SCHEDULER FUNCTIONS ====================
+
+def check_and_send_summaries():
+    """Check and send daily/weekly summaries"""
+    today = datetime.now().date()
+    started = time.perf_counter()
+    
+    daily = send_summaries("daily_summary",
+                           build_summaries('send_daily_summary', db.range_window(today, today)),
+                           day=today)
+    
+    weekly = 0
+    if today.weekday() == 6:  # Sunday
+        week_ago = today - timedelta(days=7)
+        weekly = send_summaries("weekly_summary",
+                                build_summaries('send_weekly_summary', db.range_window(week_ago, today)),
+                                week_ago=week_ago, today=today)
+    
+    print(f"Summaries queued: {daily} daily, {weekly} weekly in {time.perf_counter() - started:.1f}s")
+
+def check_and_send_reminders():
+    """Check and send expense reminders"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT id, username, email, send_reminder, last_expense_date FROM users WHERE email IS NOT NULL AND send_reminder=1")
+    users = c.fetchall()
+    
+    for user in users:
+        user_id, username, email, send_reminder, last_expense_date = user
+        
+        if not last_expense_date:
+            continue
+        
+        last_date = datetime.fromisoformat(last_expense_date)
+        days_since = (datetime.now() - last_date).days
+        
+        if days_since >= 2:
+            send_expense_reminder(user_id, email, username, days_since)
+
+# Alert thresholds as % of monthly budget; each is emailed at most once per month
+BUDGET_ALERT_LEVELS = (80, 100)
+
+# Last/total run of check_budget_limits, for /admin/metrics
+BUDGET_ALERT_STATS = {'runs': 0, 'last_duration_ms': 0.0, 'max_duration_ms': 0.0,
+                      'last_rows_scanned': 0, 'last_candidates': 0, 'alerts_sent': 0}
+
+def budget_alert_candidates(c, month):
+    """(candidates, rows_scanned) for one alert run.
+
+    Candidates are users at or over the lowest alert level who haven't had
+    that level yet this month. rows_scanned counts the rollup rows the grouped
+    pass read; it comes from the same statement, so the metric costs no
+    second pass over the month.
+    """
+    level = " ".join(f"WHEN t.total >= u.monthly_budget * {pct / 100} THEN {pct}"
+                     for pct in sorted(BUDGET_ALERT_LEVELS, reverse=True))
+    c.execute(f"""
+        WITH t AS (
+            SELECT user_id, SUM(total) AS total, COUNT(*) AS rollup_rows FROM user_monthly_category_totals
+            WHERE month=? GROUP BY user_id
+        )
+        SELECT scanned.rows_scanned, candidates.* FROM (
+            SELECT COALESCE(SUM(rollup_rows), 0) AS rows_scanned FROM t
+        ) scanned
+        LEFT JOIN (
+            SELECT id, email, monthly_budget, total, level FROM (
+                SELECT u.id, u.email, u.monthly_budget, t.total, CASE {level} END AS level
+                FROM t JOIN users u ON u.id = t.user_id
+                WHERE u.email IS NOT NULL AND u.email != '' AND u.send_limit_alert=1 AND u.monthly_budget > 0
+            ) alerts
+            WHERE level IS NOT NULL
+              AND level > COALESCE((SELECT MAX(s.level) FROM budget_alerts_sent s
+                                    WHERE s.user_id=alerts.id AND s.month=?), 0)
+        ) candidates ON 1
+    """, (month, month))
+    rows = c.fetchall()
+    # Always one row for the scan count; with no candidates its other columns are NULL
+    return [row[1:] for row in rows if row[1] is not None], rows[0][0]
+
+def check_budget_limits():
+    """Send budget alerts to users who crossed a new alert level this month"""
+    started = time.perf_counter()
+    conn = get_db()
+    c = conn.cursor()
+    current_month = datetime.now().strftime('%Y-%m')
+    
+    candidates, rows_scanned = budget_alert_candidates(c, current_month)
+    
+    sent = []
+    try:
+        for user_id, email, budget, current_total, level in candidates:
+            if send_spend_limit_alert(user_id, email, current_total, budget):
+                sent.append((user_id, current_month, level, datetime.now().isoformat()))
+    finally:
+        # Record what went out even if a later send blew up, so nobody is emailed twice
+        c.executemany("INSERT OR IGNORE INTO budget_alerts_sent (user_id, month, level, sent_at) VALUES (?, ?, ?, ?)", sent)
+        conn.commit()
+        
+        duration_ms = (time.perf_counter() - started) * 1000
+        with STATS_LOCK:
+            BUDGET_ALERT_STATS['runs'] += 1
+            BUDGET_ALERT_STATS['last_duration_ms'] = round(duration_ms, 2)
+            BUDGET_ALERT_STATS['max_duration_ms'] = max(BUDGET_ALERT_STATS['max_duration_ms'], round(duration_ms, 2))
+            BUDGET_ALERT_STATS['last_rows_scanned'] = rows_scanned
+            BUDGET_ALERT_STATS['last_candidates'] = len(candidates)
+            BUDGET_ALERT_STATS['alerts_sent'] += len(sent)
+
+def checkpoint_wal():
+    """Periodic passive WAL checkpoint (never blocks readers or writers)"""
+    busy, wal_pages, checkpointed = db.checkpoint(get_db(), 'PASSIVE')
+    if busy or checkpointed < wal_pages:
+        print(f"WAL checkpoint partial: {checkpointed}/{wal_pages} pages")
+
+def with_app_context(func):
+    """Run a scheduler job inside an app context so it can use get_db()"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return wrapper
+
+def start_scheduler():
+    """Start background scheduler"""
+    if not scheduler.running:
+        scheduler.add_job(with_app_context(check_and_send_summaries), 'cron', hour=8, minute=0)
+        scheduler.add_job(with_app_context(check_and_send_reminders), 'interval', hours=6)
+        scheduler.add_job(with_app_context(check_budget_limits), 'interval', hours=1)
+        scheduler.add_job(with_app_context(create_backup), 'cron', hour=2, minute=0)
+        scheduler.add_job(prune_backups, 'cron', hour=3, minute=0)
+        scheduler.add_job(with_app_context(gc_receipts), 'cron', hour=3, minute=30)
+        scheduler.add_job(with_app_context(prune_exports), 'cron', hour=3, minute=45)
+        scheduler.add_job(with_app_context(checkpoint_wal), 'interval', minutes=app.config['DB_CHECKPOINT_MINUTES'])
+        scheduler.add_job(with_app_context(flush_activity), 'interval', seconds=app.config['ACTIVITY_FLUSH_SECONDS'])
+        scheduler.add_job(with_app_context(dispatch_mail), 'interval', seconds=app.config['MAIL_POLL_SECONDS'])
+        scheduler.start()
+        print("Scheduler started!")
+
+# ==================== DASHBOARD DATA ====================
+
+EXPENSE_PAGE_SIZE = 50
+EXPENSE_COLUMNS = "id, title, amount, category, date, receipt_file, is_duplicate_flagged, duplicate_reason"
+
+def encode_cursor(date, expense_id):
+    """Opaque pagination cursor for the (date, id) of the last row on a page"""
+    raw = json.dumps([date, expense_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, expense_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(date, str) or not isinstance(expense_id, int):
+        raise ValueError("Invalid cursor")
+    return date, expense_id
+
+def fetch_expense_page(user_id, cursor=None, limit=EXPENSE_PAGE_SIZE, category=None, q=None, window=None):
+    """One page of a user's expenses, newest first, keyset-paginated on (date, id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    where = ["user_id=?"]
+    params = [user_id]
+    if window:
+        window_sql, window_params = db.date_clause(window)
+        where.append(window_sql)
+        params.extend(window_params)
+    if category:
+        where.append("category=?")
+        params.append(category)
+    if q:
+        escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where.append("title LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if cursor:
+        where.append("(date, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    
+    c = get_db().cursor()
+    c.execute(f"""
+        SELECT {EXPENSE_COLUMNS} FROM expenses
+        WHERE {' AND '.join(where)}
+        ORDER BY date DESC, id DESC
+        LIMIT ?
+    """, (*params, limit + 1))
+    rows = c.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][4], rows[-1][0])
+    return rows, next_cursor
+
+@dataclass
+class DashboardView:
+    """Everything dashboard.html shows for one user and month"""
+    budget: float
+    daily_limit: Optional[float]
+    expenses: list
+    flagged_expenses: list
+    savings_goals: list
+    total: float = 0
+    count: int = 0
+    today_total: float = 0
+    next_cursor: Optional[str] = None
+    query_count: int = 0
+
+    @property
+    def remaining(self):
+        return self.budget - self.total
+
+# Queries issued per dashboard render, for /admin/metrics
+DASHBOARD_STATS = {'renders': 0, 'queries': 0, 'last_queries': 0, 'max_queries': 0}
+
+def load_dashboard(user_id, today=None):
+    """Read the dashboard in four queries whose cost doesn't grow with history.
+
+    The user row and this month's totals come from one query against the
+    rollups; only the first page of expenses is loaded, the rest is fetched
+    progressively from /api/expenses.
+    """
+    today = today or datetime.now().date()
+    month = today.strftime('%Y-%m')
+    window = db.month_window(today)
+    conn = get_db()
+    c = conn.cursor()
+    
+    with db.count_queries(conn) as queries:
+        c.execute("""
+            SELECT u.monthly_budget, u.daily_limit,
+                   (SELECT SUM(total) FROM user_monthly_category_totals WHERE user_id=u.id AND month=?),
+                   (SELECT SUM(count) FROM user_monthly_category_totals WHERE user_id=u.id AND month=?),
+                   (SELECT SUM(total) FROM user_daily_totals WHERE user_id=u.id AND date=?)
+            FROM users u WHERE u.id=?
+        """, (month, month, today.isoformat(), user_id))
+        budget, daily_limit, total, count, today_total = c.fetchone() or (None, None, None, None, None)
+        
+        expenses, next_cursor = fetch_expense_page(user_id, window=window)
+        
+        month_sql, month_params = db.date_clause(window)
+        c.execute(f"""
+            SELECT id, title, amount, duplicate_reason, date 
+            FROM expenses 
+            WHERE user_id=? AND is_duplicate_flagged=1 AND {month_sql}
+            ORDER BY date DESC
+        """, (user_id, *month_params))
+        flagged_expenses = c.fetchall()
+        
+        c.execute("""
+            SELECT id, goal_name, target_amount, current_amount, deadline, status 
+            FROM savings_goals 
+            WHERE user_id=? 
+            ORDER BY deadline ASC
+        """, (user_id,))
+        savings_goals = c.fetchall()
+    
+    with STATS_LOCK:
+        DASHBOARD_STATS['renders'] += 1
+        DASHBOARD_STATS['queries'] += queries.count
+        DASHBOARD_STATS['last_queries'] = queries.count
+        DASHBOARD_STATS['max_queries'] = max(DASHBOARD_STATS['max_queries'], queries.count)
+    
+    return DashboardView(
+        budget=budget or 0,
+        daily_limit=daily_limit,
+        expenses=expenses,
+        flagged_expenses=flagged_expenses,
+        savings_goals=savings_goals,
+        total=total or 0,
+        count=count or 0,
+        today_total=today_total or 0,
+        next_cursor=next_cursor,
+        query_count=queries.count,
+    )
+
+# ==================== SESSION & MIDDLEWARE ====================
+
+@app.before_request
+def before_request():
+    """Track last activity and check session timeout"""
+    if 'user_id' in session:
+        session.permanent = True
+        last_activity = session.get('last_activity')
+        if last_activity:
+            last_time = datetime.fromisoformat(last_activity)
+            if datetime.now() - last_time > timedelta(minutes=30):
+                session.clear()
+                return redirect('/login')
+        session['last_activity'] = datetime.now().isoformat()
+    
+    if 'user_id' in session and request.endpoint != 'static':
+        if activity_buffer.touch(session['user_id']):
+            request_activity_flush()
+
+@app.before_request
+def apply_upload_limit():
+    """Size multipart uploads by the user's receipt limit before the body is read"""
+    if request.method == 'POST' and request.mimetype == 'multipart/form-data' and 'user_id' in session:
+        if request.endpoint == 'import_expenses_api':
+            g.upload_limit = app.config['IMPORT_MAX_BYTES']
+        else:
+            g.upload_limit = upload_limit(session['user_id'])
+        request.max_content_length = g.upload_limit + UPLOAD_FORM_OVERHEAD
+
+@app.teardown_request
+def discard_unclaimed_uploads(error):
+    """Remove streamed uploads the view didn't keep"""
+    files = request.__dict__.get('files')
+    for _, file in (files.items(multi=True) if files else ()):
+        if isinstance(file.stream, receipts.StreamingUpload):
+            file.stream.discard()
+
+def flush_activity():
+    """Write buffered last_activity timestamps with one executemany"""
+    try:
+        activity_buffer.flush(get_db())
+    except Exception as e:
+        print(f"Error flushing activity: {e}")
+
+def request_activity_flush():
+    """Flush early once ACTIVITY_FLUSH_USERS users are pending"""
+    if scheduler.running:
+        scheduler.add_job(with_app_context(flush_activity), id='activity_flush_now', replace_existing=True)
+    else:
+        flush_activity()
+
+@atexit.register
+def flush_activity_on_shutdown():
+    """Don't drop buffered activity on a clean shutdown"""
+    with app.app_context():
+        flush_activity()
+
+# ==================== ROUTES ====================
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        email = request.form.get('email', '')
+        hashed_password = generate_password_hash(password)
+        conn = get_db()
+        c = conn.cursor()
+        try:
+            c.execute("""
+                INSERT INTO users (username, password, email, send_weekly_summary, send_limit_alert, send_reminder, is_admin) 
+                VALUES (?, ?, ?, 1, 1, 1, 0)
+            """, (username, hashed_password, email))
+            conn.commit()
+            return redirect('/login')
+        except:
+            return "Username already exists!"
+    return render_template('register.html')
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT id, password, username FROM users WHERE username=?", (username,))
+        user = c.fetchone()
+        
+        if user and check_password_hash(user[1], password):
+            session['user_id'] = user[0]
+            session['username'] = user[2]
+            session.permanent = True
+            session['last_activity'] = datetime.now().isoformat()
+            
+            # Check if admin
+            c.execute("SELECT is_admin FROM users WHERE id=?", (user[0],))
+            is_admin = c.fetchone()[0]
+            
+            if is_admin:
+                return redirect('/admin/dashboard')
+            return redirect('/dashboard')
+        return "Invalid credentials!"
+    return render_template('login.html')
+
+@app.route('/logout')
+def logout():
+    session.clear()
+    return redirect('/')
+
+@app.route('/dashboard')
+def dashboard():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    today = datetime.now().date()
+    view = DashboardView(**response_cache.get_or_set(
+        user_id, 'dashboard', {'today': today}, lambda: asdict(load_dashboard(user_id, today))))
+    
+    # Pass filter/query params back to template so inputs stay in sync
+    req_range = request.args.get('range')
+    start_date_q = request.args.get('start_date')
+    end_date_q = request.args.get('end_date')
+    q = request.args.get('q')
+    category_q = request.args.get('category')
+
+    # Pass any immediate warning (from add expense) to template
+    warning = request.args.get('warning', '')
+
+    return render_template('dashboard.html', 
+        expenses=view.expenses,
+        next_cursor=view.next_cursor,
+        page_size=EXPENSE_PAGE_SIZE,
+        total=view.total,
+        count=view.count,
+        budget=view.budget,
+        monthly_budget=view.budget,
+        current_month_total=view.total,
+        remaining=view.remaining,
+        flagged_expenses=view.flagged_expenses,
+        savings_goals=view.savings_goals,
+        warning=warning,
+        daily_limit=view.daily_limit,
+        today_total=view.today_total,
+        username=session.get('username', ''),
+        range=req_range,
+        start_date=start_date_q,
+        end_date=end_date_q,
+        q=q,
+        category=category_q
+    )
+
+@app.route('/add', methods=['GET', 'POST'])
+def add_expense():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        title = request.form['title']
+        amount = float(request.form['amount'])
+        category = request.form.get('category', detect_category(title))
+        date = request.form['date']
+        
+        # Checks, insert, receipt and user updates share one write transaction and one commit
+        conn = get_db()
+        c = conn.cursor()
+        today = datetime.now().date().isoformat()
+        now = datetime.now().isoformat()
+        upload = None
+        reused = False
+        
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            is_dup, dup_msg = detect_duplicate_expense(user_id, title, amount, category, date, c)
+            is_fraud, fraud_msg = detect_fraud_anomaly(user_id, amount, category, c)
+            
+            # Limit, email and today's total BEFORE inserting so we can detect crossing
+            c.execute("""
+                SELECT daily_limit, email,
+                       (SELECT SUM(total) FROM user_daily_totals WHERE user_id=users.id AND date=?)
+                FROM users WHERE id=?
+            """, (today, user_id))
+            daily_limit, user_email, today_total_before = c.fetchone() or (None, None, None)
+            today_total_before = today_total_before or 0
+            
+            # Insert expense
+            c.execute("""
+                INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged, duplicate_reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, title, amount, category, date, now, 1 if (is_dup or is_fraud) else 0,
+                  dup_msg or fraud_msg or ""))
+            expense_id = c.lastrowid
+            if not (is_dup or is_fraud):
+                update_rollups(c, user_id, date, category, amount)
+            bump_data_version(c, user_id)
+            
+            # Handle receipt upload
+            if 'receipt' in request.files:
+                file = request.files['receipt']
+                if file and file.filename != '' and allowed_file(file.filename):
+                    upload = save_receipt(file, user_id, expense_id)
+                    if upload and reuse_receipt_blob(c, user_id, expense_id, file.stream.sha256):
+                        reused = True
+                    elif upload:
+                        c.execute("UPDATE expenses SET receipt_status='pending', receipt_upload=? WHERE id=?", (upload, expense_id))
+            
+            # Update last_expense_date
+            c.execute("UPDATE users SET last_expense_date=? WHERE id=?", (now, user_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if upload and os.path.exists(upload):
+                os.remove(upload)
+            raise
+        
+        # Workers only see the expense once it is committed
+        if reused:
+            os.remove(upload)
+        elif upload:
+            queue_receipt(expense_id, user_id, upload)
+        response_cache.invalidate(user_id, 'dashboard', 'insights', 'chart')
+        # Only an unflagged expense dated today moves today's total
+        today_total_after = today_total_before
+        if date == today and not (is_dup or is_fraud):
+            today_total_after += amount
+        
+        warning_msg = ""
+        if is_dup:
+            warning_msg = f"⚠️ Duplicate Alert: {dup_msg}"
+        elif is_fraud:
+            warning_msg = f"⚠️ Fraud Alert: {fraud_msg}"
+        else:
+            # Check daily limit (if user has set one) and send notifications only when crossing threshold
+            try:
+                if daily_limit and daily_limit > 0:
+                    # If before was below limit and after is >= limit, send notifications
+                    if today_total_before < daily_limit and today_total_after >= daily_limit:
+                        warning_msg = f"⚠️ Daily limit reached: You've spent ₹{today_total_after:.2f} today (limit: ₹{daily_limit:.2f})."
+                        # send email if user opted for alerts
+                        try:
+                            send_daily_limit_alert(user_id, user_email, today_total_after, daily_limit)
+                        except Exception as e:
+                            print(f"Error sending daily email alert: {e}")
+                        # send push notification if device token exists
+                        try:
+                            send_push_notification(user_id, f"Daily limit reached: ₹{today_total_after:.2f} spent today")
+                        except Exception as e:
+                            print(f"Error sending push notification: {e}")
+            except Exception:
+                pass
+        
+        return redirect(f'/dashboard?warning={warning_msg}' if warning_msg else '/dashboard')
+    
+    return render_template('add_expense.html')
+
+@app.route('/api/import', methods=['POST'])
+def import_expenses_api():
+    """Bulk import an uploaded CSV, OFX or JSON Lines file.
+
+    Optional form fields: format= overrides the file extension, and
+    spend_sign=positive|negative says how the file signs spending.
+    """
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+    try:
+        fmt = importer.detect_format(file.filename, request.form.get('format'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    spend_sign = request.form.get('spend_sign') or None
+    if spend_sign not in (None, *importer.SPEND_SIGNS):
+        return jsonify({"error": f"spend_sign must be one of {', '.join(importer.SPEND_SIGNS)}"}), 400
+    
+    return jsonify(import_expenses(session['user_id'], file.stream, fmt, spend_sign))
+
+@app.route('/savings', methods=['GET', 'POST'])
+def savings_goals():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    if request.method == 'POST':
+        action = request.form.get('action')
+        
+        if action == 'create':
+            goal_name = request.form['goal_name']
+            target_amount = float(request.form['target_amount'])
+            category = request.form.get('category', 'All')
+            deadline = request.form['deadline']
+            
+            c.execute("""
+                INSERT INTO savings_goals (user_id, goal_name, target_amount, current_amount, category, deadline, created_at, status)
+                VALUES (?, ?, ?, 0, ?, ?, ?, 'active')
+            """, (user_id, goal_name, target_amount, category, deadline, datetime.now().isoformat()))
+            conn.commit()
+        
+        elif action == 'update':
+            goal_id = int(request.form['goal_id'])
+            amount_to_add = float(request.form['amount'])
+            
+            c.execute("SELECT current_amount, target_amount FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id))
+            goal = c.fetchone()
+            
+            if goal:
+                new_amount = goal[0] + amount_to_add
+                status = 'completed' if new_amount >= goal[1] else 'active'
+                c.execute("UPDATE savings_goals SET current_amount=?, status=? WHERE id=?", (new_amount, status, goal_id))
+                conn.commit()
+        
+        elif action == 'delete':
+            goal_id = int(request.form['goal_id'])
+            c.execute("DELETE FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id))
+            conn.commit()
+        
+        response_cache.invalidate(user_id, 'dashboard')
+    
+    c.execute("""
+        SELECT id, goal_name, target_amount, current_amount, deadline, status, category
+        FROM savings_goals 
+        WHERE user_id=? 
+        ORDER BY deadline ASC
+    """, (user_id,))
+    goals = c.fetchall()
+    
+    return render_template('savings_goals.html', goals=goals)
+
+@app.route('/calendar')
+def calendar():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    # Get all expenses
+    c.execute("""
+        SELECT date, SUM(total) as total, SUM(count) as count
+        FROM user_daily_totals 
+        WHERE user_id=?
+        GROUP BY date
+        ORDER BY date DESC
+    """, (user_id,))
+    
+    expenses_by_date = {}
+    for row in c.fetchall():
+        expenses_by_date[row[0]] = {'amount': row[1], 'count': row[2]}
+    
+    
+    current_year = datetime.now().year
+    current_month = datetime.now().month
+    
+    return render_template('calendar.html', 
+        expenses_by_date=json.dumps(expenses_by_date),
+        current_year=current_year,
+        current_month=current_month
+    )
+
+# ==================== ADMIN ROUTES ====================
+
+@app.route('/admin/dashboard')
+def admin_dashboard():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    # Check if user is admin
+    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
+    is_admin = c.fetchone()
+    
+    if not is_admin or is_admin[0] != 1:
+        return redirect('/dashboard')
+    
+    # Get total users
+    c.execute("SELECT COUNT(*) FROM users WHERE is_admin=0")
+    total_users = c.fetchone()[0]
+    
+    # Get total expenses
+    c.execute("SELECT COUNT(*) FROM expenses")
+    total_expenses = c.fetchone()[0]
+    
+    # Get total amount spent
+    c.execute("SELECT SUM(amount) FROM expenses WHERE is_duplicate_flagged=0")
+    total_amount = c.fetchone()[0] or 0
+    
+    # Top 5 highest spending users
+    c.execute("""
+        SELECT u.id, u.username, u.email, SUM(e.amount) as total_spent
+        FROM users u
+        LEFT JOIN expenses e ON u.id = e.user_id AND e.is_duplicate_flagged=0
+        WHERE u.is_admin=0
+        GROUP BY u.id
+        ORDER BY total_spent DESC
+        LIMIT 5
+    """)
+    top_users = c.fetchall()
+    
+    # Category breakdown
+    c.execute("""
+        SELECT category, SUM(amount) as total, COUNT(*) as count
+        FROM expenses
+        WHERE is_duplicate_flagged=0
+        GROUP BY category
+        ORDER BY total DESC
+    """)
+    category_breakdown = c.fetchall()
+    
+    # Flagged expenses (duplicates/fraud)
+    c.execute("""
+        SELECT e.id, u.username, e.title, e.amount, e.duplicate_reason, e.date
+        FROM expenses e
+        JOIN users u ON e.user_id = u.id
+        WHERE e.is_duplicate_flagged=1
+        ORDER BY e.date DESC
+        LIMIT 20
+    """)
+    flagged_expenses = c.fetchall()
+    
+    # User spending trends (last 30 days)
+    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    c.execute("""
+        SELECT u.username, SUM(e.amount) as total_30days
+        FROM users u
+        LEFT JOIN expenses e ON u.id = e.user_id AND e.date >= ? AND e.is_duplicate_flagged=0
+        WHERE u.is_admin=0
+        GROUP BY u.id
+        ORDER BY total_30days DESC
+        LIMIT 10
+    """, (thirty_days_ago,))
+    user_trends = c.fetchall()
+    
+    
+    return render_template('admin_dashboard.html',
+        total_users=total_users,
+        total_expenses=total_expenses,
+        total_amount=total_amount,
+        top_users=top_users,
+        category_breakdown=category_breakdown,
+        flagged_expenses=flagged_expenses,
+        user_trends=user_trends
+    )
+
+@app.route('/admin/users')
+def admin_users():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
+    is_admin = c.fetchone()
+    
+    if not is_admin or is_admin[0] != 1:
+        return redirect('/dashboard')
+    
+    # Get all users with spending info
+    c.execute("""
+        SELECT u.id, u.username, u.email, u.monthly_budget, COUNT(e.id) as expense_count, SUM(e.amount) as total_spent
+        FROM users u
+        LEFT JOIN expenses e ON u.id = e.user_id AND e.is_duplicate_flagged=0
+        WHERE u.is_admin=0
+        GROUP BY u.id
+        ORDER BY total_spent DESC
+    """)
+    users = c.fetchall()
+    
+    return render_template('admin_users.html', users=users)
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
+    is_admin = c.fetchone()
+    
+    if not is_admin or is_admin[0] != 1:
+        return jsonify({"error": "Forbidden"}), 403
+    
+    pragmas = db.check_pragmas(conn, app.config['DB_PRAGMAS'])
+    with STATS_LOCK:
+        dashboard = dict(DASHBOARD_STATS)
+        budget_alerts = dict(BUDGET_ALERT_STATS)
+        imports = dict(IMPORT_STATS)
+        data_exports = dict(DATA_EXPORT_STATS)
+    
+    return jsonify({
+        'db_pool': db.pool.stats(),
+        'dashboard': dashboard,
+        'cache': response_cache.stats(),
+        'activity': activity_buffer.stats(),
+        'budget_alerts': budget_alerts,
+        'mail': mail_queue.stats(conn),
+        'receipts': receipt_processor.stats(),
+        'receipt_cache': receipt_variants.stats(),
+        'exports': report_jobs.stats(),
+        'imports': imports,
+        'data_exports': data_exports,
+        'db_pragmas': {name: {'requested': r, 'active': a, 'ok': ok} for name, (r, a, ok) in pragmas.items()}
+    })
+
+@app.route('/settings', methods=['GET', 'POST'])
+def settings():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        send_daily = 1 if request.form.get('send_daily_summary') else 0
+        send_weekly = 1 if request.form.get('send_weekly_summary') else 0
+        send_alert = 1 if request.form.get('send_limit_alert') else 0
+        send_reminder = 1 if request.form.get('send_reminder') else 0
+        # accept daily limit (optional)
+        daily_limit_val = request.form.get('daily_limit')
+        try:
+            daily_limit = float(daily_limit_val) if daily_limit_val else None
+        except ValueError:
+            daily_limit = None
+        
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE users 
+            SET send_daily_summary=?, send_weekly_summary=?, send_limit_alert=?, send_reminder=?, daily_limit=?
+            WHERE id=?
+        """, (send_daily, send_weekly, send_alert, send_reminder, daily_limit, user_id))
+        conn.commit()
+        response_cache.invalidate(user_id, 'dashboard')
+        
+        return redirect('/dashboard')
+    
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT send_daily_summary, send_weekly_summary, send_limit_alert, send_reminder, email, daily_limit
+        FROM users WHERE id=?
+    """, (user_id,))
+    
+    user_prefs = c.fetchone()
+    
+    return render_template('settings.html', 
+        send_daily=user_prefs[0] if user_prefs else 0,
+        send_weekly=user_prefs[1] if user_prefs else 1,
+        send_alert=user_prefs[2] if user_prefs else 1,
+        send_reminder=user_prefs[3] if user_prefs else 1,
+        email=user_prefs[4] if user_prefs else '',
+        daily_limit=user_prefs[5] if user_prefs and user_prefs[5] is not None else ''
+    )
+
+def export_params(args, this_month=True):
+    """(window, category) from start_date/end_date/category query args; defaults to this month (or all dates)"""
+    start_date, end_date = args.get('start_date'), args.get('end_date')
+    if start_date or end_date:
+        window = db.range_window(start_date or '1970-01-01', end_date or datetime.now().date())
+    elif this_month:
+        window = db.month_window(datetime.now().strftime('%Y-%m'))
+    else:
+        window = None
+    return window, args.get('category') or None
+
+def bump_data_version(c, user_id):
+    """Mark the user's expenses as changed so cached reports are rebuilt"""
+    c.execute("UPDATE users SET data_version=data_version + 1 WHERE id=?", (user_id,))
+
+def export_path(report_file):
+    return os.path.join(app.config['EXPORT_FOLDER'], report_file)
+
+def queue_export(job_id, user_id, report_file, window, category, budget):
+    """Hand a report job to the export workers"""
+    report_jobs.submit(job_id, user_id, export_path(report_file), window, category, budget)
+
+def submit_export(user_id, window, category):
+    """Job id serving this export: a cached report, one already rendering, or a newly queued one"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT monthly_budget, data_version FROM users WHERE id=?", (user_id,))
+    budget, data_version = c.fetchone()
+    budget = (budget or 0) if window == db.month_window(window[0]) else None
+    key = reports.cache_key(user_id, window, category, budget, data_version)
+    
+    # The lookup and the insert share one write transaction, so identical concurrent
+    # requests queue one render; the unique (user_id, cache_key) index backs this up
+    report_file = os.path.join(str(user_id), f"{key}.pdf")
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("""
+            SELECT id, status, report_file FROM export_jobs
+            WHERE user_id=? AND cache_key=? AND status != 'failed'
+            ORDER BY id DESC LIMIT 1
+        """, (user_id, key))
+        job = c.fetchone()
+        if job and (job[1] == 'pending' or os.path.exists(export_path(job[2]))):
+            conn.commit()
+            report_jobs.record_hit(coalesced=job[1] == 'pending')
+            return job[0]
+        
+        if job:
+            # Ready, but its file is gone: render it again under the same job
+            job_id = job[0]
+            c.execute("UPDATE export_jobs SET status='pending', created_at=?, finished_at=NULL WHERE id=?",
+                      (datetime.now().isoformat(), job_id))
+        else:
+            c.execute("""
+                INSERT INTO export_jobs (user_id, cache_key, start_date, end_date, category, data_version, status, report_file, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+            """, (user_id, key, window[0], window[1], category, data_version, report_file, datetime.now().isoformat()))
+            job_id = c.lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    queue_export(job_id, user_id, report_file, window, category, budget)
+    return job_id
+
+def finish_export(job_id, user_id, result, error):
+    """Record a finished report job (runs on the report pool's recorder thread)"""
+    with app.app_context():
+        conn = get_db()
+        if error is None:
+            conn.execute("""
+                UPDATE export_jobs SET status='ready', rows=?, pages=?, bytes=?, elapsed_ms=?, finished_at=?
+                WHERE id=?
+            """, (result['rows'], result['pages'], result['bytes'], result['elapsed_ms'],
+                  datetime.now().isoformat(), job_id))
+        else:
+            print(f"Report export error for job {job_id}: {error}")
+            conn.execute("UPDATE export_jobs SET status='failed', error=?, finished_at=? WHERE id=?",
+                         (str(error), datetime.now().isoformat(), job_id))
+        conn.commit()
+
+def resume_exports():
+    """Requeue report jobs that were still rendering when the app stopped"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT j.id, j.user_id, j.report_file, j.start_date, j.end_date, j.category, u.monthly_budget
+        FROM export_jobs j JOIN users u ON u.id = j.user_id
+        WHERE j.status='pending'
+    """)
+    for job_id, user_id, report_file, start_date, end_date, category, budget in c.fetchall():
+        window = (start_date, end_date)
+        budget = (budget or 0) if window == db.month_window(start_date) else None
+        queue_export(job_id, user_id, report_file, window, category, budget)
+
+def prune_exports():
+    """Drop report jobs that are old or superseded by newer data, and files nothing points at"""
+    conn = get_db()
+    c = conn.cursor()
+    cutoff = datetime.now() - timedelta(hours=app.config['EXPORT_CACHE_HOURS'])
+    c.execute("""
+        DELETE FROM export_jobs
+        WHERE status != 'pending' AND (
+            created_at < ?
+            OR data_version < (SELECT data_version FROM users WHERE users.id = export_jobs.user_id)
+        )
+    """, (cutoff.isoformat(),))
+    jobs = c.rowcount
+    conn.commit()
+    
+    c.execute("SELECT report_file FROM export_jobs")
+    keep = {export_path(row[0]) for row in c.fetchall()}
+    removed = 0
+    for folder, _, names in os.walk(app.config['EXPORT_FOLDER']):
+        for name in names:
+            path = os.path.join(folder, name)
+            # Leave anything a worker may still be writing
+            if path not in keep and os.path.getmtime(path) < time.time() - 3600:
+                os.remove(path)
+                removed += 1
+    print(f"Export cache: {jobs} jobs dropped, {removed} files removed")
+    return jobs, removed
+
+report_jobs = reports.ReportJobs(app.config['DATABASE_PATH'], app.config['DB_PRAGMAS'],
+                                 workers=app.config['EXPORT_WORKERS'],
+                                 chunk_size=app.config['REPORT_CHUNK_ROWS'],
+                                 on_done=finish_export)
+
+def export_job_json(job_id, user_id):
+    c = get_db().cursor()
+    c.execute("""
+        SELECT id, status, start_date, end_date, category, rows, pages, bytes, elapsed_ms, error, created_at, finished_at
+        FROM export_jobs WHERE id=? AND user_id=?
+    """, (job_id, user_id))
+    row = c.fetchone()
+    if not row:
+        return None
+    job = dict(zip(('job_id', 'status', 'start_date', 'end_date', 'category', 'rows', 'pages', 'bytes',
+                    'elapsed_ms', 'error', 'created_at', 'finished_at'), row))
+    job['end_date'] = (datetime.fromisoformat(job['end_date']) - timedelta(days=1)).date().isoformat()
+    job['download_url'] = f"/api/exports/{job_id}/download" if job['status'] == 'ready' else None
+    return job
+
+def send_export(job_id, user_id):
+    """The finished report file as a download, or None if it isn't ready"""
+    c = get_db().cursor()
+    c.execute("SELECT status, report_file FROM export_jobs WHERE id=? AND user_id=?", (job_id, user_id))
+    row = c.fetchone()
+    if not row or row[0] != 'ready' or not os.path.exists(export_path(row[1])):
+        return None
+    return send_file(os.path.abspath(export_path(row[1])), mimetype='application/pdf', as_attachment=True,
+                     download_name='expense_report.pdf', conditional=True, etag=True)
+
+@app.route('/export-pdf')
+def export_pdf():
+    """Expense report PDF; ?start_date=&end_date=&category= pick the rows (default: this month)"""
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    try:
+        window, category = export_params(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid date range"}), 400
+    
+    # Cached reports come straight back; new ones are waited on briefly, then handed to the job API
+    job_id = submit_export(user_id, window, category)
+    report_jobs.wait(job_id, app.config['EXPORT_WAIT_SECONDS'])
+    response = send_export(job_id, user_id)
+    if response is None:
+        return jsonify(export_job_json(job_id, user_id)), 202
+    return response
+
+@app.route('/api/exports', methods=['POST'])
+def create_export():
+    """Queue a PDF report (start_date, end_date, category); returns the job to poll"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    user_id = session['user_id']
+    try:
+        window, category = export_params(request.get_json(silent=True) or request.values)
+    except ValueError:
+        return jsonify({"error": "Invalid date range"}), 400
+    
+    job = export_job_json(submit_export(user_id, window, category), user_id)
+    return jsonify(job), 200 if job['status'] == 'ready' else 202
+
+@app.route('/api/exports/<int:job_id>')
+def export_status(job_id):
+    """Status of a report job"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    job = export_job_json(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/exports/<int:job_id>/download')
+def download_export(job_id):
+    """The finished report of a job"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    user_id = session['user_id']
+    response = send_export(job_id, user_id)
+    if response is not None:
+        return response
+    job = export_job_json(job_id, user_id)
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(job), 409
+
+DATA_EXPORT_STATS = {'exports': 0, 'rows': 0, 'bytes': 0, 'gzipped': 0}
+
+def stream_data_export(user_id, fmt, window, category, filename):
+    """Streaming response of expenses as fmt; user_id None exports every user.
+    
+    The query runs on its own connection rather than a pool slot, since a
+    slow client can keep the response open for a long time; it is closed
+    when the response is.
+    """
+    mimetype, extension, gzip_ok = dataexport.FORMATS[fmt]
+    sql, params, columns = dataexport.export_query(user_id, window, category)
+    conn = db.connect(app.config['DATABASE_PATH'], app.config['DB_PRAGMAS'])
+    cursor = conn.execute(sql, params)
+    with STATS_LOCK:
+        DATA_EXPORT_STATS['exports'] += 1
+    
+    def counted(chunks):
+        for rows in chunks:
+            with STATS_LOCK:
+                DATA_EXPORT_STATS['rows'] += len(rows)
+            yield rows
+    
+    def measured(body):
+        for data in body:
+            with STATS_LOCK:
+                DATA_EXPORT_STATS['bytes'] += len(data)
+            yield data
+    
+    body = dataexport.ENCODERS[fmt](counted(dataexport.fetch_chunks(cursor, app.config['DATA_EXPORT_CHUNK_ROWS'])), columns)
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.{extension}"',
+               'X-Accel-Buffering': 'no'}
+    if gzip_ok:
+        headers['Vary'] = 'Accept-Encoding'
+        if request.accept_encodings['gzip']:
+            body = dataexport.gzip_chunks(body, app.config['DATA_EXPORT_GZIP_LEVEL'])
+            headers['Content-Encoding'] = 'gzip'
+            with STATS_LOCK:
+                DATA_EXPORT_STATS['gzipped'] += 1
+    
+    response = Response(measured(body), mimetype=mimetype, headers=headers)
+    response.call_on_close(conn.close)
+    return response
+
+def data_export_args(args):
+    """(fmt, window, category) from format/start_date/end_date/category; all dates by default"""
+    fmt = args.get('format', 'csv').lower()
+    dataexport.check_format(fmt)
+    try:
+        window, category = export_params(args, this_month=False)
+    except ValueError:
+        raise ValueError("Invalid date range")
+    return fmt, window, category
+
+@app.route('/api/export')
+def api_export():
+    """Stream the user's expenses as CSV, NDJSON or Parquet (?format=&start_date=&end_date=&category=)"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        fmt, window, category = data_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    
+    return stream_data_export(session['user_id'], fmt, window, category, 'expenses')
+
+@app.route('/admin/export')
+def admin_export():
+    """Stream every user's expenses, with user_id, for warehouse loads; same parameters as /api/export"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute("SELECT is_admin FROM users WHERE id=?", (user_id,))
+    is_admin = c.fetchone()
+    
+    if not is_admin or is_admin[0] != 1:
+        return jsonify({"error": "Forbidden"}), 403
+    
+    try:
+        fmt, window, category = data_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    
+    return stream_data_export(None, fmt, window, category, 'expenses_all_users')
+
+@app.template_global()
+def receipt_url(expense_id, size=128):
+    """URL of an expense's receipt image scaled to one of receipts.THUMBNAIL_SIZES"""
+    return f"/receipts/{expense_id}?size={size}"
+
+def receipt_variant_path(user_id, receipt_file, size, fmt):
+    """File to serve for a receipt at `size` in `fmt`, deriving it into the cache if needed"""
+    source = os.path.join(app.config['UPLOAD_FOLDER'], receipt_file)
+    stem, ext = os.path.splitext(os.path.basename(receipt_file))
+    ext = ext.lstrip('.').lower()
+    if ext not in receipts.IMAGE_EXTENSIONS:
+        return source
+    if size >= app.config['RECEIPT_MAX_PX']:
+        # The stored variants are already RECEIPT_MAX_PX
+        sibling = os.path.join(os.path.dirname(source), f"{stem}.{'jpg' if fmt == 'jpeg' else fmt}")
+        if os.path.exists(sibling):
+            return sibling
+    key = os.path.join(str(user_id), f"{stem}_{size}.{fmt}")
+    return receipt_variants.get(key, lambda dest: receipts.render_variant(source, dest, size, fmt))
+
+@app.route('/receipts/<int:expense_id>')
+def serve_receipt(expense_id):
+    """Owner-only receipt download with ETag, Last-Modified and Range support"""
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT receipt_file FROM expenses WHERE id=? AND user_id=?", (expense_id, user_id))
+    row = c.fetchone()
+    if not row or not row[0]:
+        return jsonify({"error": "Not found"}), 404
+    
+    size = request.args.get('size', type=int) or max(receipts.THUMBNAIL_SIZES)
+    if size not in receipts.THUMBNAIL_SIZES:
+        return jsonify({"error": f"size must be one of {receipts.THUMBNAIL_SIZES}"}), 400
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    if fmt not in receipts.VARIANT_FORMATS:
+        return jsonify({"error": "format must be webp or jpeg"}), 400
+    
+    try:
+        path = receipt_variant_path(user_id, row[0], size, fmt)
+    except FileNotFoundError:
+        return jsonify({"error": "Not found"}), 404
+    
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and serves Range requests;
+    # the file goes out through wsgi.file_wrapper (sendfile) or X-Sendfile when enabled
+    response = send_file(os.path.abspath(path), conditional=True, etag=True,
+                         max_age=app.config['RECEIPT_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.vary.add('Accept')
+    return response
+
+@app.route('/api/receipts/<int:expense_id>')
+def receipt_status(expense_id):
+    """Processing status of an expense's receipt"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT receipt_status, receipt_file FROM expenses WHERE id=? AND user_id=?", (expense_id, session['user_id']))
+    row = c.fetchone()
+    if not row:
+        return jsonify({"error": "Not found"}), 404
+    
+    status = row[0] or ('ready' if row[1] else 'none')
+    return jsonify({"expense_id": expense_id, "status": status, "receipt_file": row[1]})
+
+@app.route('/api/latest-expense')
+def latest_expense():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    user_id = session['user_id']
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute("""
+        SELECT id, title, amount, created_at FROM expenses 
+        WHERE user_id=? 
+        ORDER BY created_at DESC 
+        LIMIT 1
+    """, (user_id,))
+    
+    expense = c.fetchone()
+    
+    if expense:
+        return jsonify({
+            "id": expense[0],
+            "title": expense[1],
+            "amount": expense[2],
+            "created_at": expense[3]
+        })
+    
+    return jsonify({"error": "No expenses found"}), 404
+
+
+def insights_payload(user_id):
+    """Month-to-date insight numbers for /api/insights"""
+    conn = get_db()
+    c = conn.cursor()
+
+    # Current month totals
+    current_month = datetime.now().strftime('%Y-%m')
+    c.execute("SELECT SUM(total) FROM user_monthly_category_totals WHERE user_id=? AND month=?", (user_id, current_month))
+    total = c.fetchone()[0] or 0
+
+    # Top category this month
+    c.execute("SELECT category, total FROM user_monthly_category_totals WHERE user_id=? AND month=? ORDER BY total DESC LIMIT 1", (user_id, current_month))
+    top = c.fetchone()
+    top_category = top[0] if top else None
+    top_amount = top[1] if top else 0
+
+    # Average daily (for days so far in month)
+    day_of_month = datetime.now().day
+    avg_daily = (total / day_of_month) if day_of_month > 0 else 0
+
+    insight = None
+    if top_category:
+        insight = f"This month you spent the most on {top_category} (₹{top_amount:.2f}). Total: ₹{total:.2f}. Avg/day: ₹{avg_daily:.2f}."
+
+    return {
+        'insight': insight,
+        'top_category': top_category,
+        'top_amount': round(top_amount, 2),
+        'monthly_total': round(total, 2),
+        'avg_daily': round(avg_daily, 2)
+    }
+
+
+@app.route('/api/expenses')
+def api_expenses():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    user_id = session['user_id']
+    try:
+        limit = min(max(int(request.args.get('limit', EXPENSE_PAGE_SIZE)), 1), 200)
+    except ValueError:
+        limit = EXPENSE_PAGE_SIZE
+
+    # Either bound may be given alone; the missing side is left open
+    window = None
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+    if start_date or end_date:
+        try:
+            window = db.range_window(start_date, end_date)
+        except ValueError:
+            return jsonify({"error": "Invalid date range"}), 400
+
+    try:
+        rows, next_cursor = fetch_expense_page(
+            user_id,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            category=request.args.get('category'),
+            q=request.args.get('q'),
+            window=window,
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    return jsonify({
+        'expenses': [
+            {
+                'id': r[0],
+                'title': r[1],
+                'amount': r[2],
+                'category': r[3],
+                'date': r[4],
+                'receipt_file': r[5],
+                'receipt_thumb': receipt_url(r[0]) if r[5] else None,
+                'is_duplicate_flagged': r[6],
+                'duplicate_reason': r[7]
+            } for r in rows
+        ],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/insights')
+def api_insights():
+    if 'user_id' not in session:
+        return jsonify({}), 401
+
+    user_id = session['user_id']
+    today = datetime.now().date().isoformat()
+    payload = response_cache.get_or_set(user_id, 'insights', {'today': today}, lambda: insights_payload(user_id))
+    return jsonify(payload)
+
+
+@app.route('/api/chart-data')
+def api_chart_data():
+    if 'user_id' not in session:
+        return jsonify({}), 401
+
+    user_id = session['user_id']
+    rng = request.args.get('range', 'week')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    q = request.args.get('q')
+    category = request.args.get('category')
+
+    # Determine date window
+    today = datetime.now().date()
+    if start_date and end_date:
+        try:
+            sd = datetime.fromisoformat(start_date).date()
+            ed = datetime.fromisoformat(end_date).date()
+        except Exception:
+            sd = today - timedelta(days=7)
+            ed = today
+    else:
+        if rng == 'today':
+            sd = ed = today
+        elif rng == 'week':
+            sd = today - timedelta(days=6)
+            ed = today
+        elif rng == 'month':
+            sd = today - timedelta(days=29)
+            ed = today
+        else:
+            sd = today - timedelta(days=29)
+            ed = today
+
+    try:
+        month_count = min(max(int(request.args.get('months', 6)), 1), 120)
+    except ValueError:
+        month_count = 6
+
+    params = {'start': sd, 'end': ed, 'category': category, 'months': month_count, 'today': today}
+    payload = response_cache.get_or_set(user_id, 'chart', params,
+                                        lambda: chart_payload(user_id, sd, ed, category, month_count, today))
+    return jsonify(payload)
+
+
+def chart_payload(user_id, sd, ed, category, month_count, today):
+    """Daily, category and monthly series for /api/chart-data"""
+    conn = get_db()
+    c = conn.cursor()
+
+    # Daily and per-category totals in one pass over the daily rollup
+    range_sql, range_params = db.date_clause(db.range_window(sd, ed))
+    c.execute(f"""
+        SELECT date, category, total FROM user_daily_totals
+        WHERE user_id=? AND {range_sql}
+    """, (user_id, *range_params))
+    date_map = {}
+    category_map = {}
+    for day, cat, amount in c.fetchall():
+        date_map[day] = date_map.get(day, 0) + (amount or 0)
+        if not category or cat == category:
+            category_map[cat] = category_map.get(cat, 0) + (amount or 0)
+    cats = sorted(category_map.items(), key=lambda item: item[1], reverse=True)
+    categories = [r[0] for r in cats]
+    category_amounts = [round(r[1] or 0, 2) for r in cats]
+
+    dates = []
+    daily_amounts = []
+    cur = sd
+    while cur <= ed:
+        key = cur.isoformat()
+        dates.append(key)
+        daily_amounts.append(round(date_map.get(key, 0) or 0, 2))
+        cur = cur + timedelta(days=1)
+
+    # Monthly summary for the last N calendar months (default 6)
+    first_month = db.add_months(today, -(month_count - 1))
+    trend_window = (first_month.strftime('%Y-%m'), db.add_months(today, 1).strftime('%Y-%m'))
+    month_sql, month_params = db.date_clause(trend_window, column='month')
+    c.execute(f"""
+        SELECT month, SUM(total) FROM user_monthly_category_totals
+        WHERE user_id=? AND {month_sql}
+        GROUP BY month
+    """, (user_id, *month_params))
+    month_map = dict(c.fetchall())
+    months = [db.add_months(first_month, i).strftime('%Y-%m') for i in range(month_count)]
+    month_amounts = [round(month_map.get(label) or 0, 2) for label in months]
+
+    return {
+        'categories': categories,
+        'category_amounts': category_amounts,
+        'dates': dates,
+        'daily_amounts': daily_amounts,
+        'months': months,
+        'month_amounts': month_amounts
+    }
+
+
+@app.route('/set-budget', methods=['POST'])
+def set_budget():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'not_logged_in'}), 401
+
+    user_id = session['user_id']
+    monthly_budget = request.form.get('monthly_budget') or request.json.get('monthly_budget') if request.is_json else request.form.get('monthly_budget')
+    daily_limit = request.form.get('daily_limit') or (request.json.get('daily_limit') if request.is_json else None)
+
+    try:
+        mb = float(monthly_budget) if monthly_budget not in (None, '') else None
+    except Exception:
+        mb = None
+
+    try:
+        dl = float(daily_limit) if daily_limit not in (None, '') else None
+    except Exception:
+        dl = None
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("UPDATE users SET monthly_budget=?, daily_limit=? WHERE id=?", (mb, dl, user_id))
+    conn.commit()
+    response_cache.invalidate(user_id, 'dashboard')
+
+    return jsonify({'success': True, 'monthly_budget': mb, 'daily_limit': dl})
+
+@app.route('/api/backup-now', methods=['POST'])
+def backup_now():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    success = create_backup()
+    return jsonify({"success": success, "message": "Backup created!" if success else "Backup failed!"})
+
+@app.route('/profile', methods=['GET', 'POST'])
+def profile():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        action = request.form.get('action')
+        
+        if action == 'update_info':
+            username = request.form.get('username')
+            email = request.form.get('email')
+            
+            conn = get_db()
+            c = conn.cursor()
+            c.execute("UPDATE users SET username=?, email=? WHERE id=?", (username, email, user_id))
+            conn.commit()
+            
+            session['username'] = username
+            return redirect('/profile')
+        
+        elif action == 'change_password':
+            old_password = request.form.get('old_password')
+            new_password = request.form.get('new_password')
+            confirm_password = request.form.get('confirm_password')
+            
+            if new_password != confirm_password:
+                return render_template('profile.html', msg="Passwords don't match!")
+            
+            if len(new_password) < 6:
+                return render_template('profile.html', msg="Password must be at least 6 characters!")
+            
+            conn = get_db()
+            c = conn.cursor()
+            c.execute("SELECT password FROM users WHERE id=?", (user_id,))
+            user = c.fetchone()
+            
+            if not user or not check_password_hash(user[0], old_password):
+                return render_template('profile.html', msg="Old password is incorrect!")
+            
+            hashed_password = generate_password_hash(new_password)
+            c.execute("UPDATE users SET password=? WHERE id=?", (hashed_password, user_id))
+            conn.commit()
+            
+            return render_template('profile.html', msg="Password changed successfully!")
+    
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT username, email FROM users WHERE id=?", (user_id,))
+    user = c.fetchone()
+    
+    return render_template('profile.html', username=user[0] if user else '', email=user[1] if user else '')
+
+@app.route('/forgot-password', methods=['GET', 'POST'])
+def forgot_password():
+    if request.method == 'POST':
+        email = request.form.get('email')
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT id FROM users WHERE email=?", (email,))
+        user = c.fetchone()
+        
+        if user:
+            token = secrets.token_urlsafe(32)
+            expires_at = (datetime.now() + timedelta(hours=1)).isoformat()
+            c.execute("INSERT INTO password_resets (user_id, token, expires_at) VALUES (?, ?, ?)", 
+                     (user[0], token, expires_at))
+            conn.commit()
+            
+            return render_template('forgot_password.html', msg=f"Reset link: /reset-password/{token}", token=token)
+        
+        return render_template('forgot_password.html', msg="Email not found!")
+    
+    return render_template('forgot_password.html')
+
+@app.route('/reset-password/<token>', methods=['GET', 'POST'])
+def reset_password(token):
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT user_id, expires_at FROM password_resets WHERE token=?", (token,))
+    reset = c.fetchone()
+    
+    if not reset:
+        return render_template('reset_password.html', msg="Invalid or expired token!")
+    
+    user_id, expires_at = reset
+    if datetime.fromisoformat(expires_at) < datetime.now():
+        return render_template('reset_password.html', msg="Token expired! Request a new one.")
+    
+    if request.method == 'POST':
+        new_password = request.form.get('new_password')
+        confirm_password = request.form.get('confirm_password')
+        
+        if new_password != confirm_password:
+            return render_template('reset_password.html', msg="Passwords don't match!")
+        
+        if len(new_password) < 6:
+            return render_template('reset_password.html', msg="Password must be at least 6 characters!")
+        
+        hashed_password = generate_password_hash(new_password)
+        c.execute("UPDATE users SET password=? WHERE id=?", (hashed_password, user_id))
+        c.execute("DELETE FROM password_resets WHERE token=?", (token,))
+        conn.commit()
+        
+        return render_template('reset_password.html', msg="Password reset successfully! <a href='/login'>Login here</a>")
+    
+    return render_template('reset_password.html')
+
+@app.route('/delete/<int:expense_id>')
+def delete_expense(expense_id):
+    """Delete an expense by ID"""
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    user_id = session['user_id']
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Verify expense belongs to user
+        c.execute("SELECT user_id, date, category, amount, is_duplicate_flagged, receipt_sha256 FROM expenses WHERE id=?", (expense_id,))
+        expense = c.fetchone()
+        
+        if not expense or expense[0] != user_id:
+            return redirect('/dashboard')
+        
+        # Delete the expense
+        c.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
+        if not expense[4] and expense[1]:
+            update_rollups(c, user_id, expense[1], expense[2], -(expense[3] or 0), count=-1)
+        release_receipt_blob(c, user_id, expense[5])
+        bump_data_version(c, user_id)
+        conn.commit()
+        response_cache.invalidate(user_id, 'dashboard', 'insights', 'chart')
+        
+    except Exception as e:
+        print(f"Error deleting expense: {e}")
+    
+    return redirect('/dashboard')
+
+# ==================== ERROR HANDLERS ====================
+
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    limit = g.get('upload_limit', app.config['RECEIPT_MAX_BYTES'])
+    return f"File too large! Maximum size is {limit / (1024 * 1024):g}MB.", 413
+
+@app.errorhandler(415)
+def unsupported_media_type(error):
+    return "Unsupported file! Receipts must be JPEG, PNG, GIF or PDF files.", 415
+
+if __name__ == '__main__':
+    with app.app_context():
+        init_db()
+        resume_receipts()
+        resume_exports()
+    start_scheduler()
+    app.run(debug=True)
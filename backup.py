@@ -0,0 +1,295 @@
+"""Online SQLite backups into a deduplicated, content-addressed store.
+
+copy_database snapshots a live database through sqlite3's backup API a few
+pages at a time, pausing between steps so request traffic keeps the
+database. BackupStore then splits the snapshot into fixed-size chunks named
+by their SHA-256 and writes only chunks it doesn't already hold, so nightly
+backups cost roughly the pages that changed. Each snapshot is a JSON
+manifest listing its chunks; retention drops manifests (GFS:
+daily/weekly/monthly) and gc deletes chunks no manifest references.
+
+Layout under the store root:
+
+    chunks/ab/ab12...   one chunk, 1-byte codec header + (compressed) data
+    snapshots/<id>.json manifest: size, whole-file sha256, chunk list
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# Chunk codecs, recorded in each chunk's first byte so settings can change
+CODECS = {None: b'N', 'gzip': b'G', 'zstd': b'Z'}
+
+
+class BackupRestarted(Exception):
+    """Raised when concurrent writes keep restarting a stepped backup"""
+
+
+class BackupCorrupt(Exception):
+    """Raised when a snapshot fails verification on restore"""
+
+
+def copy_database(src, dest_path, pages=256, sleep=0.005, max_restarts=3):
+    """Copy the database behind `src` to dest_path; returns (steps, restarts).
+
+    SQLite restarts a backup whenever another connection writes to the
+    source. After max_restarts the remainder is taken in a single step so
+    a busy database can't keep the backup from ever finishing.
+    """
+    state = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+    def progress(status, remaining, total):
+        state['steps'] += 1
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise BackupRestarted()
+        state['remaining'] = remaining
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    dest = sqlite3.connect(dest_path)
+    try:
+        try:
+            src.backup(dest, pages=pages, progress=progress)
+        except BackupRestarted:
+            src.backup(dest, pages=-1)
+    finally:
+        dest.close()
+    return state['steps'], state['restarts']
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("BACKUP_COMPRESSION=zstd but the 'zstandard' package is not installed")
+    return zstandard
+
+
+def encode_chunk(data, compression):
+    if compression == 'gzip':
+        return CODECS['gzip'] + zlib.compress(data, 6)
+    if compression == 'zstd':
+        return CODECS['zstd'] + _zstd().ZstdCompressor(level=3).compress(data)
+    if compression is None:
+        return CODECS[None] + data
+    raise ValueError(f"Unknown backup compression: {compression}")
+
+
+def decode_chunk(blob):
+    codec, payload = blob[:1], blob[1:]
+    if codec == CODECS['gzip']:
+        return zlib.decompress(payload)
+    if codec == CODECS['zstd']:
+        return _zstd().ZstdDecompressor().decompress(payload)
+    if codec == CODECS[None]:
+        return payload
+    raise BackupCorrupt(f"Unknown chunk codec {codec!r}")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.partial'
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def gfs_retained(snapshots, daily=7, weekly=4, monthly=12):
+    """Ids to keep: newest snapshot of each of the last `daily` days, `weekly` ISO weeks and `monthly` months"""
+    ordered = sorted(snapshots, key=lambda s: s['created_at'], reverse=True)
+    keep = {ordered[0]['id']} if ordered else set()
+    buckets = (
+        (daily, lambda when: when.date()),
+        (weekly, lambda when: when.isocalendar()[:2]),
+        (monthly, lambda when: (when.year, when.month)),
+    )
+    for count, bucket in buckets:
+        seen = set()
+        for snapshot in ordered:
+            key = bucket(datetime.fromisoformat(snapshot['created_at']))
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep.add(snapshot['id'])
+    return keep
+
+
+class BackupStore:
+    """Snapshots stored as SHA-256 addressed chunks shared between backups"""
+
+    def __init__(self, root, chunk_size=64 * 1024, compression=None):
+        if compression not in CODECS:
+            raise ValueError(f"Unknown backup compression: {compression}")
+        self.root = root
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.snapshot_dir = os.path.join(root, 'snapshots')
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self._lock = threading.Lock()
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def manifest_path(self, snapshot_id):
+        return os.path.join(self.snapshot_dir, f"{snapshot_id}.json")
+
+    def add(self, path, created=None):
+        """Store the file at path as a new snapshot; returns its stats"""
+        created = created or datetime.now()
+        snapshot_id = created.strftime('%Y%m%d_%H%M%S_%f')
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = new_chunks = stored_bytes = 0
+
+        with self._lock, open(path, 'rb') as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                size += len(data)
+                file_hash.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                target = self.chunk_path(digest)
+                if not os.path.exists(target):
+                    blob = encode_chunk(data, self.compression)
+                    _write_atomic(target, blob)
+                    new_chunks += 1
+                    stored_bytes += len(blob)
+
+            manifest = {
+                'id': snapshot_id,
+                'created_at': created.isoformat(),
+                'size': size,
+                'sha256': file_hash.hexdigest(),
+                'chunk_size': self.chunk_size,
+                'chunks': chunks,
+            }
+            _write_atomic(self.manifest_path(snapshot_id), json.dumps(manifest).encode())
+
+        return {
+            'id': snapshot_id,
+            'bytes': size,
+            'chunks': len(chunks),
+            'new_chunks': new_chunks,
+            'stored_bytes': stored_bytes,
+        }
+
+    def manifest(self, snapshot_id):
+        with open(self.manifest_path(snapshot_id)) as f:
+            return json.load(f)
+
+    def snapshots(self):
+        """Manifests, newest first"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        manifests = [self.manifest(name[:-5]) for name in os.listdir(self.snapshot_dir) if name.endswith('.json')]
+        return sorted(manifests, key=lambda m: m['created_at'], reverse=True)
+
+    def read_chunk(self, digest):
+        """Chunk contents, checked against the hash they are stored under"""
+        try:
+            with open(self.chunk_path(digest), 'rb') as f:
+                data = decode_chunk(f.read())
+        except FileNotFoundError:
+            raise BackupCorrupt(f"Missing chunk {digest}")
+        except zlib.error as e:
+            raise BackupCorrupt(f"Unreadable chunk {digest}: {e}")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise BackupCorrupt(f"Chunk {digest} does not match its hash")
+        return data
+
+    def restore(self, snapshot_id, dest_path):
+        """Rebuild a snapshot at dest_path, verifying every chunk, the file hash and SQLite integrity"""
+        manifest = self.manifest(snapshot_id)
+        partial = dest_path + '.partial'
+        file_hash = hashlib.sha256()
+        try:
+            with open(partial, 'wb') as out:
+                for digest in manifest['chunks']:
+                    data = self.read_chunk(digest)
+                    file_hash.update(data)
+                    out.write(data)
+            if file_hash.hexdigest() != manifest['sha256']:
+                raise BackupCorrupt(f"Snapshot {snapshot_id} does not match its recorded sha256")
+
+            check = sqlite3.connect(partial)
+            try:
+                result = check.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                check.close()
+            if result != 'ok':
+                raise BackupCorrupt(f"Snapshot {snapshot_id} failed integrity_check: {result}")
+
+            os.replace(partial, dest_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return manifest
+
+    def prune(self, daily=7, weekly=4, monthly=12):
+        """Drop snapshots outside the GFS policy; returns removed snapshot ids"""
+        with self._lock:
+            snapshots = self.snapshots()
+            keep = gfs_retained(snapshots, daily, weekly, monthly)
+            removed = [s['id'] for s in snapshots if s['id'] not in keep]
+            for snapshot_id in removed:
+                os.remove(self.manifest_path(snapshot_id))
+        return removed
+
+    def gc(self, grace_seconds=3600):
+        """Delete chunks no snapshot references; returns (chunks removed, bytes freed).
+
+        Chunks younger than grace_seconds are left alone in case another
+        process is still writing the manifest that will reference them.
+        """
+        with self._lock:
+            referenced = set()
+            for manifest in self.snapshots():
+                referenced.update(manifest['chunks'])
+            cutoff = time.time() - grace_seconds
+            removed = freed = 0
+            if not os.path.isdir(self.chunk_dir):
+                return removed, freed
+            for prefix in os.listdir(self.chunk_dir):
+                prefix_dir = os.path.join(self.chunk_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    path = os.path.join(prefix_dir, name)
+                    if name in referenced or os.path.getmtime(path) > cutoff:
+                        continue
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+        return removed, freed
+
+
+def backup_database(src, store, pages=256, sleep=0.005):
+    """Snapshot `src` into `store` and report what it cost"""
+    os.makedirs(store.root, exist_ok=True)
+    snapshot = os.path.join(store.root, f".snapshot_{os.getpid()}_{threading.get_ident()}.db")
+    started = time.perf_counter()
+    try:
+        steps, restarts = copy_database(src, snapshot, pages=pages, sleep=sleep)
+        result = store.add(snapshot)
+    finally:
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+    duration = time.perf_counter() - started
+
+    result.update({
+        'compression': store.compression or 'none',
+        'duration_ms': round(duration * 1000, 1),
+        'throughput_mbps': round(result['bytes'] / (1024 * 1024) / duration, 2) if duration else 0.0,
+        'steps': steps,
+        'restarts': restarts,
+    })
+    return result
@@ -0,0 +1,148 @@
+"""
+add_expense load test.
+
+Registers one user per client thread (each with some expense history and a
+daily limit), then has every thread POST /add as fast as it can through the
+Flask test client and reports adds/sec and latency percentiles. With
+--baseline REV the same load is also run against the app.py of an older
+revision (checked out with git archive into a scratch directory), so the
+write path can be compared before and after a change:
+
+    python bench_add_expense.py [--threads 8] [--adds 500] [--baseline HEAD~1]
+
+Each run uses a fresh database in a fresh process. Mail is queued to the
+outbox as usual but the scheduler and mail workers are not started.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Shopping', 'Entertainment', 'Health', 'Other']
+TITLES = ['Lunch', 'Uber to airport', 'Electricity bill', 'Groceries', 'Movie night', 'Pharmacy']
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def checkout(rev):
+    """Directory holding the tree of `rev`"""
+    target = tempfile.mkdtemp(prefix=f"bench_{rev.replace('/', '_')}_")
+    archive = subprocess.run(['git', 'archive', rev], cwd=HERE, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return target
+
+
+def seed(app, get_db, threads, history):
+    rng = random.Random(0)
+    today = date.today()
+    with app.app_context():
+        conn = get_db()
+        for user_id in range(1, threads + 1):
+            conn.execute("INSERT INTO users (id, username, password, email, daily_limit) VALUES (?, ?, 'x', ?, 5000)",
+                         (user_id, f"bench{user_id}", f"bench{user_id}@example.com"))
+            rows = []
+            for _ in range(history):
+                day = (today - timedelta(days=rng.randrange(365))).isoformat()
+                rows.append((user_id, rng.choice(TITLES), round(rng.uniform(10, 500), 2), rng.choice(CATEGORIES), day, day + 'T12:00:00'))
+            conn.executemany("""
+                INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            """, rows)
+            for row in rows:
+                conn.execute("""
+                    INSERT INTO user_daily_totals (user_id, date, category, total, count) VALUES (?, ?, ?, ?, 1)
+                    ON CONFLICT(user_id, date, category) DO UPDATE SET total = total + excluded.total, count = count + 1
+                """, (user_id, row[4], row[3], row[2]))
+                conn.execute("""
+                    INSERT INTO user_monthly_category_totals (user_id, month, category, total, count) VALUES (?, ?, ?, ?, 1)
+                    ON CONFLICT(user_id, month, category) DO UPDATE SET total = total + excluded.total, count = count + 1
+                """, (user_id, row[4][:7], row[3], row[2]))
+        conn.commit()
+
+
+def run(source, threads, adds, history):
+    """Load one app tree in this (fresh) process; returns (seconds, latencies in ms, failures, expenses added)"""
+    tmp_dir = tempfile.mkdtemp()
+    os.environ['DATABASE_PATH'] = os.path.join(tmp_dir, 'bench.db')
+    os.chdir(tmp_dir)
+    sys.path.insert(0, source)
+    from app import app, init_db
+    from db import get_db
+
+    with app.app_context():
+        init_db()
+    seed(app, get_db, threads, history)
+
+    latencies = [[] for _ in range(threads)]
+    failures = [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def client(index):
+        rng = random.Random(index)
+        user_id = index + 1
+        cl = app.test_client()
+        with cl.session_transaction() as session:
+            session['user_id'] = user_id
+        today = date.today().isoformat()
+        start.wait()
+        for i in range(adds):
+            form = {'title': f"{rng.choice(TITLES)} {i}", 'amount': f"{rng.uniform(10, 500):.2f}",
+                    'category': rng.choice(CATEGORIES), 'date': today}
+            began = time.perf_counter()
+            response = cl.post('/add', data=form)
+            latencies[index].append((time.perf_counter() - began) * 1000)
+            if response.status_code != 302:
+                failures[index] += 1
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+
+    with app.app_context():
+        stored = get_db().execute("SELECT COUNT(*) FROM expenses").fetchone()[0] - threads * history
+    return elapsed, sorted(ms for thread in latencies for ms in thread), sum(failures), stored
+
+
+def measure(label, source, threads, adds, history):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        elapsed, latencies, failures, stored = pool.submit(run, source, threads, adds, history).result()
+    total = threads * adds
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    print(f"{label:<12} {threads:>3} threads  {total:>6} adds  {elapsed:7.2f}s  {total / elapsed:8.1f} adds/s  "
+          f"p50 {pct(0.50):6.1f} ms  p95 {pct(0.95):6.1f} ms  p99 {pct(0.99):6.1f} ms  "
+          f"{failures} failed  {stored} stored")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--adds', type=int, default=500, help="POSTs per thread")
+    parser.add_argument('--history', type=int, default=2000, help="existing expenses per user")
+    parser.add_argument('--baseline', help="git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    if args.baseline:
+        measure(args.baseline, checkout(args.baseline), args.threads, args.adds, args.history)
+    measure("working tree", HERE, args.threads, args.adds, args.history)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
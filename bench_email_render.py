@@ -0,0 +1,70 @@
+"""
+Email rendering benchmark.
+
+Renders N daily and weekly summaries (default 100,000 each) through the
+compiled email templates, one render_many batch per type as the summary job
+does, and reports renders/sec and bytes produced, so the cost of a large
+summary run can be tracked over time.
+
+    python bench_email_render.py [N]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from app import email_renderer, UserSummary
+
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Shopping', 'Entertainment', 'Health', 'Other']
+
+
+def make_summaries(n):
+    rng = random.Random(7)
+    summaries = []
+    for user_id in range(1, n + 1):
+        categories = rng.sample(CATEGORIES, rng.randrange(len(CATEGORIES) + 1))
+        summaries.append(UserSummary(
+            user_id=user_id,
+            username=f"user{user_id}",
+            email=f"user{user_id}@example.com",
+            total=round(rng.uniform(0, 5000), 2) if categories else 0.0,
+            count=rng.randrange(1, 40) if categories else 0,
+            categories=categories,
+            top_category=categories[0] if categories else None,
+            top_total=round(rng.uniform(0, 1000), 2) if categories else 0.0,
+        ))
+    return summaries
+
+
+def bench(name, summaries, email_type, **shared):
+    start = time.perf_counter()
+    size = 0
+    for subject, html_body, text_body in email_renderer.render_many(
+            email_type, ({'summary': summary} for summary in summaries), **shared):
+        size += len(subject) + len(html_body) + len(text_body)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {len(summaries):>8} emails  {elapsed:7.2f}s  "
+          f"{len(summaries) / elapsed:>9,.0f}/s  {size / len(summaries):6.0f} chars/email")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    today = date.today()
+    week_ago = today - timedelta(days=7)
+    summaries = make_summaries(n)
+
+    # First render compiles the templates; keep it out of the timings
+    email_renderer.render('daily_summary', summary=summaries[0], day=today)
+    email_renderer.render('weekly_summary', summary=summaries[0], week_ago=week_ago, today=today)
+
+    bench("daily_summary", summaries, 'daily_summary', day=today)
+    bench("weekly_summary", summaries, 'weekly_summary', week_ago=week_ago, today=today)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
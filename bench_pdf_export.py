@@ -0,0 +1,107 @@
+"""
+PDF export benchmark.
+
+Seeds a scratch database with one user per size (default 10k, 100k and 1M
+expenses spread over several years), renders each user's full-history
+report with reports.write_report and reports time, rows/sec, pages, file
+size and the peak RSS of the process that rendered it. Each export runs in
+a fresh process so one size's peak can't hide another's. The smallest size
+is also run through the old fetchall() + single platypus Table export as a
+baseline.
+
+reportlab is much faster with its optional C accelerator installed
+(pip install rl_accel); compare numbers from the same setup.
+
+    python bench_pdf_export.py [N ...]
+"""
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_PATH', os.path.join(tmp_dir, 'bench.db'))
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table
+
+from app import app, init_db
+from db import get_db
+import reports
+
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Shopping', 'Entertainment', 'Health', 'Other']
+TITLES = ['Lunch', 'Uber to airport', 'Electricity bill', 'Groceries at the corner market', 'Movie night', 'Pharmacy']
+
+
+def seed(conn, user_id, n):
+    rng = random.Random(user_id)
+    start = date(2018, 1, 1)
+    conn.execute("INSERT INTO users (id, username, password) VALUES (?, ?, 'x')", (user_id, f"bench{user_id}"))
+    for offset in range(0, n, 50_000):
+        rows = []
+        for _ in range(min(50_000, n - offset)):
+            day = (start + timedelta(days=rng.randrange(2500))).isoformat()
+            rows.append((user_id, rng.choice(TITLES), round(rng.uniform(1, 5000), 2),
+                         rng.choice(CATEGORIES), day, day + 'T12:00:00'))
+        conn.executemany("""
+            INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+        """, rows)
+    conn.commit()
+
+
+def legacy_report(conn, path, user_id):
+    """The export before the streaming engine: every row in one Table, built in one go"""
+    sql, params = reports.expense_query(user_id)
+    data = [['Title', 'Category', 'Amount', 'Date']]
+    data += [[r[0], r[2], f'₹{r[1]:.2f}', r[3]] for r in conn.execute(sql, params).fetchall()]
+    doc = SimpleDocTemplate(path, pagesize=letter)
+    doc.build([Table(data, colWidths=[2 * inch, 1.5 * inch, 1.5 * inch, 1.5 * inch], repeatRows=1)])
+
+
+def export(name, user_id, path):
+    """Render one report in this (fresh) process; returns (seconds, pages, peak RSS in MB)"""
+    with app.app_context():
+        conn = get_db()
+        started = time.perf_counter()
+        if name == 'legacy':
+            legacy_report(conn, path, user_id)
+            pages = '-'
+        else:
+            pages = reports.write_report(conn, path, user_id, chunk_size=app.config['REPORT_CHUNK_ROWS'])['pages']
+        elapsed = time.perf_counter() - started
+    # ru_maxrss is in KB on Linux
+    return elapsed, pages, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(name, user_id, n):
+    path = os.path.join(tmp_dir, f"{name}_{n}.pdf")
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        elapsed, pages, peak = pool.submit(export, name, user_id, path).result()
+    print(f"{name:<8} {n:>9,} rows  {elapsed:8.2f}s  {n / elapsed:>9,.0f} rows/s  "
+          f"{pages:>6} pages  {os.path.getsize(path) / 1024 / 1024:7.1f} MB  peak RSS {peak:7.1f} MB")
+    os.remove(path)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        for user_id, n in enumerate(sizes, start=1):
+            seed(conn, user_id, n)
+
+    for user_id, n in enumerate(sizes, start=1):
+        measure("stream", user_id, n)
+    measure("legacy", 1, sizes[0])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
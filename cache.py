@@ -0,0 +1,167 @@
+"""Per-user read-through cache for dashboard, insights and chart payloads.
+
+Entries are keyed by (endpoint, user_id, generation, normalized params).
+Writes invalidate by bumping the (endpoint, user_id) generation, so stale
+entries are never read again and simply age out of the backend.
+
+The default backend is an in-process LRU with TTL. Set CACHE_URL to a
+Redis-compatible server (requires the optional ``redis`` package) to
+share the cache between workers.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """Thread-safe LRU + TTL store for a single process"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def incr(self, key):
+        # Generations live outside the LRU so they can never be evicted
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class RedisBackend:
+    """Backend for any redis-py compatible client (Redis, KeyDB, a local stand-in...)"""
+
+    def __init__(self, client, prefix='expense-cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def counter(self, key):
+        raw = self.client.get(self.prefix + key)
+        return int(raw) if raw is not None else 0
+
+    def stats(self):
+        # Evictions happen server-side; see INFO stats evicted_keys
+        return {'backend': 'redis'}
+
+
+class ResponseCache:
+    """Read-through cache with per-user, per-endpoint invalidation"""
+
+    def __init__(self, backend, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        # Request threads share the counters; the backend has its own locking
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(params):
+        """Stable string for request params, ignoring empty values and order"""
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if v not in (None, ''))
+        return json.dumps(items, separators=(',', ':'))
+
+    def key(self, user_id, endpoint, params):
+        generation = self.backend.counter(f"gen:{endpoint}:{user_id}")
+        return f"{endpoint}:{user_id}:{generation}:{self.normalize(params)}"
+
+    def get_or_set(self, user_id, endpoint, params, loader):
+        """Return the cached payload, or call loader() and cache its result"""
+        key = self.key(user_id, endpoint, params)
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, user_id, *endpoints):
+        """Drop every cached payload of `endpoints` for one user"""
+        for endpoint in endpoints:
+            self.backend.incr(f"gen:{endpoint}:{user_id}")
+            with self._lock:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        lookups = hits + misses
+        data = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'invalidations': invalidations,
+            'ttl': self.ttl,
+        }
+        data.update(self.backend.stats())
+        return data
+
+
+def init_app(app):
+    """Build the response cache from CACHE_URL / CACHE_TTL / CACHE_MAX_ENTRIES"""
+    app.config.setdefault('CACHE_URL', None)
+    app.config.setdefault('CACHE_TTL', 60)
+    app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+    if app.config['CACHE_URL']:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL is set but the 'redis' package is not installed")
+        backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_URL']))
+    else:
+        backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+    return ResponseCache(backend, ttl=app.config['CACHE_TTL'])
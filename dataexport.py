@@ -0,0 +1,155 @@
+"""Machine-readable expense exports (CSV, NDJSON, Parquet) streamed from a cursor.
+
+The export query is stepped with fetchmany() and each chunk of rows is
+encoded and handed to the response as soon as it is ready, so memory stays
+at one chunk however many rows are exported. CSV and NDJSON can be gzipped
+on the fly with gzip_chunks. Parquet writes one row group per chunk and needs
+the optional 'pyarrow' package; it is already compressed, so it is never
+gzipped again.
+"""
+import csv
+import io
+import json
+import zlib
+
+import db
+
+COLUMNS = ('id', 'date', 'title', 'amount', 'category', 'created_at', 'is_duplicate_flagged', 'duplicate_reason')
+ALL_USERS_COLUMNS = ('user_id',) + COLUMNS
+
+# format -> (mimetype, file extension, gzip on request)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', True),
+    'ndjson': ('application/x-ndjson', 'ndjson', True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', False),
+}
+
+
+def export_query(user_id=None, window=None, category=None):
+    """(SQL, params, columns) for one user's expenses by date, or every user's by id when user_id is None.
+
+    A user's export walks (user_id, date); the unary + keeps a category
+    filter from switching to the category index, as in reports.expense_query.
+    The all-users export is a rowid scan, so warehouse loads see rows in
+    insertion order.
+    """
+    columns = COLUMNS if user_id is not None else ALL_USERS_COLUMNS
+    where, params = [], ()
+    if user_id is not None:
+        where.append("user_id=?")
+        params += (user_id,)
+    if window:
+        window_sql, window_params = db.date_clause(window)
+        where.append(window_sql)
+        params += window_params
+    if category:
+        where.append("+category=?")
+        params += (category,)
+    sql = f"SELECT {', '.join(columns)} FROM expenses"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY date, id" if user_id is not None else " ORDER BY id"
+    return sql, params, columns
+
+
+def fetch_chunks(cursor, chunk_size):
+    """Rows of an executed cursor, chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_chunks(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(chunks, columns):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs the 'pyarrow' package, which is not installed")
+    return pyarrow
+
+
+class _Drain:
+    """Write-only file for ParquetWriter whose bytes are taken out after each row group"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(chunks, columns):
+    pa = _pyarrow()
+    types = {'id': pa.int64(), 'user_id': pa.int64(), 'amount': pa.float64(), 'is_duplicate_flagged': pa.int8()}
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in columns])
+    sink = _Drain()
+    writer = pa.parquet.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)], schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    # The footer (schema and row group index) is written on close
+    yield sink.take()
+
+
+ENCODERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks, 'parquet': parquet_chunks}
+
+
+def check_format(fmt):
+    """Raise ValueError for an unknown format, RuntimeError if its dependency is missing"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        _pyarrow()
+
+
+def gzip_chunks(chunks, level=6):
+    """gzip-compress a byte stream as it is produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
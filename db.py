@@ -0,0 +1,524 @@
+"""SQLite connection management for the expense tracker.
+
+Connections come from a bounded pool. Each app context (one per
+request, or one per scheduler job run) borrows a single connection on
+first use, keeps it on ``g`` and hands it back on teardown.
+"""
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from flask import g
+
+DEFAULT_DB_PATH = 'database.db'
+
+# PRAGMA profiles. journal_mode is persistent and applied once by
+# apply_profile(); everything else is per-connection and set whenever the
+# pool opens a connection.
+PRAGMA_PROFILES = {
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -20000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000,
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'wal_autocheckpoint': 1000,
+    },
+}
+
+PERSISTENT_PRAGMAS = ('journal_mode',)
+
+# What PRAGMA queries report back for the symbolic values above
+PRAGMA_ALIASES = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+
+# Versioned schema migrations, tracked in PRAGMA user_version. Append only:
+# migration N (1-based) runs once on databases whose user_version < N.
+MIGRATIONS = [
+    # 1: secondary indexes for the per-user date/category hot paths
+    [
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_category_amount ON expenses(user_id, category, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_created ON expenses(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_flagged_date ON expenses(date) WHERE is_duplicate_flagged=1",
+        "ANALYZE expenses",
+    ],
+    # 2: rollup tables for non-flagged expenses, backfilled from history
+    [
+        """
+        CREATE TABLE IF NOT EXISTS user_daily_totals(
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(user_id, date, category)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_monthly_category_totals(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(user_id, month, category)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR REPLACE INTO user_daily_totals (user_id, date, category, total, count)
+        SELECT user_id, date, COALESCE(category, 'Other'), SUM(amount), COUNT(*)
+        FROM expenses WHERE is_duplicate_flagged=0 AND date IS NOT NULL
+        GROUP BY user_id, date, COALESCE(category, 'Other')
+        """,
+        """
+        INSERT OR REPLACE INTO user_monthly_category_totals (user_id, month, category, total, count)
+        SELECT user_id, substr(date, 1, 7), COALESCE(category, 'Other'), SUM(amount), COUNT(*)
+        FROM expenses WHERE is_duplicate_flagged=0 AND date IS NOT NULL
+        GROUP BY user_id, substr(date, 1, 7), COALESCE(category, 'Other')
+        """,
+    ],
+    # 3: budget alert levels already sent per user/month, and a month-first
+    # covering index so the alert job reads one month of rollups for all users
+    [
+        """
+        CREATE TABLE IF NOT EXISTS budget_alerts_sent(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            sent_at TEXT NOT NULL,
+            PRIMARY KEY(user_id, month, level)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_monthly_totals_month ON user_monthly_category_totals(month, user_id, total)",
+    ],
+    # 4: durable outbox for mail, drained by the mail queue workers
+    [
+        """
+        CREATE TABLE IF NOT EXISTS outbox(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html_body TEXT NOT NULL,
+            user_id INTEGER,
+            email_type TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            claimed_at TEXT,
+            last_error TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)",
+    ],
+    # 5: plaintext alternative for queued mail
+    [
+        "ALTER TABLE outbox ADD COLUMN text_body TEXT",
+    ],
+    # 6: what each backup cost
+    [
+        "ALTER TABLE backup_logs ADD COLUMN compression TEXT",
+        "ALTER TABLE backup_logs ADD COLUMN bytes INTEGER",
+        "ALTER TABLE backup_logs ADD COLUMN stored_bytes INTEGER",
+        "ALTER TABLE backup_logs ADD COLUMN duration_ms REAL",
+        "ALTER TABLE backup_logs ADD COLUMN throughput_mbps REAL",
+    ],
+    # 7: receipt processing state (receipt_upload is the staged raw file)
+    [
+        "ALTER TABLE expenses ADD COLUMN receipt_status TEXT",
+        "ALTER TABLE expenses ADD COLUMN receipt_upload TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_receipt_pending ON expenses(receipt_status) WHERE receipt_status IN ('pending', 'failed')",
+    ],
+    # 8: per-user receipt upload limit (NULL = RECEIPT_MAX_BYTES)
+    [
+        "ALTER TABLE users ADD COLUMN receipt_limit_mb REAL",
+    ],
+    # 9: content-addressed receipts; refcount = expenses pointing at the blob
+    [
+        """
+        CREATE TABLE IF NOT EXISTS receipt_blobs(
+            user_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            source_sha256 TEXT,
+            receipt_file TEXT NOT NULL,
+            bytes INTEGER,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            released_at TEXT,
+            PRIMARY KEY(user_id, sha256)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_receipt_blobs_source ON receipt_blobs(user_id, source_sha256)",
+        "CREATE INDEX IF NOT EXISTS idx_receipt_blobs_released ON receipt_blobs(released_at) WHERE refcount <= 0",
+        "ALTER TABLE expenses ADD COLUMN receipt_sha256 TEXT",
+    ],
+    # 10: background PDF exports, cached until the user's data_version moves on
+    [
+        "ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS export_jobs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            cache_key TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT,
+            category TEXT,
+            data_version INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            report_file TEXT NOT NULL,
+            rows INTEGER,
+            pages INTEGER,
+            bytes INTEGER,
+            elapsed_ms REAL,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_key ON export_jobs(user_id, cache_key)",
+    ],
+    # 11: flagged expenses are read per user and month, so key the partial index on (user_id, date)
+    [
+        "DROP INDEX IF EXISTS idx_expenses_flagged_date",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_flagged_date ON expenses(user_id, date) WHERE is_duplicate_flagged=1",
+    ],
+    # 12: the dashboard lists a user's savings goals by deadline
+    [
+        "CREATE INDEX IF NOT EXISTS idx_savings_goals_user_deadline ON savings_goals(user_id, deadline)",
+    ],
+    # 13: at most one live (non-failed) report job per user and cache key
+    [
+        """
+        UPDATE export_jobs SET status='failed', error='superseded'
+        WHERE status != 'failed' AND id NOT IN (
+            SELECT MAX(id) FROM export_jobs WHERE status != 'failed' GROUP BY user_id, cache_key
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_export_jobs_live_key ON export_jobs(user_id, cache_key) WHERE status != 'failed'",
+    ],
+]
+
+pool = None
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout"""
+
+
+def connect(path, pragmas=None):
+    """Open a SQLite connection usable from any thread with per-connection PRAGMAs"""
+    pragmas = pragmas or {}
+    timeout = pragmas.get('busy_timeout', 5000) / 1000
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    for name, value in pragmas.items():
+        if name not in PERSISTENT_PRAGMAS:
+            conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def resolve_profile(name, overrides=None):
+    """PRAGMA settings for a named profile with optional per-key overrides"""
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown DB pragma profile: {name}")
+    pragmas = dict(PRAGMA_PROFILES[name])
+    pragmas.update(overrides or {})
+    return pragmas
+
+
+def apply_profile(conn, pragmas):
+    """Set persistent PRAGMAs (journal mode) and report what took effect.
+
+    Returns {name: (requested, actual, ok)} for every setting in the
+    profile, as read back from the connection.
+    """
+    for name in PERSISTENT_PRAGMAS:
+        if name in pragmas:
+            conn.execute(f"PRAGMA {name}={pragmas[name]}")
+    return check_pragmas(conn, pragmas)
+
+
+def check_pragmas(conn, pragmas):
+    """Read back each PRAGMA and compare it with the requested value"""
+    report = {}
+    for name, requested in pragmas.items():
+        actual = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        expected = PRAGMA_ALIASES.get(name, {}).get(str(requested).upper(), requested)
+        if isinstance(expected, str):
+            ok = str(actual).lower() == expected.lower()
+        else:
+            ok = actual == expected
+        report[name] = (requested, actual, ok)
+    return report
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations in order; returns the new schema version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(migrations, start=1):
+        if number <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={number}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        version = number
+    return version
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def full_scans(plan):
+    """Plan lines that walk a whole table or index instead of searching it.
+
+    Scans of a subquery the plan materialized first only read that
+    subquery's own (already searched) result, so they don't count.
+    """
+    derived = {line.split()[1] for line in plan if line.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+    return [line for line in plan if line.startswith('SCAN ') and line.split()[1] not in derived]
+
+
+class QueryCounter:
+    """Trace callback that counts (and optionally keeps) the statements a connection executes"""
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.statements = [] if record else None
+
+    def __call__(self, statement):
+        self.count += 1
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+# Counters active per connection, so count_queries blocks can nest
+_counters = {}
+
+
+@contextmanager
+def count_queries(conn, record=False):
+    """Count statements run on `conn` inside the block; record=True also keeps their (expanded) SQL"""
+    counter = QueryCounter(record)
+    counters = _counters.setdefault(id(conn), [])
+    counters.append(counter)
+
+    def trace(statement):
+        for active in counters:
+            active(statement)
+
+    conn.set_trace_callback(trace)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+        if not counters:
+            del _counters[id(conn)]
+            conn.set_trace_callback(None)
+
+
+# ==================== DATE WINDOWS ====================
+# Dates are stored as ISO 'YYYY-MM-DD' text, so half-open string ranges
+# select the same rows as LIKE 'YYYY-MM%' while still using the
+# (user_id, date) index.
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def month_window(month):
+    """[first of month, first of next month) for a date or 'YYYY-MM' string"""
+    if isinstance(month, str) and len(month) == 7:
+        month = month + '-01'
+    first = _as_date(month).replace(day=1)
+    return first.isoformat(), add_months(first, 1).isoformat()
+
+
+def add_months(day, months):
+    """First day of the calendar month `months` away from `day`'s month"""
+    day = _as_date(day)
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def range_window(start, end):
+    """Inclusive [start, end] dates as a half-open window; a None bound leaves that side open"""
+    return (_as_date(start).isoformat() if start is not None else None,
+            (_as_date(end) + timedelta(days=1)).isoformat() if end is not None else None)
+
+
+def week_window(day, days=7):
+    """The `days` days ending on (and including) `day`"""
+    end = _as_date(day)
+    return range_window(end - timedelta(days=days - 1), end)
+
+
+def date_clause(window, column='date'):
+    """SQL predicate and params for a (start, end) half-open window; None bounds are skipped"""
+    bounds = [(f"{column} >= ?", window[0]), (f"{column} < ?", window[1])]
+    bounds = [(sql, value) for sql, value in bounds if value is not None]
+    return " AND ".join(sql for sql, _ in bounds) or "1", tuple(value for _, value in bounds)
+
+
+def checkpoint(conn, mode='PASSIVE'):
+    """Run a WAL checkpoint; returns (busy, wal_pages, checkpointed_pages)"""
+    return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections with wait-time metrics"""
+
+    def __init__(self, path, size=10, timeout=30.0, pragmas=None):
+        self.path = path
+        self.pragmas = pragmas or {}
+        self.size = size
+        self.timeout = timeout
+        self._idle = deque()
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            'acquired': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    def acquire(self):
+        """Take an idle connection, open a new one, or wait for a release"""
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    break
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._opened >= self.size:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection free after {self.timeout}s")
+
+            wait_ms = (time.perf_counter() - start) * 1000
+            self._stats['acquired'] += 1
+            self._stats['total_wait_ms'] += wait_ms
+            if waited:
+                self._stats['waits'] += 1
+            if wait_ms > self._stats['max_wait_ms']:
+                self._stats['max_wait_ms'] = wait_ms
+
+        if conn is None:
+            try:
+                conn = connect(self.path, self.pragmas)
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection, rolling back anything left uncommitted; closes it once the pool is closed"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._opened -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (busy ones are closed on release)"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._opened -= 1
+
+    def stats(self):
+        """Snapshot of pool occupancy and connection-wait metrics"""
+        with self._cond:
+            data = dict(self._stats)
+            data['size'] = self.size
+            data['open'] = self._opened
+            data['idle'] = len(self._idle)
+            data['in_use'] = self._opened - len(self._idle)
+        acquired = data['acquired']
+        data['avg_wait_ms'] = round(data['total_wait_ms'] / acquired, 3) if acquired else 0.0
+        data['total_wait_ms'] = round(data['total_wait_ms'], 3)
+        data['max_wait_ms'] = round(data['max_wait_ms'], 3)
+        return data
+
+
+def init_app(app):
+    """Create the pool from app config and release connections on teardown"""
+    global pool
+    app.config.setdefault('DATABASE_PATH', DEFAULT_DB_PATH)
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30.0)
+    app.config.setdefault('DB_PRAGMA_PROFILE', 'performance')
+    app.config.setdefault('DB_PRAGMAS', {})
+    app.config['DB_PRAGMAS'] = resolve_profile(app.config['DB_PRAGMA_PROFILE'], app.config['DB_PRAGMAS'])
+    pool = ConnectionPool(
+        app.config['DATABASE_PATH'],
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        pragmas=app.config['DB_PRAGMAS'],
+    )
+    app.teardown_appcontext(close_db)
+
+
+def get_db():
+    """Connection bound to the current app context, acquired on first use"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    """Teardown hook: hand the request's connection back to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
@@ -0,0 +1,62 @@
+"""Email rendering from Jinja templates in templates/emails/.
+
+Each email type is one <type>.jinja file with three blocks: subject, html
+and text (the plaintext alternative). Templates are compiled on first use
+and kept for the life of the process, so rendering a batch costs one pass
+over the compiled blocks per recipient. Links are built from base_url
+(EMAIL_BASE_URL), so mail points at whatever host serves the app.
+"""
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+PARTS = ('subject', 'html', 'text')
+
+
+def money(value):
+    return f"₹{value or 0:.2f}"
+
+
+class EmailRenderer:
+    """Compiled-once email templates rendered with per-user context"""
+
+    def __init__(self, template_dir, base_url):
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            auto_reload=False,
+            undefined=StrictUndefined,
+        )
+        self.env.filters['money'] = money
+        self.env.globals['base_url'] = base_url.rstrip('/')
+        self._templates = {}
+        self.rendered = 0
+
+    def template(self, email_type):
+        template = self._templates.get(email_type)
+        if template is None:
+            template = self._templates[email_type] = self.env.get_template(f"{email_type}.jinja")
+        return template
+
+    def render(self, email_type, **context):
+        """(subject, html, text) for one email"""
+        return next(self.render_many(email_type, [context]))
+
+    def render_many(self, email_type, contexts, **shared):
+        """Yield (subject, html, text) for each per-recipient context dict.
+
+        The template is looked up once for the batch; `shared` holds the
+        values every email in it gets (the summary date, say).
+        """
+        template = self.template(email_type)
+        blocks = [template.blocks[part] for part in PARTS]
+        for context in contexts:
+            ctx = template.new_context({**shared, **context})
+            self.rendered += 1
+            yield tuple(''.join(block(ctx)).strip() for block in blocks)
+
+
+def init_app(app):
+    """Build the renderer from EMAIL_TEMPLATE_DIR / EMAIL_BASE_URL"""
+    app.config.setdefault('EMAIL_TEMPLATE_DIR', os.path.join(app.root_path, 'templates', 'emails'))
+    app.config.setdefault('EMAIL_BASE_URL', 'http://127.0.0.1:5000')
+    return EmailRenderer(app.config['EMAIL_TEMPLATE_DIR'], app.config['EMAIL_BASE_URL'])
@@ -0,0 +1,226 @@
+"""Bulk expense import from CSV, OFX and JSON Lines.
+
+Each parser reads its input incrementally and yields (line, record) pairs
+of raw field dicts; normalize() turns a record into (title, amount,
+category, date) or raises ImportRowError, so one bad row is reported and
+skipped without failing the file. Amounts are read with '.' as the decimal
+point; a file's sign convention (is spending positive or negative?) comes
+from the caller, defaulting per format, and rows of the other sign are
+credits or refunds and are skipped. ImportChecks replaces the per-row
+detect_duplicate_expense / detect_fraud_anomaly queries with state held in
+memory for the whole import: the user's per-category spend is loaded once
+and rolled forward row by row, and duplicates are matched against the
+expenses that already existed in each chunk's date range.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+FORMATS = ('csv', 'ofx', 'jsonl')
+EXTENSIONS = {'csv': 'csv', 'ofx': 'ofx', 'qfx': 'ofx', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'json': 'jsonl'}
+
+# Column names accepted for each field, compared case-insensitively
+FIELD_ALIASES = {
+    'title': ('title', 'description', 'name', 'payee', 'merchant', 'memo', 'narration'),
+    'amount': ('amount', 'debit', 'value', 'trnamt'),
+    'category': ('category',),
+    'date': ('date', 'transaction date', 'posted', 'dtposted', 'value date'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%Y%m%d')
+
+# The sign spending carries in a file. Statements (OFX) sign debits negative;
+# CSV/JSON Lines default to positive spend, but most bank CSV exports are negative
+SPEND_SIGNS = ('positive', 'negative')
+DEFAULT_SPEND_SIGN = {'csv': 'positive', 'ofx': 'negative', 'jsonl': 'positive'}
+
+# An optional sign and currency symbol or code around the digits: '-₹1,250.00', '12.50 INR'
+AMOUNT = re.compile(r'(?P<sign>[-+]?)\s*(?:[A-Za-z]{1,3}\.?|[^\w\s.,()+\-]{1,2})?\s*(?P<sign2>[-+]?)\s*'
+                    r'(?P<number>[\d.,]+)\s*(?:[A-Za-z]{1,3}|[^\w\s.,()+\-]{1,2})?')
+# '.' decimals (at most two places); ',' only between thousands (1,234,567) or lakh (12,34,567) groups
+NUMBER = re.compile(r'(?:\d{1,3}(?:,\d{3})+|\d{1,2}(?:,\d{2})+,\d{3}|\d+)(?:\.\d{0,2})?|\.\d{1,2}')
+
+
+class ImportRowError(ValueError):
+    """A row that can't be imported; the message goes into the import report"""
+
+
+class SkipRow(Exception):
+    """A row that is valid but not an expense (a credit or refund, by the file's sign convention)"""
+
+
+def detect_format(filename, declared=None):
+    """Format from an explicit value or the file extension"""
+    if declared:
+        if declared not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return declared
+    ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if ext not in EXTENSIONS:
+        raise ValueError("Can't tell the file format; pass format=csv, ofx or jsonl")
+    return EXTENSIONS[ext]
+
+
+def _text(stream):
+    """Text view of a binary upload; tolerates a UTF-8 BOM"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def parse_csv(stream):
+    reader = csv.DictReader(_text(stream))
+    for record in reader:
+        # The header is line 1, so data rows start at 2
+        yield reader.line_num, {(key or '').strip().lower(): value for key, value in record.items()}
+
+
+def parse_jsonl(stream):
+    for line, text in enumerate(_text(stream), start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError as e:
+            yield line, ImportRowError(f"Invalid JSON: {e.msg}")
+            continue
+        if not isinstance(record, dict):
+            yield line, ImportRowError("Each line must be a JSON object")
+            continue
+        yield line, {str(key).lower(): value for key, value in record.items()}
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+def parse_ofx(stream):
+    """STMTTRN blocks of an OFX/QFX statement, SGML (unclosed tags) or XML"""
+    record = None
+    for line, text in enumerate(_text(stream), start=1):
+        for closing, tag, value in OFX_TAG.findall(text):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and record is not None:
+                    yield start, record
+                    record = None
+                elif not closing:
+                    record, start = {}, line
+            elif record is not None and not closing and value.strip():
+                record[tag.lower()] = value.strip()
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'jsonl': parse_jsonl}
+
+
+def _field(record, name):
+    for alias in FIELD_ALIASES[name]:
+        value = record.get(alias)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def parse_amount(value):
+    """Signed amount of a field; accounting parentheses '(12.50)' are negative.
+
+    Separators that could be read two ways (a decimal comma as in '12,50' or
+    '1.234,56', or three decimals as in '1.234') are rejected, not guessed at.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value or '').strip()
+    negative = text.startswith('(') and text.endswith(')')
+    if negative:
+        text = text[1:-1].strip()
+    match = AMOUNT.fullmatch(text)
+    if not match or (match['sign'] and match['sign2']) or (negative and (match['sign'] or match['sign2'])):
+        raise ImportRowError(f"Invalid amount: {value!r}")
+    if not NUMBER.fullmatch(match['number']):
+        raise ImportRowError(f"Ambiguous amount: {value!r} (use '.' for decimals, at most two places)")
+    amount = float(match['number'].replace(',', ''))
+    return -amount if negative or '-' in (match['sign'], match['sign2']) else amount
+
+
+def parse_date(value):
+    text = str(value or '').strip()
+    # OFX dates carry a time and zone after YYYYMMDD
+    if re.match(r'^\d{8}', text):
+        text = text[:8]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ImportRowError(f"Invalid date: {value!r}")
+
+
+def normalize(record, fmt, categorize, spend_sign=None):
+    """(title, amount, category, date) for one parsed record; spend_sign defaults per format"""
+    if isinstance(record, Exception):
+        raise record
+    title = str(_field(record, 'title') or '').strip()
+    if not title:
+        raise ImportRowError("Missing title")
+    amount = parse_amount(_field(record, 'amount'))
+    if (spend_sign or DEFAULT_SPEND_SIGN[fmt]) == 'negative':
+        amount = -amount
+    if not amount:
+        raise ImportRowError("Amount must not be zero")
+    if amount < 0:
+        # Credits and refunds would otherwise be counted as spend
+        raise SkipRow()
+    date = parse_date(_field(record, 'date'))
+    category = str(_field(record, 'category') or '').strip() or categorize(title)
+    return title[:200], round(amount, 2), category, date
+
+
+class ImportChecks:
+    """Duplicate and anomaly checks for a whole import, kept in memory.
+
+    Anomalies follow detect_fraud_anomaly: an amount over 3x the user's
+    average for the category so far, where "so far" includes rows earlier
+    in the same import. Duplicates are rows matching an expense that was
+    already stored before the import began, so re-importing a statement is
+    flagged while repeated purchases within one file are not.
+    """
+
+    def __init__(self, conn, user_id):
+        self.conn = conn
+        self.user_id = user_id
+        self.max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+        self.spend = {category: [total, count] for category, total, count in conn.execute(
+            "SELECT category, SUM(amount), COUNT(*) FROM expenses WHERE user_id=? GROUP BY category", (user_id,))}
+        self.existing = {}
+        self.loaded = None
+
+    def load_window(self, start, end):
+        """Index existing expenses dated start..end (inclusive) by their duplicate key"""
+        if self.loaded and self.loaded[0] <= start and end <= self.loaded[1]:
+            return
+        self.existing = {}
+        for title, amount, category, date, created_at in self.conn.execute("""
+            SELECT title, amount, category, date, created_at FROM expenses
+            WHERE user_id=? AND date >= ? AND date <= ? AND id <= ?
+        """, (self.user_id, start, end, self.max_id)):
+            self.existing.setdefault((title, amount, category, date), created_at)
+        self.loaded = (start, end)
+
+    def check(self, title, amount, category, date):
+        """(is_duplicate, is_anomaly, reason) for one row, then count it toward the category average"""
+        reason = None
+        created_at = self.existing.get((title, amount, category, date))
+        is_dup = created_at is not None
+        if is_dup:
+            reason = f"Duplicate detected: {title} for ₹{amount} was added {created_at}"
+
+        is_fraud = False
+        total, count = self.spend.get(category, (0.0, 0))
+        if count:
+            avg_amount = total / count
+            if amount > avg_amount * 3:
+                is_fraud = True
+                reason = reason or f"Unusual spending: ₹{amount} is 3x higher than your average {category} expense (₹{avg_amount:.2f})"
+        self.spend[category] = [total + amount, count + 1]
+        return is_dup, is_fraud, reason
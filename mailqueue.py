@@ -0,0 +1,202 @@
+"""Durable outbound mail queue.
+
+send_email only inserts a row into the outbox table and calls dispatch_soon(),
+which returns at once and runs a dispatch on a background thread, so no
+request waits on SMTP. A dispatch (like the scheduler's periodic poll) claims
+due rows and hands them, in batches, to a bounded pool of worker threads;
+each worker sends its batch over a single SMTP connection (Flask-Mail's
+mail.connect()). Outcomes are recorded in one transaction per dispatch:
+delivered rows move to email_logs, failed rows are retried with exponential
+backoff until MAIL_MAX_ATTEMPTS and then kept with status 'failed'.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+import db
+
+OUTBOX_COLUMNS = "id, recipient, subject, html_body, text_body, user_id, email_type, attempts, created_at"
+
+
+class MailQueue:
+    """Outbox writer plus the dispatcher that drains it"""
+
+    def __init__(self, app, mail, workers=4, batch_size=50, max_attempts=5, retry_seconds=60, claim_timeout=600):
+        self.app = app
+        self.mail = mail
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.claim_timeout = claim_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail')
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mail-dispatch')
+        self._dispatch_pending = False
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.latency_ms_total = 0.0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def enqueue(self, conn, messages):
+        """Queue (recipient, subject, html_body, text_body, user_id, email_type) tuples"""
+        now = datetime.now().isoformat()
+        conn.executemany("""
+            INSERT INTO outbox (recipient, subject, html_body, text_body, user_id, email_type, status, attempts, created_at, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+        """, [(*message, now, now) for message in messages])
+        conn.commit()
+        with self._lock:
+            self.queued += len(messages)
+
+    def claim(self, conn, limit):
+        """Mark up to `limit` due messages as sending and return them"""
+        now = datetime.now()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Rows a crashed worker left behind go back to the queue
+            stale = (now - timedelta(seconds=self.claim_timeout)).isoformat()
+            conn.execute("UPDATE outbox SET status='pending' WHERE status='sending' AND claimed_at < ?", (stale,))
+            rows = conn.execute(f"""
+                SELECT {OUTBOX_COLUMNS} FROM outbox
+                WHERE status='pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            """, (now.isoformat(), limit)).fetchall()
+            conn.executemany("UPDATE outbox SET status='sending', claimed_at=? WHERE id=?",
+                             [(now.isoformat(), row[0]) for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def send_batch(self, batch):
+        """Send one batch over a single SMTP connection; returns [(row, error, finished_at)]"""
+        results = []
+        with self.app.app_context():
+            try:
+                with self.mail.connect() as smtp:
+                    for row in batch:
+                        try:
+                            smtp.send(Message(subject=row[2], recipients=[row[1]], html=row[3], body=row[4]))
+                            results.append((row, None, datetime.now()))
+                        except Exception as e:
+                            results.append((row, str(e), datetime.now()))
+            except Exception as e:
+                # Connecting failed or the connection dropped: retry whatever wasn't attempted
+                attempted = {result[0][0] for result in results}
+                results += [(row, str(e), datetime.now()) for row in batch if row[0] not in attempted]
+        return results
+
+    def record(self, conn, results):
+        """Apply send outcomes to the outbox and email_logs in one transaction"""
+        now = datetime.now()
+        sent, retry, failed, logs = [], [], [], []
+        latencies = []
+        for row, error, finished_at in results:
+            message_id, recipient, subject, html_body, text_body, user_id, email_type, attempts, created_at = row
+            attempts += 1
+            if error is None:
+                sent.append((message_id,))
+                logs.append((user_id, email_type, finished_at.isoformat(), subject, "sent"))
+                latencies.append((finished_at - datetime.fromisoformat(created_at)).total_seconds() * 1000)
+            elif attempts >= self.max_attempts:
+                failed.append((attempts, error, message_id))
+                logs.append((user_id, email_type, now.isoformat(), subject, "failed"))
+            else:
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                retry.append((attempts, error, (now + timedelta(seconds=delay)).isoformat(), message_id))
+
+        conn.executemany("DELETE FROM outbox WHERE id=?", sent)
+        conn.executemany("UPDATE outbox SET status='pending', attempts=?, last_error=?, next_attempt_at=? WHERE id=?", retry)
+        conn.executemany("UPDATE outbox SET status='failed', attempts=?, last_error=? WHERE id=?", failed)
+        conn.executemany("""
+            INSERT INTO email_logs (user_id, email_type, sent_at, subject, status)
+            VALUES (?, ?, ?, ?, ?)
+        """, logs)
+        conn.commit()
+
+        with self._lock:
+            self.sent += len(sent)
+            self.retried += len(retry)
+            self.failed += len(failed)
+            if latencies:
+                self.latency_ms_total += sum(latencies)
+                self.last_latency_ms = round(latencies[-1], 2)
+                self.max_latency_ms = round(max(self.max_latency_ms, *latencies), 2)
+
+    def dispatch(self, conn):
+        """Claim due mail, send it on the worker pool and record the outcomes; returns messages sent"""
+        rows = self.claim(conn, self.workers * self.batch_size)
+        if not rows:
+            return 0
+        batches = [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+        results = [result for batch in self._executor.map(self.send_batch, batches) for result in batch]
+        self.record(conn, results)
+        with self._lock:
+            self.batches += len(batches)
+        return sum(1 for row, error, finished_at in results if error is None)
+
+    def dispatch_soon(self):
+        """Run a dispatch on the dispatcher thread without waiting for it.
+
+        Calls made while one is still waiting to start share it; a call made
+        after it started queues one more, so newly enqueued mail is never missed.
+        """
+        with self._lock:
+            if self._dispatch_pending:
+                return
+            self._dispatch_pending = True
+        self._dispatcher.submit(self._background_dispatch)
+
+    def _background_dispatch(self):
+        with self._lock:
+            self._dispatch_pending = False
+        with self.app.app_context():
+            try:
+                self.dispatch(db.get_db())
+            except Exception as e:
+                print(f"Error dispatching mail: {e}")
+
+    def stats(self, conn):
+        depth = {'pending': 0, 'sending': 0, 'failed': 0}
+        oldest = None
+        for status, count, first in conn.execute(
+                "SELECT status, COUNT(*), MIN(created_at) FROM outbox GROUP BY status"):
+            depth[status] = count
+            if status == 'pending':
+                oldest = first
+        with self._lock:
+            return {
+                'depth': depth,
+                'oldest_pending_age_s': round((datetime.now() - datetime.fromisoformat(oldest)).total_seconds(), 1) if oldest else 0,
+                'workers': self.workers,
+                'batch_size': self.batch_size,
+                'queued': self.queued,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'batches': self.batches,
+                'avg_latency_ms': round(self.latency_ms_total / self.sent, 2) if self.sent else 0.0,
+                'last_latency_ms': self.last_latency_ms,
+                'max_latency_ms': self.max_latency_ms,
+            }
+
+
+def init_app(app, mail):
+    """Build the mail queue from MAIL_WORKERS / MAIL_BATCH_SIZE / MAIL_MAX_ATTEMPTS / MAIL_RETRY_SECONDS"""
+    app.config.setdefault('MAIL_WORKERS', 4)
+    app.config.setdefault('MAIL_BATCH_SIZE', 50)
+    app.config.setdefault('MAIL_MAX_ATTEMPTS', 5)
+    app.config.setdefault('MAIL_RETRY_SECONDS', 60)
+    return MailQueue(app, mail,
+                     workers=app.config['MAIL_WORKERS'],
+                     batch_size=app.config['MAIL_BATCH_SIZE'],
+                     max_attempts=app.config['MAIL_MAX_ATTEMPTS'],
+                     retry_seconds=app.config['MAIL_RETRY_SECONDS'])
@@ -0,0 +1,367 @@
+"""Receipt processing off the request thread, and thumbnail variants.
+
+add_expense only stages the raw upload; ReceiptProcessor hands it to a
+process pool. Workers decode JPEGs in draft mode (downscale on decode),
+apply the EXIF orientation and drop all metadata, then write a WebP and a
+JPEG variant next to each other in the user's receipt folder, named by the
+SHA-256 of the normalized JPEG. PDFs are moved into place unchanged, named
+by their own hash. The on_done callback records the outcome on a thread of
+its own; a write that fails is retried, and if it never succeeds the job is
+reported to on_done as failed instead.
+
+Smaller sizes (THUMBNAIL_SIZES) are derived from the stored image on first
+request and kept in VariantCache, an on-disk LRU capped at a byte budget.
+
+Uploads arrive through StreamingUpload, which the multipart parser writes
+into chunk by chunk: the type is decided from the first bytes, the body is
+hashed and size-checked as it streams, and it lands directly in staging.
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+THUMBNAIL_SIZES = (128, 512, 1024)
+
+# Leading bytes of each accepted upload type, and the extension it is stored under
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'%PDF-', 'pdf'),
+)
+MAGIC_LENGTH = max(len(magic) for magic, _ in MAGIC_NUMBERS)
+
+VARIANT_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+
+# Seconds to wait before each retry of an on_done call that raised
+RECORD_RETRY_DELAYS = (0.5, 2.0)
+
+
+def sniff(head):
+    """Upload type from its leading bytes, or None"""
+    for magic, kind in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+class StreamingUpload:
+    """Multipart file part written straight to `path`: type-sniffed, hashed and size-capped.
+
+    Werkzeug calls write() per chunk and seek(0) when the part ends. Bad
+    types and oversized bodies raise 415/413 mid-stream, before the rest
+    of the request body is read.
+    """
+
+    def __init__(self, path, max_bytes, buffer_size=64 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind = None
+        self.claimed = False
+        self._head = b''
+        self._hash = hashlib.sha256()
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._reader = None
+
+    def _check_type(self):
+        self.kind = sniff(self._head)
+        if self.kind is None:
+            self.discard()
+            raise UnsupportedMediaType("Receipts must be JPEG, PNG, GIF or PDF files")
+
+    def write(self, data):
+        if self.kind is None and len(self._head) < MAGIC_LENGTH:
+            self._head += data[:MAGIC_LENGTH - len(self._head)]
+            if len(self._head) >= MAGIC_LENGTH:
+                self._check_type()
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge()
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        if not self._file.closed:
+            if self.size and self.kind is None:
+                self._check_type()
+            self._file.close()
+        if self._reader is not None:
+            return self._reader.seek(offset, whence)
+        return 0
+
+    def read(self, size=-1):
+        if self._reader is None:
+            self._reader = open(self.path, 'rb')
+        return self._reader.read(size)
+
+    def close(self):
+        self._file.close()
+        if self._reader is not None:
+            self._reader.close()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def claim(self, dest):
+        """Move the finished upload to dest; unclaimed uploads are discarded"""
+        self.close()
+        os.replace(self.path, dest)
+        self.path = dest
+        self.claimed = True
+
+    def discard(self):
+        self.close()
+        if not self.claimed and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def process_receipt(src, dest_dir, stem, max_size=1024, quality=85):
+    """Build the stored variants of one staged upload; returns (result, elapsed_ms).
+
+    Variants are named by the SHA-256 of the normalized file (the JPEG we
+    encode, or a PDF as uploaded), so re-uploading a receipt lands on the
+    files already stored. Runs in a worker process, so it only touches the
+    filesystem.
+    """
+    started = time.perf_counter()
+    os.makedirs(dest_dir, exist_ok=True)
+    ext = src.rsplit('.', 1)[1].lower()
+    result = {'source_sha256': file_sha256(src)}
+
+    if ext not in IMAGE_EXTENSIONS:
+        digest = result['source_sha256']
+        shutil.move(src, os.path.join(dest_dir, f"{digest}.{ext}"))
+        result.update(sha256=digest, original=f"{digest}.{ext}",
+                      bytes=os.path.getsize(os.path.join(dest_dir, f"{digest}.{ext}")))
+        return result, (time.perf_counter() - started) * 1000
+
+    with Image.open(src) as img:
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            img.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_size, max_size))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        # No exif=/icc_profile= arguments: the variants carry no metadata
+        img.save(os.path.join(dest_dir, f"{stem}.webp"), 'WEBP', quality=quality, method=4)
+        img.save(os.path.join(dest_dir, f"{stem}.jpg"), 'JPEG', quality=quality, optimize=True, progressive=True)
+
+    digest = file_sha256(os.path.join(dest_dir, f"{stem}.jpg"))
+    for ext in ('webp', 'jpg'):
+        os.replace(os.path.join(dest_dir, f"{stem}.{ext}"), os.path.join(dest_dir, f"{digest}.{ext}"))
+    os.remove(src)
+    result.update(sha256=digest, jpeg=f"{digest}.jpg", webp=f"{digest}.webp",
+                  bytes=os.path.getsize(os.path.join(dest_dir, f"{digest}.jpg")))
+    return result, (time.perf_counter() - started) * 1000
+
+
+def stale_files(root, keep, cutoff):
+    """Files under root last modified before cutoff whose path minus extension isn't in keep"""
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.splitext(path)[0] in keep or os.path.getmtime(path) > cutoff:
+                continue
+            yield path
+
+
+class ReceiptProcessor:
+    """Bounded process pool for receipt uploads with progress counters"""
+
+    def __init__(self, workers=2, max_size=1024, quality=85, on_done=None):
+        self.workers = workers
+        self.max_size = max_size
+        self.quality = quality
+        self.on_done = on_done
+        self._executor = None
+        self._recorder = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.record_errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _pool(self):
+        # Started on first use so importing the app never starts workers. They are
+        # spawned, not forked: the app already runs scheduler, mail and pool threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipt-done')
+            return self._executor
+
+    def submit(self, expense_id, user_id, src, dest_dir, stem):
+        """Queue one staged upload; on_done(expense_id, user_id, result, error) runs when it finishes"""
+        future = self._pool().submit(process_receipt, src, dest_dir, stem, self.max_size, self.quality)
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._finished(expense_id, user_id, f))
+        return future
+
+    def _finished(self, expense_id, user_id, future):
+        # Runs on the pool's management thread, so on_done's DB writes go to the recorder
+        error = future.exception()
+        result = None
+        with self._lock:
+            if error is None:
+                result, elapsed_ms = future.result()
+                self.completed += 1
+                self.total_ms += elapsed_ms
+                self.max_ms = max(self.max_ms, elapsed_ms)
+            else:
+                self.failed += 1
+            recorder = self._recorder
+        if self.on_done:
+            recorder.submit(self._record, expense_id, user_id, result, error)
+
+    def _record(self, expense_id, user_id, result, error):
+        """Call on_done, retrying if it raises; a result that can't be recorded is reported as failed"""
+        for delay in RECORD_RETRY_DELAYS + (None,):
+            try:
+                self.on_done(expense_id, user_id, result, error)
+                return
+            except Exception as e:
+                failure = e
+                print(f"Recording receipt for expense {expense_id} failed: {e}")
+            if delay is not None:
+                time.sleep(delay)
+        with self._lock:
+            self.record_errors += 1
+        if error is None:
+            try:
+                self.on_done(expense_id, user_id, None, failure)
+            except Exception as e:
+                print(f"Marking receipt for expense {expense_id} failed also failed: {e}")
+
+    def shutdown(self):
+        with self._lock:
+            executor, recorder = self._executor, self._recorder
+            self._executor = self._recorder = None
+        # The pool first: its callbacks may still hand work to the recorder
+        if executor is not None:
+            executor.shutdown(wait=True)
+            recorder.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'record_errors': self.record_errors,
+                'in_flight': self.submitted - self.completed - self.failed,
+                'avg_ms': round(self.total_ms / self.completed, 1) if self.completed else 0.0,
+                'max_ms': round(self.max_ms, 1),
+            }
+
+
+def render_variant(src, dest, size, fmt, quality=80):
+    """Write `src` scaled to fit size x size in fmt ('webp' or 'jpeg') to dest"""
+    with Image.open(src) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', (size, size))
+        img.thumbnail((size, size))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        partial = f"{dest}.{os.getpid()}.{threading.get_ident()}.partial"
+        img.save(partial, VARIANT_FORMATS[fmt][0], quality=quality)
+    os.replace(partial, dest)
+
+
+class VariantCache:
+    """Derived receipt images on disk, evicted least-recently-used past max_bytes"""
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        # Rebuild the LRU order from access times the first time the cache is used
+        if self._entries is not None:
+            return
+        found = []
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.partial'):
+                    continue
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                found.append((stat.st_atime, path, stat.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(found))
+        self._bytes = sum(self._entries.values())
+
+    def get(self, key, build):
+        """Path of the cached variant `key`, calling build(dest) to create it on a miss"""
+        path = os.path.join(self.root, key)
+        with self._lock:
+            self._load()
+            if path in self._entries and os.path.exists(path):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                # Bump only atime: mtime feeds the ETag and must stay put
+                os.utime(path, (time.time(), os.stat(path).st_mtime))
+                return path
+            self.misses += 1
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build(path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries or ()),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
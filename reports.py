@@ -0,0 +1,394 @@
+"""PDF expense reports drawn page by page from a streaming cursor.
+
+write_report reads the selected expenses with fetchmany() and draws each
+page of rows straight onto a reportlab canvas at a fixed row height,
+repeating the column header at the top of every page. No row list or
+platypus Table of the whole period is built, and the document goes to a
+file rather than a BytesIO. What still grows with the export is reportlab's
+finished page content (it writes the file on save()), roughly 8 KB per
+page of ~35 rows; bench_pdf_export.py tracks time and peak memory.
+
+ReportJobs renders reports on a process pool so the layout work never runs
+on a request thread. Finished reports are kept under a cache_key derived
+from everything that shapes them, including the user's data_version, so a
+repeat export of unchanged data is just a file download. on_done records
+each finished job on a thread of its own; a write that fails is retried, and
+if it never succeeds the job is reported to on_done as failed instead.
+"""
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+import db
+
+ACCENT = colors.HexColor('#7c3aed')
+MARGIN = inch
+COLUMNS = (('Title', 2 * inch), ('Category', 1.5 * inch), ('Amount', 1.5 * inch), ('Date', 1.5 * inch))
+HEADER_HEIGHT = 26
+ROW_HEIGHT = 18
+FONT = 'Helvetica'
+FONT_SIZE = 10
+TABLE_WIDTH = sum(width for _, width in COLUMNS)
+COLUMN_EDGES = [MARGIN + sum(width for _, width in COLUMNS[:i]) for i in range(len(COLUMNS) + 1)]
+
+
+def expense_query(user_id, window=None, category=None):
+    """SQL and params for a user's unflagged expenses, newest first.
+
+    The unary + keeps SQLite from picking the (user_id, category, amount)
+    index for category filters, which would need a sort of the whole
+    result; (user_id, date) returns rows already in order.
+    """
+    sql = "SELECT title, amount, category, date FROM expenses WHERE user_id=? AND is_duplicate_flagged=0"
+    params = (user_id,)
+    if window:
+        window_sql, window_params = db.date_clause(window)
+        sql += f" AND {window_sql}"
+        params += window_params
+    if category:
+        sql += " AND +category=?"
+        params += (category,)
+    return sql + " ORDER BY date DESC", params
+
+
+@functools.lru_cache(maxsize=4096)
+def _cell(text, width, font=FONT, size=FONT_SIZE):
+    """(text truncated with an ellipsis to fit width, its drawn width); titles and categories repeat a lot"""
+    text_width = stringWidth(text, font, size)
+    if text_width <= width:
+        return text, text_width
+    while text and stringWidth(text + '…', font, size) > width:
+        text = text[:-1]
+    return text + '…', stringWidth(text + '…', font, size)
+
+
+class ReportCanvas:
+    """Draws the expense table onto a canvas a page at a time, repeating the header on each page"""
+
+    def __init__(self, path, pagesize=letter):
+        self.canvas = canvas.Canvas(path, pagesize=pagesize, pageCompression=1)
+        self.width, self.height = pagesize
+        self.page = 1
+        self.y = self.height - MARGIN
+        self.rows = []
+        self.rows_top = None
+
+    def draw_flowable(self, flowable, space_after=0):
+        width, height = flowable.wrapOn(self.canvas, self.width - 2 * MARGIN, self.y - MARGIN)
+        flowable.drawOn(self.canvas, MARGIN, self.y - height)
+        self.y -= height + space_after
+
+    def _footer(self):
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.setFillColor(colors.grey)
+        self.canvas.drawRightString(self.width - MARGIN, MARGIN / 2, f"Page {self.page}")
+
+    def new_page(self):
+        self.flush()
+        self._footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - MARGIN
+        self.header()
+
+    def header(self):
+        c = self.canvas
+        c.setFillColor(ACCENT)
+        c.setStrokeColor(colors.black)
+        c.rect(MARGIN, self.y - HEADER_HEIGHT, TABLE_WIDTH, HEADER_HEIGHT, fill=1, stroke=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont('Helvetica-Bold', 12)
+        x = MARGIN
+        for name, width in COLUMNS:
+            c.drawCentredString(x + width / 2, self.y - HEADER_HEIGHT + 9, name)
+            x += width
+        self.y -= HEADER_HEIGHT
+        self.rows_top = self.y
+
+    def start_table(self):
+        # Don't leave the header alone at the bottom of the first page
+        if self.y - HEADER_HEIGHT - ROW_HEIGHT < MARGIN:
+            self.new_page()
+        else:
+            self.header()
+
+    def row(self, values):
+        if self.y - ROW_HEIGHT < MARGIN:
+            self.new_page()
+        self.rows.append(values)
+        self.y -= ROW_HEIGHT
+
+    def flush(self):
+        """Draw the rows buffered for this page: one background, one grid, one text object"""
+        if not self.rows:
+            return
+        c = self.canvas
+        top, bottom = self.rows_top, self.y
+        c.setFillColor(colors.lightgrey)
+        c.rect(MARGIN, bottom, TABLE_WIDTH, top - bottom, fill=1, stroke=0)
+        c.setStrokeColor(colors.black)
+        c.grid(COLUMN_EDGES, [top - i * ROW_HEIGHT for i in range(len(self.rows) + 1)])
+
+        text = c.beginText()
+        text.setFont(FONT, FONT_SIZE)
+        text.setFillColor(colors.black)
+        baseline = top - ROW_HEIGHT + 5
+        for values in self.rows:
+            for value, left, (_, width) in zip(values, COLUMN_EDGES, COLUMNS):
+                cell, cell_width = _cell(value, width - 6)
+                text.setTextOrigin(left + (width - cell_width) / 2, baseline)
+                text.textOut(cell)
+            baseline -= ROW_HEIGHT
+        c.drawText(text)
+        self.rows = []
+
+    def save(self):
+        self.flush()
+        self._footer()
+        self.canvas.save()
+
+
+def summary_table(rows):
+    table = Table(rows, colWidths=[3 * inch, 3 * inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), ACCENT),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    return table
+
+
+def period_label(window):
+    if not window:
+        return "All dates"
+    start, end = window
+    return f"{start} to {date.fromisoformat(end) - timedelta(days=1)}"
+
+
+def write_report(conn, path, user_id, window=None, category=None, budget=None, chunk_size=1000):
+    """Write the expense report PDF for user_id to path; returns its stats.
+
+    window is a half-open (start, end) date window (db.range_window /
+    db.month_window) or None for every date. budget adds the budget rows
+    to the summary, which only makes sense for a single month.
+    """
+    started = time.perf_counter()
+    sql, params = expense_query(user_id, window, category)
+    count, total = conn.execute(f"SELECT COUNT(*), SUM(amount) FROM ({sql})", params).fetchone()
+    total = total or 0
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=ACCENT,
+        spaceAfter=30,
+        alignment=1
+    )
+    report = ReportCanvas(path)
+    report.draw_flowable(Paragraph("Expense Report", title_style), space_after=30)
+    report.draw_flowable(Paragraph(f"<b>Period:</b> {period_label(window)}", styles['Normal']), space_after=6)
+    if category:
+        report.draw_flowable(Paragraph(f"<b>Category:</b> {escape(category)}", styles['Normal']), space_after=6)
+    report.y -= 14
+
+    report.draw_flowable(Paragraph("<b>Summary</b>", styles['Heading2']), space_after=6)
+    summary = [
+        ['Metric', 'Value'],
+        ['Total Expenses', f'₹{total:.2f}'],
+        ['Number of Entries', str(count)],
+    ]
+    if budget is not None:
+        summary += [['Monthly Budget', f'₹{budget:.2f}'], ['Remaining', f'₹{budget - total:.2f}']]
+    report.draw_flowable(summary_table(summary), space_after=20)
+
+    report.draw_flowable(Paragraph("<b>Detailed Expenses</b>", styles['Heading2']), space_after=6)
+    report.start_table()
+    cur = conn.execute(sql, params)
+    rows = 0
+    while True:
+        chunk = cur.fetchmany(chunk_size)
+        if not chunk:
+            break
+        for title, amount, row_category, day in chunk:
+            report.row((title or '', row_category or '', f'₹{amount or 0:.2f}', day or ''))
+        rows += len(chunk)
+    report.save()
+
+    return {
+        'rows': rows,
+        'pages': report.page,
+        'bytes': os.path.getsize(path),
+        'total': total,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def cache_key(user_id, window, category, budget, data_version):
+    """Name for the report these inputs produce; any change to them gives a new name"""
+    raw = json.dumps([user_id, window and list(window), category, budget, data_version])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def render_report(db_path, pragmas, path, user_id, window, category, budget, chunk_size):
+    """write_report on a private connection, moved into path only once complete (process pool entry point)"""
+    conn = db.connect(db_path, pragmas)
+    partial = f"{path}.{os.getpid()}.partial"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        result = write_report(conn, partial, user_id, window, category, budget, chunk_size)
+        os.replace(partial, path)
+    finally:
+        conn.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+    return result
+
+
+# Seconds to wait before each retry of an on_done call that raised
+RECORD_RETRY_DELAYS = (0.5, 2.0)
+
+
+class ReportJobs:
+    """Bounded process pool for report renders with progress counters"""
+
+    def __init__(self, db_path, pragmas, workers=2, chunk_size=1000, on_done=None):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.on_done = on_done
+        self._executor = None
+        self._recorder = None
+        self._recorded = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.record_errors = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _pool(self):
+        # Started on first use so importing the app never starts workers. They are
+        # spawned, not forked: the app already runs scheduler, mail and pool threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report-done')
+            return self._executor
+
+    def submit(self, job_id, user_id, path, window, category, budget):
+        """Queue one report; on_done(job_id, user_id, result, error) runs when it finishes"""
+        pool = self._pool()
+        with self._lock:
+            self.submitted += 1
+            self._recorded[job_id] = threading.Event()
+        future = pool.submit(render_report, self.db_path, self.pragmas, path,
+                             user_id, window, category, budget, self.chunk_size)
+        future.add_done_callback(lambda f: self._finished(job_id, user_id, f))
+        return future
+
+    def _finished(self, job_id, user_id, future):
+        # Runs on the pool's management thread, so on_done's DB writes go to the recorder
+        error = future.exception()
+        result = None
+        with self._lock:
+            if error is None:
+                result = future.result()
+                self.completed += 1
+                self.total_ms += result['elapsed_ms']
+                self.max_ms = max(self.max_ms, result['elapsed_ms'])
+            else:
+                self.failed += 1
+            recorder = self._recorder
+        recorder.submit(self._record, job_id, user_id, result, error)
+
+    def _record(self, job_id, user_id, result, error):
+        """Call on_done, retrying if it raises; a result that can't be recorded is reported as failed"""
+        try:
+            if not self.on_done:
+                return
+            for delay in RECORD_RETRY_DELAYS + (None,):
+                try:
+                    self.on_done(job_id, user_id, result, error)
+                    return
+                except Exception as e:
+                    failure = e
+                    print(f"Recording report job {job_id} failed: {e}")
+                if delay is not None:
+                    time.sleep(delay)
+            with self._lock:
+                self.record_errors += 1
+            if error is None:
+                try:
+                    self.on_done(job_id, user_id, None, failure)
+                except Exception as e:
+                    print(f"Marking report job {job_id} failed also failed: {e}")
+        finally:
+            # Waiters are released whatever happened, so none of them hangs on this job
+            with self._lock:
+                recorded = self._recorded.pop(job_id, None)
+            if recorded:
+                recorded.set()
+
+    def wait(self, job_id, timeout):
+        """Block until on_done has run for job_id or timeout passes; False if it is still running"""
+        with self._lock:
+            recorded = self._recorded.get(job_id)
+        return recorded is None or recorded.wait(timeout)
+
+    def record_hit(self, coalesced=False):
+        with self._lock:
+            if coalesced:
+                self.coalesced += 1
+            else:
+                self.cache_hits += 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, recorder = self._executor, self._recorder
+            self._executor = self._recorder = None
+        # The pool first: its callbacks may still hand work to the recorder
+        if executor is not None:
+            executor.shutdown(wait=True)
+            recorder.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'record_errors': self.record_errors,
+                'in_flight': self.submitted - self.completed - self.failed,
+                'cache_hits': self.cache_hits,
+                'coalesced': self.coalesced,
+                'avg_ms': round(self.total_ms / self.completed, 1) if self.completed else 0.0,
+                'max_ms': round(self.max_ms, 1),
+            }
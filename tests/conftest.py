@@ -0,0 +1,52 @@
+"""Shared fixtures: the app on a scratch database, run from a scratch directory.
+
+app.py creates its upload, staging and export folders relative to the
+working directory when it is imported, so the tests chdir first, like the
+benchmark scripts do.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='expense_tests_')
+os.environ['DATABASE_PATH'] = os.path.join(WORKDIR, 'test.db')
+os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.init_db()
+    return app_module
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user(app_module, client, request):
+    """A registered user, logged in on `client`; returns their id"""
+    username = f"{request.node.name}_{time.monotonic_ns()}"
+    client.post('/register', data={'username': username, 'password': 'pw', 'email': f"{username}@example.com"})
+    client.post('/login', data={'username': username, 'password': 'pw'})
+    with client.session_transaction() as session:
+        return session['user_id']
+
+
+def wait_for(condition, timeout=10.0):
+    """Poll condition() until it is truthy; returns its last value"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result or time.monotonic() > deadline:
+            return result
+        time.sleep(0.05)
@@ -0,0 +1,52 @@
+"""Budget alert job: grouped candidate query and its metrics"""
+from datetime import datetime
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def alerted(app_module, monkeypatch):
+    """Users the job emailed (the mail itself isn't sent)"""
+    sent = []
+    monkeypatch.setattr(app_module, 'send_spend_limit_alert', lambda user_id, *args: sent.append(user_id) or True)
+    return sent
+
+
+def rollup_rows(app_module, month):
+    with app_module.app.app_context():
+        return app_module.get_db().execute(
+            "SELECT COUNT(*) FROM user_monthly_category_totals WHERE month=?", (month,)).fetchone()[0]
+
+
+def test_candidates_and_rows_scanned_come_from_one_query(app_module, client, user):
+    client.post('/set-budget', data={'monthly_budget': '100'})
+    for category in ('Food', 'Bills'):
+        client.post('/add', data={'title': 'Big', 'amount': '45', 'category': category, 'date': '2025-05-10'})
+
+    with app_module.app.app_context():
+        c = app_module.get_db().cursor()
+        with db.count_queries(c.connection) as queries:
+            candidates, rows_scanned = app_module.budget_alert_candidates(c, '2025-05')
+    assert queries.count == 1
+    assert [(row[0], row[3], row[4]) for row in candidates if row[0] == user] == [(user, 90.0, 80)]
+    assert rows_scanned == rollup_rows(app_module, '2025-05') >= 2
+
+
+def test_rows_scanned_is_reported_without_candidates(app_module):
+    with app_module.app.app_context():
+        assert app_module.budget_alert_candidates(app_module.get_db().cursor(), '1999-01') == ([], 0)
+
+
+def test_job_exports_rows_scanned(app_module, client, user, alerted):
+    client.post('/set-budget', data={'monthly_budget': '10'})
+    client.post('/add', data={'title': 'Big', 'amount': '20', 'category': 'Food',
+                              'date': datetime.now().strftime('%Y-%m-%d')})
+
+    with app_module.app.app_context():
+        app_module.check_budget_limits()
+    assert user in alerted
+    stats = app_module.BUDGET_ALERT_STATS
+    assert stats['last_rows_scanned'] == rollup_rows(app_module, datetime.now().strftime('%Y-%m'))
+    assert stats['last_candidates'] >= 1
@@ -0,0 +1,26 @@
+"""Response cache counters under concurrent request threads"""
+import threading
+
+import cache
+
+
+def test_counters_add_up_across_threads():
+    responses = cache.ResponseCache(cache.MemoryBackend(), ttl=60)
+    start = threading.Barrier(8)
+
+    def hammer(user_id):
+        start.wait()
+        for i in range(2000):
+            responses.get_or_set(user_id, 'insights', {'page': i % 10}, lambda: {'ok': True})
+            if i % 100 == 0:
+                responses.invalidate(user_id, 'insights')
+
+    threads = [threading.Thread(target=hammer, args=(n % 2,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = responses.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 2000
+    assert stats['invalidations'] == 8 * 20
@@ -0,0 +1,40 @@
+"""Summary emails rendered in batches and queued to the outbox"""
+from datetime import date
+
+import pytest
+
+
+@pytest.fixture
+def no_dispatch(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'request_mail_dispatch', lambda: None)
+
+
+def summaries(app_module, n):
+    return [app_module.UserSummary(user_id=100000 + i, username=f"batch{i}", email=f"batch{i}@example.com",
+                                   total=10.0 * i, count=i, categories=['Food'], top_category='Food', top_total=10.0 * i)
+            for i in range(1, n + 1)]
+
+
+def test_render_many_matches_render(app_module):
+    batch = summaries(app_module, 3)
+    day = date(2026, 3, 1)
+    rendered = list(app_module.email_renderer.render_many(
+        'daily_summary', ({'summary': summary} for summary in batch), day=day))
+    assert rendered == [app_module.email_renderer.render('daily_summary', summary=summary, day=day)
+                        for summary in batch]
+    assert 'batch2' in rendered[1][1]
+
+
+def test_send_summaries_queues_each_rendered_chunk(app_module, no_dispatch):
+    batch = summaries(app_module, 5)
+    with app_module.app.app_context():
+        queued = app_module.send_summaries('weekly_summary', [batch[:3], batch[3:]],
+                                           week_ago=date(2026, 2, 22), today=date(2026, 3, 1))
+        rows = app_module.get_db().execute(
+            "SELECT recipient, subject, html_body, text_body FROM outbox WHERE user_id >= 100000 ORDER BY user_id").fetchall()
+        app_module.get_db().execute("DELETE FROM outbox WHERE user_id >= 100000")
+        app_module.get_db().commit()
+
+    assert queued == 5
+    assert [row[0] for row in rows] == [summary.email for summary in batch]
+    assert all(row[1] and 'batch' in row[2] and row[3] for row in rows)
@@ -0,0 +1,30 @@
+"""/api/expenses date filters"""
+import pytest
+
+
+@pytest.fixture
+def expenses(client, user):
+    for day in ('2026-01-10', '2026-02-10', '2026-03-10'):
+        client.post('/add', data={'title': f"Rent {day}", 'amount': '10', 'category': 'Bills', 'date': day})
+
+
+def dates(client, **args):
+    response = client.get('/api/expenses', query_string=args)
+    assert response.status_code == 200
+    return [row['date'] for row in response.get_json()['expenses']]
+
+
+def test_both_bounds_are_inclusive(client, expenses):
+    assert dates(client, start_date='2026-02-10', end_date='2026-03-10') == ['2026-03-10', '2026-02-10']
+
+
+def test_start_date_alone_leaves_the_end_open(client, expenses):
+    assert dates(client, start_date='2026-02-01') == ['2026-03-10', '2026-02-10']
+
+
+def test_end_date_alone_leaves_the_start_open(client, expenses):
+    assert dates(client, end_date='2026-02-10') == ['2026-02-10', '2026-01-10']
+
+
+def test_invalid_date_is_rejected(client, expenses):
+    assert client.get('/api/expenses', query_string={'start_date': 'soon'}).status_code == 400
@@ -0,0 +1,136 @@
+"""Report export jobs: one live job per user and cache key"""
+import sqlite3
+import threading
+
+import pytest
+
+import db
+import reports
+from conftest import wait_for
+
+
+@pytest.fixture
+def queued(app_module, monkeypatch):
+    """Jobs handed to the export workers (which aren't run)"""
+    jobs = []
+    monkeypatch.setattr(app_module, 'queue_export', lambda job_id, *args: jobs.append(job_id))
+    return jobs
+
+
+@pytest.fixture
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(reports, 'RECORD_RETRY_DELAYS', (0, 0))
+
+
+def flaky(failures, calls):
+    """on_done that raises 'database is locked' for its first `failures` calls"""
+    def on_done(*args):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise sqlite3.OperationalError("database is locked")
+    return on_done
+
+
+def waiting_job(jobs, job_id):
+    """Register job_id as submitted, as ReportJobs.submit does, so wait() blocks on it"""
+    jobs._recorded[job_id] = threading.Event()
+    assert not jobs.wait(job_id, 0)
+
+
+def live_jobs(app_module, user_id):
+    with app_module.app.app_context():
+        return app_module.get_db().execute(
+            "SELECT id, status FROM export_jobs WHERE user_id=? AND status != 'failed'", (user_id,)).fetchall()
+
+
+def test_concurrent_identical_exports_queue_one_job(app_module, user, queued):
+    window = db.month_window('2026-01')
+    start = threading.Barrier(8)
+    job_ids = []
+
+    def submit():
+        with app_module.app.app_context():
+            start.wait()
+            job_ids.append(app_module.submit_export(user, window, None))
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(job_ids) == 8 and len(set(job_ids)) == 1
+    assert queued == job_ids[:1]
+    assert live_jobs(app_module, user) == [(job_ids[0], 'pending')]
+
+
+def test_ready_job_with_missing_file_is_rendered_again(app_module, user, queued):
+    window = db.month_window('2026-02')
+    with app_module.app.app_context():
+        job_id = app_module.submit_export(user, window, None)
+        app_module.finish_export(job_id, user, {'rows': 0, 'pages': 1, 'bytes': 0, 'elapsed_ms': 1}, None)
+        assert app_module.submit_export(user, window, None) == job_id
+
+    assert queued == [job_id, job_id]
+    assert live_jobs(app_module, user) == [(job_id, 'pending')]
+
+
+def test_second_live_job_for_a_key_is_rejected(app_module, user, queued):
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        app_module.submit_export(user, db.month_window('2026-03'), None)
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("""
+                INSERT INTO export_jobs (user_id, cache_key, start_date, end_date, status, report_file, created_at)
+                SELECT user_id, cache_key, start_date, end_date, 'pending', report_file, created_at
+                FROM export_jobs WHERE user_id=?
+            """, (user,))
+        conn.rollback()
+
+
+def test_record_retries_a_failed_write_and_releases_waiters(no_retry_wait):
+    calls = []
+    jobs = reports.ReportJobs(':memory:', {}, on_done=flaky(1, calls))
+    waiting_job(jobs, 5)
+    jobs._record(5, 1, {'rows': 0}, None)
+
+    assert calls == [(5, 1, {'rows': 0}, None)] * 2
+    assert jobs.wait(5, 0)
+
+
+def test_record_reports_the_job_failed_when_the_write_never_succeeds(no_retry_wait):
+    calls = []
+    jobs = reports.ReportJobs(':memory:', {}, on_done=flaky(3, calls))
+    waiting_job(jobs, 5)
+    jobs._record(5, 1, {'rows': 0}, None)
+
+    assert len(calls) == 4
+    assert calls[-1][2] is None and isinstance(calls[-1][3], sqlite3.OperationalError)
+    assert jobs.stats()['record_errors'] == 1
+    assert jobs.wait(5, 0)
+
+
+def test_waiters_are_released_even_if_marking_failed_fails(no_retry_wait):
+    jobs = reports.ReportJobs(':memory:', {}, on_done=flaky(99, []))
+    waiting_job(jobs, 5)
+    jobs._record(5, 1, {'rows': 0}, None)
+
+    assert jobs.wait(5, 0)
+
+
+def test_export_is_recorded_after_a_locked_write(app_module, client, user, monkeypatch, no_retry_wait):
+    calls = []
+    fail_once = flaky(1, calls)
+
+    def on_done(*args):
+        fail_once(*args)
+        app_module.finish_export(*args)
+
+    monkeypatch.setattr(app_module.report_jobs, 'on_done', on_done)
+    client.post('/add', data={'title': 'Rent', 'amount': '500', 'category': 'Bills', 'date': '2026-04-01'})
+    with app_module.app.app_context():
+        job_id = app_module.submit_export(user, db.month_window('2026-04'), None)
+
+    assert wait_for(lambda: live_jobs(app_module, user) != [(job_id, 'pending')], timeout=60)
+    assert live_jobs(app_module, user) == [(job_id, 'ready')]
+    assert len(calls) == 2
@@ -0,0 +1,128 @@
+"""Expense import: amount parsing and sign conventions for CSV, JSON Lines and OFX"""
+import io
+
+import pytest
+
+import importer
+
+
+BANK_CSV = (
+    "Date,Description,Amount\n"
+    "2026-03-01,Coffee shop,-4.50\n"
+    "2026-03-02,Salary,2500.00\n"
+    "2026-03-03,Groceries,(38.20)\n"
+)
+
+
+def run_import(app_module, user, data, fmt, spend_sign=None):
+    with app_module.app.app_context():
+        report = app_module.import_expenses(user, io.BytesIO(data.encode()), fmt, spend_sign)
+        rows = app_module.get_db().execute(
+            "SELECT title, amount FROM expenses WHERE user_id=? ORDER BY id", (user,)).fetchall()
+    return report, rows
+
+
+@pytest.mark.parametrize('text, amount', [
+    ('12.50', 12.5), ('-12.50', -12.5), ('(12.50)', -12.5), ('1,234.56', 1234.56), ('1,23,456.78', 123456.78),
+    ('₹1,250', 1250.0), ('-$5', -5.0), ('12.50 INR', 12.5), ('Rs. 40', 40.0), ('.5', 0.5), (7, 7.0),
+])
+def test_parse_amount(text, amount):
+    assert importer.parse_amount(text) == amount
+
+
+@pytest.mark.parametrize('text', ['1.234,56', '12,50', '1.234', '1.234.567', '1,2345.00'])
+def test_parse_amount_rejects_ambiguous_separators(text):
+    with pytest.raises(importer.ImportRowError, match='Ambiguous'):
+        importer.parse_amount(text)
+
+
+@pytest.mark.parametrize('text', ['', 'abc', '(-5)', '--5', '12 34'])
+def test_parse_amount_rejects_garbage(text):
+    with pytest.raises(importer.ImportRowError, match='Invalid'):
+        importer.parse_amount(text)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl', 'ofx'])
+def test_normalize_uses_the_format_sign_convention(fmt):
+    spend, refund = ('12.50', '-12.50') if fmt != 'ofx' else ('-12.50', '12.50')
+    record = {'title': 'Lunch', 'date': '2026-03-01', 'category': 'Food'}
+
+    assert importer.normalize({**record, 'amount': spend}, fmt, lambda title: 'Other')[1] == 12.5
+    with pytest.raises(importer.SkipRow):
+        importer.normalize({**record, 'amount': refund}, fmt, lambda title: 'Other')
+    with pytest.raises(importer.ImportRowError):
+        importer.normalize({**record, 'amount': '0'}, fmt, lambda title: 'Other')
+
+
+def test_negative_csv_row_is_not_imported_as_an_expense(app_module, user):
+    report, rows = run_import(app_module, user, (
+        "date,title,amount,category\n"
+        "2026-03-01,Groceries,40.00,Food\n"
+        "2026-03-02,Groceries refund,-25.00,Food\n"
+    ), 'csv')
+
+    assert report['imported'] == 1
+    assert report['skipped'] == 1
+    assert report['error_count'] == 0
+    assert rows == [('Groceries', 40.0)]
+
+
+def test_negative_jsonl_row_is_not_imported_as_an_expense(app_module, user):
+    report, rows = run_import(app_module, user, (
+        '{"date": "2026-03-01", "title": "Taxi", "amount": 18}\n'
+        '{"date": "2026-03-02", "title": "Taxi refund", "amount": -18}\n'
+    ), 'jsonl')
+
+    assert (report['imported'], report['skipped']) == (1, 1)
+    assert rows == [('Taxi', 18.0)]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_normalize_honours_a_negative_spend_sign(fmt):
+    record = {'title': 'Coffee', 'date': '2026-03-01'}
+
+    assert importer.normalize({**record, 'amount': '-4.50'}, fmt, lambda title: 'Food', 'negative')[1] == 4.5
+    with pytest.raises(importer.SkipRow):
+        importer.normalize({**record, 'amount': '4.50'}, fmt, lambda title: 'Food', 'negative')
+
+
+def test_bank_csv_with_negative_debits_imports_the_purchases(app_module, user):
+    report, rows = run_import(app_module, user, BANK_CSV, 'csv', 'negative')
+
+    assert report['spend_sign'] == 'negative'
+    assert (report['imported'], report['skipped'], report['error_count']) == (2, 1, 0)
+    assert rows == [('Coffee shop', 4.5), ('Groceries', 38.2)]
+
+
+def test_ambiguous_amount_is_reported_not_imported(app_module, user):
+    report, rows = run_import(app_module, user, (
+        "date,title,amount\n"
+        "2026-03-01,Laptop,\"1.234,56\"\n"
+        "2026-03-02,Lunch,12.00\n"
+    ), 'csv')
+
+    assert report['imported'] == 1
+    assert report['errors'][0]['line'] == 2 and 'Ambiguous' in report['errors'][0]['error']
+    assert rows == [('Lunch', 12.0)]
+
+
+def test_import_endpoint_takes_a_spend_sign(client, user):
+    def upload(**extra):
+        return client.post('/api/import', data={'file': (io.BytesIO(BANK_CSV.encode()), 'bank.csv'), **extra},
+                           content_type='multipart/form-data')
+
+    assert upload(spend_sign='sideways').status_code == 400
+    response = upload(spend_sign='negative')
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 2
+
+
+def test_import_command_takes_a_spend_sign(app_module, client, user, tmp_path):
+    with app_module.app.app_context():
+        username = app_module.get_db().execute("SELECT username FROM users WHERE id=?", (user,)).fetchone()[0]
+    path = tmp_path / 'bank.csv'
+    path.write_text(BANK_CSV)
+
+    result = app_module.app.test_cli_runner().invoke(args=['import', username, str(path), '--spend-sign', 'negative'])
+    assert result.exit_code == 0, result.output
+    assert '2 of 3 rows imported' in result.output
@@ -0,0 +1,148 @@
+"""Mail queue delivery against a local debugging SMTP server"""
+import email
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost debugging SMTP server')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode().strip()[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(line.decode().split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in iter(self.rfile.readline, b''):
+                    if data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.gate.wait(5)
+                self.server.messages.append((recipients, email.message_from_bytes(b''.join(lines))))
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class DebuggingSMTPServer(socketserver.ThreadingTCPServer):
+    """Accepts every message and keeps it in memory; clear `gate` to hold replies to DATA (for up to 5s)"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+
+def point_mail_at(app_module, port):
+    """Send through 127.0.0.1:port without TLS or login; returns the settings to restore"""
+    state = app_module.app.extensions['mail']
+    saved = {name: getattr(state, name) for name in ('server', 'port', 'use_tls', 'use_ssl', 'username', 'suppress')}
+    state.server, state.port = '127.0.0.1', port
+    state.use_tls = state.use_ssl = state.suppress = False
+    state.username = None
+    return saved
+
+
+@pytest.fixture
+def smtp_server(app_module):
+    server = DebuggingSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = point_mail_at(app_module, server.server_address[1])
+    yield server
+    server.gate.set()
+    server.shutdown()
+    server.server_close()
+    for name, value in saved.items():
+        setattr(app_module.app.extensions['mail'], name, value)
+
+
+@pytest.fixture
+def smtp_down(app_module):
+    """A port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    saved = point_mail_at(app_module, port)
+    yield port
+    for name, value in saved.items():
+        setattr(app_module.app.extensions['mail'], name, value)
+
+
+def query(app_module, sql, params=()):
+    with app_module.app.app_context():
+        return app_module.get_db().execute(sql, params).fetchall()
+
+
+def test_queued_mail_is_delivered_and_logged(app_module, smtp_server):
+    with app_module.app.app_context():
+        ok, _ = app_module.send_email('delivered@example.com', 'Hello', '<p>Hi</p>', 'Hi', email_type='test')
+    assert ok
+
+    assert wait_for(lambda: smtp_server.messages)
+    recipients, message = smtp_server.messages[0]
+    assert recipients == ['delivered@example.com']
+    assert message['Subject'] == 'Hello'
+    assert wait_for(lambda: query(app_module, "SELECT status FROM email_logs WHERE subject='Hello'")) == [('sent',)]
+    assert query(app_module, "SELECT id FROM outbox WHERE recipient='delivered@example.com'") == []
+
+
+def test_send_email_does_not_wait_for_smtp(app_module, smtp_server):
+    smtp_server.gate.clear()
+    started = time.perf_counter()
+    with app_module.app.app_context():
+        ok, _ = app_module.send_email('slow@example.com', 'Slow server', '<p>Hi</p>', 'Hi')
+    elapsed = time.perf_counter() - started
+
+    assert ok
+    assert elapsed < 1.0
+    assert smtp_server.messages == []
+    smtp_server.gate.set()
+    assert wait_for(lambda: smtp_server.messages)
+
+
+def test_add_expense_responds_while_smtp_is_down(app_module, client, user, smtp_down):
+    client.post('/set-budget', data={'monthly_budget': '1000', 'daily_limit': '10'})
+
+    started = time.perf_counter()
+    response = client.post('/add', data={'title': 'Dinner', 'amount': '25', 'category': 'Food',
+                                         'date': time.strftime('%Y-%m-%d')})
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 302
+    assert 'Daily%20limit%20reached' in response.headers['Location']
+    assert elapsed < 1.0
+    # The failed delivery is left to the queue to retry, not raised into the request
+    failed = wait_for(lambda: query(app_module, """
+        SELECT attempts, last_error FROM outbox WHERE user_id=? AND status='pending' AND attempts > 0
+    """, (user,)))
+    assert failed and failed[0][0] == 1 and failed[0][1]
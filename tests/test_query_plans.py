@@ -0,0 +1,154 @@
+"""EXPLAIN QUERY PLAN checks for the expense hot paths.
+
+Each hot path runs through the app's own code (view helpers, routes via the
+test client, the alert and mail jobs) while the statements it issues are
+recorded; every SELECT/UPDATE/DELETE it ran must search an index instead of
+falling back to a full SCAN (SQLite traces statements with their parameters
+inlined). Queries the app builds with a helper (reports.expense_query,
+dataexport.export_query) are explained from that helper. The half-open
+date windows that replaced LIKE 'YYYY-MM%' and BETWEEN filters must select
+the same rows as the filters they replaced, through an index.
+"""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import dataexport
+import db
+import importer
+import reports
+
+TODAY = date(2024, 3, 15)
+CHECKED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# name -> action(app_module, user_id, client, conn); runs on the traced connection
+HOT_PATHS = {
+    'dashboard': lambda m, user, client, conn: m.load_dashboard(user, TODAY),
+    'expense page (keyset)': lambda m, user, client, conn: m.fetch_expense_page(
+        user, m.encode_cursor('2024-03-15', 500), window=db.month_window(TODAY)),
+    'expense search': lambda m, user, client, conn: m.fetch_expense_page(
+        user, category='Food', q='Lun', window=db.month_window(TODAY)),
+    'calendar': lambda m, user, client, conn: client.get('/calendar'),
+    'chart': lambda m, user, client, conn: m.chart_payload(user, TODAY - timedelta(days=29), TODAY, None, 6, TODAY),
+    'insights': lambda m, user, client, conn: m.insights_payload(user),
+    'latest expense': lambda m, user, client, conn: client.get('/api/latest-expense'),
+    'budget alerts': lambda m, user, client, conn: m.budget_alert_candidates(conn.cursor(), '2024-03'),
+    'summary chunk': lambda m, user, client, conn: next(
+        m.build_summaries('send_daily_summary', db.week_window(TODAY)), None),
+    'mail outbox claim': lambda m, user, client, conn: m.mail_queue.claim(conn, 200),
+    'export job lookup': lambda m, user, client, conn: m.submit_export(user, db.month_window(TODAY), None),
+    'import checks': lambda m, user, client, conn: importer.ImportChecks(conn, user).load_window(
+        '2024-03-01', '2024-03-31'),
+    'add expense': lambda m, user, client, conn: client.post('/add', data={
+        'title': 'Lunch', 'amount': '12.5', 'category': 'Food', 'date': TODAY.isoformat()}),
+}
+
+# name -> (sql, params) of a query built by a helper
+BUILT_QUERIES = {
+    'export pdf rows': lambda user: reports.expense_query(user, db.month_window('2024-03')),
+    'export pdf rows (range, category)': lambda user: reports.expense_query(
+        user, db.range_window('2023-01-01', '2024-12-31'), 'Food'),
+    'data export rows': lambda user: dataexport.export_query(user)[:2],
+    'data export rows (range, category)': lambda user: dataexport.export_query(
+        user, db.range_window('2023-01-01', '2024-12-31'), 'Food')[:2],
+}
+
+
+@pytest.fixture(scope='module')
+def seeded(app_module):
+    """Three users with expenses spread over two years (including month-boundary dates); returns their ids"""
+    rng = random.Random(42)
+    start = date(2023, 1, 1)
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        users = []
+        for n in range(3):
+            cursor = conn.execute("""
+                INSERT INTO users (username, password, email, monthly_budget, send_daily_summary, send_limit_alert)
+                VALUES (?, 'x', ?, 1000, 1, 1)
+            """, (f"plans{n}", f"plans{n}@example.com"))
+            users.append(cursor.lastrowid)
+        rows = []
+        for _ in range(2000):
+            day = start + timedelta(days=rng.randrange(730))
+            rows.append((rng.choice(users), 'Lunch', round(rng.uniform(1, 500), 2),
+                         rng.choice(['Food', 'Bills', 'Other']), day.isoformat(),
+                         day.isoformat() + 'T12:00:00', int(rng.random() < 0.1)))
+        conn.executemany("""
+            INSERT INTO expenses (user_id, title, amount, category, date, created_at, is_duplicate_flagged)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        app_module.rebuild_rollups()
+    return users
+
+
+def assert_searches(conn, sql, params=()):
+    plan = db.explain(conn, sql, params)
+    assert not db.full_scans(plan), f"{' '.join(sql.split())}\n  plan: {' | '.join(plan)}"
+
+
+@pytest.mark.parametrize('name', HOT_PATHS)
+def test_hot_path_uses_indexes(app_module, client, seeded, monkeypatch, name):
+    # Report renders would only add noise; the job lookup is what's checked
+    monkeypatch.setattr(app_module, 'queue_export', lambda *args: None)
+    # Page templates don't matter here; a route's queries have run before it renders
+    monkeypatch.setattr(app_module.app.logger, 'disabled', True)
+    user = seeded[0]
+    with client.session_transaction() as session:
+        session['user_id'] = user
+
+    # Requests reuse this app context, so they run on the same (traced) connection
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        with db.count_queries(conn, record=True) as queries:
+            HOT_PATHS[name](app_module, user, client, conn)
+        statements = [sql for sql in queries.statements if sql.lstrip().split(None, 1)[0].upper() in CHECKED]
+        assert statements, "no queries recorded"
+        for sql in statements:
+            assert_searches(conn, sql)
+
+
+@pytest.mark.parametrize('name', BUILT_QUERIES)
+def test_built_query_uses_indexes(app_module, seeded, name):
+    with app_module.app.app_context():
+        assert_searches(app_module.get_db(), *BUILT_QUERIES[name](seeded[0]))
+
+
+MONTHS = [f"{year}-{month:02d}" for year in (2023, 2024) for month in range(1, 13)]
+
+
+def window_totals(conn, user, window):
+    window_sql, window_params = db.date_clause(window)
+    sql = f"SELECT COUNT(*), SUM(amount) FROM expenses WHERE user_id=? AND {window_sql}"
+    assert_searches(conn, sql, (user, *window_params))
+    return conn.execute(sql, (user, *window_params)).fetchone()
+
+
+@pytest.mark.parametrize('month', MONTHS)
+def test_month_window_matches_like_filter(app_module, seeded, month):
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        like = conn.execute("SELECT COUNT(*), SUM(amount) FROM expenses WHERE user_id=? AND date LIKE ?",
+                            (seeded[0], f"{month}%")).fetchone()
+        assert like[0]
+        assert window_totals(conn, seeded[0], db.month_window(month)) == like
+
+
+@pytest.mark.parametrize('start, end', [('2023-01-01', '2023-01-31'), ('2023-02-28', '2023-03-01'),
+                                        ('2023-12-31', '2024-01-01'), ('2024-02-29', '2024-02-29')])
+def test_range_window_matches_between_filter(app_module, seeded, start, end):
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        between = conn.execute("SELECT COUNT(*), SUM(amount) FROM expenses WHERE user_id=? AND date BETWEEN ? AND ?",
+                               (seeded[0], start, end)).fetchone()
+        assert window_totals(conn, seeded[0], db.range_window(start, end)) == between
+
+
+def test_week_window_covers_the_days_ending_on_a_day(app_module, seeded):
+    with app_module.app.app_context():
+        conn = app_module.get_db()
+        between = conn.execute("SELECT COUNT(*), SUM(amount) FROM expenses WHERE user_id=? AND date BETWEEN ? AND ?",
+                               (seeded[0], '2024-02-26', '2024-03-03')).fetchone()
+        assert window_totals(conn, seeded[0], db.week_window('2024-03-03')) == between
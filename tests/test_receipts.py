@@ -0,0 +1,69 @@
+"""Receipt jobs: recording the outcome survives a failing write"""
+import io
+import sqlite3
+
+import pytest
+from PIL import Image
+
+import receipts
+from conftest import wait_for
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(receipts, 'RECORD_RETRY_DELAYS', (0, 0))
+
+
+def flaky(failures, calls):
+    """on_done that raises 'database is locked' for its first `failures` calls"""
+    def on_done(*args):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise sqlite3.OperationalError("database is locked")
+    return on_done
+
+
+def test_record_retries_a_failed_write():
+    calls = []
+    processor = receipts.ReceiptProcessor(on_done=flaky(2, calls))
+    processor._record(7, 1, {'sha256': 'abc'}, None)
+
+    assert calls == [(7, 1, {'sha256': 'abc'}, None)] * 3
+    assert processor.stats()['record_errors'] == 0
+
+
+def test_record_reports_the_job_failed_when_the_write_never_succeeds():
+    calls = []
+    processor = receipts.ReceiptProcessor(on_done=flaky(3, calls))
+    processor._record(7, 1, {'sha256': 'abc'}, None)
+
+    assert len(calls) == 4
+    expense_id, user_id, result, error = calls[-1]
+    assert (expense_id, user_id, result) == (7, 1, None)
+    assert isinstance(error, sqlite3.OperationalError)
+    assert processor.stats()['record_errors'] == 1
+
+
+def test_uploaded_receipt_is_recorded_after_a_locked_write(app_module, client, user, monkeypatch):
+    calls = []
+    fail_once = flaky(1, calls)
+
+    def on_done(*args):
+        fail_once(*args)
+        app_module.finish_receipt(*args)
+
+    monkeypatch.setattr(app_module.receipt_processor, 'on_done', on_done)
+    image = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(image, 'JPEG')
+    image.seek(0)
+    client.post('/add', data={'title': 'Bill', 'amount': '5', 'category': 'Bills', 'date': '2026-03-01',
+                              'receipt': (image, 'bill.jpg')}, content_type='multipart/form-data')
+
+    def status():
+        with app_module.app.app_context():
+            return app_module.get_db().execute(
+                "SELECT receipt_status, receipt_file FROM expenses WHERE user_id=?", (user,)).fetchone()
+
+    assert wait_for(lambda: status()[0] != 'pending', timeout=30)
+    assert status()[0] == 'ready' and status()[1]
+    assert len(calls) == 2